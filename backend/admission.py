@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+import uuid
+
+# Peak RSS of the pool worker analyzing one field, fitted with some headroom on
+# ND2 files written by synthetic.write_nd2 (1-4k px, 2-4 channels, 3-5
+# z-levels). Projection streams over z, so z-levels don't add to the peak.
+WORKING_SET_BYTES_PER_PIXEL = 28  # smoothed image, masks, labels and measurement gathers
+DAPI_SUM_BYTES_PER_PIXEL = 4  # the float32 DAPI sum projection DNA content is measured on
+WORKING_SET_BYTES_PER_CHANNEL_PIXEL = 4  # per channel, on top of its projection at the frame itemsize
+WORKING_SET_OVERHEAD_BYTES = 160 * 1024 * 1024  # the worker process itself, with the pipeline's libraries loaded
+DEFAULT_BUDGET_FRACTION = 0.75  # of the container's memory, leaving room for the web process itself
+CGROUP_MEMORY_LIMITS = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+
+# ✅ Working-Set Estimates
+def estimate_working_set(sizes, itemsize, parallel_fields=1):
+    """Bytes an analysis needs at its peak, from ND2 header sizes and the frame dtype's itemsize.
+
+    Only x, y and c enter: frames are folded into the projections one at a
+    time. Multi-field files analyze up to `parallel_fields` fields at once.
+    """
+    pixels = sizes.get('x', 0) * sizes.get('y', 0)
+    channels = max(1, sizes.get('c', 1))
+    per_field = (
+        pixels * (WORKING_SET_BYTES_PER_PIXEL + DAPI_SUM_BYTES_PER_PIXEL
+                  + channels * (itemsize + WORKING_SET_BYTES_PER_CHANNEL_PIXEL))
+        + WORKING_SET_OVERHEAD_BYTES
+    )
+    return per_field * max(1, parallel_fields)
+
+
+def default_memory_budget(workers=1, fraction=DEFAULT_BUDGET_FRACTION):
+    """A share of the container's memory limit (or of physical memory) for each web worker."""
+    total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    for path in CGROUP_MEMORY_LIMITS:
+        try:
+            with open(path) as f:
+                limit = f.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit():
+            total = min(total, int(limit))
+        break
+    return int(total * fraction / max(1, workers))
+
+
+# ✅ Admission Controller
+class OverCapacity(Exception):
+    """Raised when an analysis can't be admitted; `retry_after` is None if it never will be."""
+
+    def __init__(self, message, status_code=503, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Admit analyses against a memory budget and a concurrency limit.
+
+    Each admitted analysis reserves its estimated working set (and one or
+    more slots) until it is released, normally when its job finishes, so
+    queued work counts too. A request that would go over either limit is
+    refused straight away, rather than queued into an out-of-memory crash.
+    State is per process: every web worker gets its own budget.
+    """
+
+    def __init__(self, budget_bytes, max_concurrent, retry_after=30):
+        self.budget_bytes = budget_bytes
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self._reservations = {}
+        self._lock = threading.Lock()
+
+    def admit(self, estimate_bytes, slots=1):
+        """Reserve capacity for an analysis and return the reservation id, or raise OverCapacity."""
+        if estimate_bytes > self.budget_bytes:
+            raise OverCapacity(
+                f"Analysis needs about {estimate_bytes / 1e6:.0f} MB, more than the "
+                f"{self.budget_bytes / 1e6:.0f} MB memory budget", status_code=413)
+
+        with self._lock:
+            reserved_bytes, used_slots = self._totals()
+            if used_slots + slots > self.max_concurrent or reserved_bytes + estimate_bytes > self.budget_bytes:
+                logging.warning(
+                    f"Admission refused: {estimate_bytes / 1e6:.0f} MB requested, "
+                    f"{reserved_bytes / 1e6:.0f}/{self.budget_bytes / 1e6:.0f} MB and "
+                    f"{used_slots}/{self.max_concurrent} slots in use")
+                raise OverCapacity("Server is at capacity, please retry shortly", retry_after=self.retry_after)
+            reservation = uuid.uuid4().hex
+            self._reservations[reservation] = (estimate_bytes, slots)
+        logging.info(f"Admitted analysis {reservation} ({estimate_bytes / 1e6:.0f} MB, {slots} slot(s))")
+        return reservation
+
+    def release(self, reservation):
+        """Return a reservation's capacity; releasing twice is harmless."""
+        with self._lock:
+            self._reservations.pop(reservation, None)
+
+    def _totals(self):
+        reserved_bytes = sum(estimate for estimate, _ in self._reservations.values())
+        used_slots = sum(slots for _, slots in self._reservations.values())
+        return reserved_bytes, used_slots
+
+    def snapshot(self):
+        """Current reservations against the limits, for /metrics."""
+        with self._lock:
+            reserved_bytes, used_slots = self._totals()
+            return {
+                'budget_bytes': self.budget_bytes,
+                'reserved_bytes': reserved_bytes,
+                'max_concurrent': self.max_concurrent,
+                'admitted': used_slots,
+            }
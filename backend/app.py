@@ -1,26 +1,44 @@
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend for Heroku
-import matplotlib.pyplot as plt
-from flask import Flask, request, jsonify, send_file, send_from_directory, abort
+import time
+_import_started = time.perf_counter()
+from flask import Flask, Response, request, jsonify, send_from_directory, abort
 from flask_cors import CORS
 import os
+import hashlib
+import math
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 import numpy as np
-from nd2reader import ND2Reader
-from skimage.filters import gaussian
-from skimage.morphology import remove_small_objects, binary_closing, disk, binary_opening
-from skimage.measure import label, regionprops
-from scipy import ndimage as ndi
-import pandas as pd
 import logging
 from datetime import datetime
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from jobs import JobManager, DONE, FAILED
+from uploads import UploadManager, UploadError, copy_stream
+from projection import project_channels, PROJECTIONS
+from cache import ResultCache
+from measurements import filter_labels_by_size, measure_regions
+from tiling import run_tiled, tiled_percentile
+import fast_segmentation
+from batches import BatchManager
+from metrics import PipelineMetrics, profiling, stage, annotate, merge_profile
+from rendering import write_pyramid, render_overlay, display_range, channel_colors
+from exports import MeasurementWriter, ArrayArchive, field_array_name, rewrite_measurements
+from downloads import stream_file
+from admission import AdmissionController, OverCapacity, estimate_working_set, default_memory_budget
+from synthetic import synthetic_stack, SyntheticND2Reader
+from nd2frames import map_frames, frame_itemsize
+from phases import phase_features, fit_population, classify, phase_counts
+from storage import StorageManager, FileArea, DirectoryArea, shard, shard_path
 
 # ✅ Logging Configuration
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('app.log'),
+        logging.FileHandler('app.log', delay=True),  # only opened once something is logged
         logging.StreamHandler()
     ]
 )
@@ -34,19 +52,103 @@ UPLOAD_FOLDER = './static/uploads'
 RESULTS_FOLDER = './static/results'
 MAX_FILE_SIZE = 1000 * 1024 * 1024  # 1000MB limit
 ALLOWED_EXTENSIONS = {'.nd2'}
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 2))
+CACHE_FOLDER = os.path.join(RESULTS_FOLDER, 'cache')
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 5 * 1024 * 1024 * 1024))  # 5GB default
+SEGMENTATION_TILE_SIZE = int(os.environ.get('SEGMENTATION_TILE_SIZE', 2048))
+TILED_SEGMENTATION_MIN_PIXELS = int(os.environ.get('TILED_SEGMENTATION_MIN_PIXELS', 4096 * 4096))
+SEGMENTATION_THREADS = int(os.environ.get('SEGMENTATION_THREADS', os.cpu_count() or 1))
+FIELD_WORKERS = int(os.environ.get('FIELD_WORKERS', os.cpu_count() or 1))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', ANALYSIS_WORKERS))
+MAX_BATCH_FILES = int(os.environ.get('MAX_BATCH_FILES', 500))
+BATCH_FOLDER = os.path.join(RESULTS_FOLDER, 'batches')
+MAX_CONCURRENT_ANALYSES = int(os.environ.get('MAX_CONCURRENT_ANALYSES', 2 * ANALYSIS_WORKERS))  # queued or running
+ANALYSIS_MEMORY_BUDGET = int(os.environ.get('ANALYSIS_MEMORY_BUDGET', 0)) or default_memory_budget()
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 30))  # seconds, sent as Retry-After on 503
+PREVIEW_MAX_SIZE = int(os.environ.get('PREVIEW_MAX_SIZE', 1024))  # longer side of the binned preview image
+PREVIEW_Z_PLANES = int(os.environ.get('PREVIEW_Z_PLANES', 5))  # at most this many z-planes are read for a preview
+OVERLAY_TILE_FORMAT = os.environ.get('OVERLAY_TILE_FORMAT', 'jpeg')  # 'jpeg' or 'png' pyramid tiles
+STORAGE_MAX_BYTES = int(os.environ.get('STORAGE_MAX_BYTES', 10 * 1024 * 1024 * 1024))  # uploads, cache and batches together
+STORAGE_MIN_AGE = int(os.environ.get('STORAGE_MIN_AGE', 3600))  # seconds since last use before anything is evicted
+STORAGE_SWEEP_INTERVAL = int(os.environ.get('STORAGE_SWEEP_INTERVAL', 60))
+KEEP_UPLOADS = os.environ.get('KEEP_UPLOADS', '0') == '1'  # keep raw ND2 files after their analysis is cached
+MEMMAP_ND2 = os.environ.get('MEMMAP_ND2', '1') != '0'  # read uncompressed ND2 frames straight from a memory map
+PIPELINE_VERSION = 12  # bump when measurement output changes so stale cache entries are skipped
+PROJECTION_VERSION = 3  # bump when the arrays cached per projection change
+SEGMENTATION_ENGINES = ('standard', 'fast')
+SEGMENTATION_DEFAULTS = {
+    'engine': os.environ.get('SEGMENTATION_ENGINE', 'standard'),
+    'sigma': 2,
+    'threshold_fraction': 0.5,
+    'closing_radius': 3,
+    'opening_radius': 2,
+    'min_size': 50,
+}
 
-# ✅ Create necessary folders
-def setup_folders():
-    """Create folders and clean old files (> 24 hours)."""
-    for folder in [UPLOAD_FOLDER, RESULTS_FOLDER, app.static_folder]:
-        os.makedirs(folder, exist_ok=True)
-        for filename in os.listdir(folder):
-            filepath = os.path.join(folder, filename)
-            if os.path.isfile(filepath) and os.path.getmtime(filepath) < datetime.now().timestamp() - 86400:
-                try:
-                    os.remove(filepath)
-                except Exception as e:
-                    logging.warning(f"Could not remove old file {filepath}: {e}")
+# ✅ Pipeline Metrics
+pipeline_metrics = PipelineMetrics()
+
+def record_job_metrics(job_id):
+    """Fold a finished job's stage profile into the /metrics histograms."""
+    job = jobs.get(job_id)
+    if job['status'] == FAILED:
+        pipeline_metrics.record_outcome('failed')
+        return
+    result = jobs.result(job_id) or {}
+    if result.get('cached') or 'profile' not in result:
+        pipeline_metrics.record_outcome('cached')
+    else:
+        pipeline_metrics.record_profile(result['profile'])
+
+# ✅ Background Analysis Jobs
+# Job records are held in this process, so the app is served by a single
+# (threaded) web worker; see gunicorn.conf.py.
+jobs = JobManager(max_workers=ANALYSIS_WORKERS, on_finish=record_job_metrics)
+
+# ✅ Admission Control
+admission = AdmissionController(ANALYSIS_MEMORY_BUDGET, MAX_CONCURRENT_ANALYSES, ADMISSION_RETRY_AFTER)
+pipeline_metrics.add_gauge('admission_budget_bytes', 'Memory budget for admitted analyses',
+                           lambda: admission.snapshot()['budget_bytes'])
+pipeline_metrics.add_gauge('admission_reserved_bytes', 'Estimated working set of admitted analyses',
+                           lambda: admission.snapshot()['reserved_bytes'])
+pipeline_metrics.add_gauge('admission_slots_max', 'Concurrent analyses allowed',
+                           lambda: admission.snapshot()['max_concurrent'])
+pipeline_metrics.add_gauge('admission_slots_used', 'Admitted analyses, queued or running',
+                           lambda: admission.snapshot()['admitted'])
+
+# ✅ Resumable Chunked Uploads
+uploads = UploadManager(UPLOAD_FOLDER, MAX_FILE_SIZE, ALLOWED_EXTENSIONS)
+
+# ✅ Result Cache
+cache = ResultCache(CACHE_FOLDER, CACHE_MAX_BYTES)
+
+# ✅ Batch Analyses
+# Batch records are held in this process too; see gunicorn.conf.py.
+batches = BatchManager(
+    jobs,
+    BATCH_FOLDER,
+    '/static/results/batches',
+    lambda result: cache.path(result['analysis_id'], 'measurements.csv'),
+)
+
+# ✅ Disk Budget
+storage = StorageManager(STORAGE_MAX_BYTES, STORAGE_MIN_AGE, STORAGE_SWEEP_INTERVAL,
+                         lock_path=os.path.join(RESULTS_FOLDER, '.storage.lock'))
+storage.add_area('uploads', FileArea(UPLOAD_FOLDER, exclude=uploads.incomplete_paths))
+storage.add_area('results', cache)
+storage.add_area('batches', DirectoryArea(BATCH_FOLDER))
+pipeline_metrics.add_gauge('storage_budget_bytes', 'Disk budget for uploads, results and batches',
+                           lambda: storage.max_bytes)
+for area_name in storage.areas:
+    pipeline_metrics.add_gauge(f'storage_{area_name}_bytes', f'Disk used by {area_name} at the last sweep',
+                               lambda area_name=area_name: storage.usage()[area_name])
+pipeline_metrics.add_gauge('storage_evicted_bytes', 'Bytes evicted by this worker since it started',
+                           lambda: storage.evicted_bytes)
+
+@app.before_request
+def start_storage_sweeper():
+    """Create the storage folders and start the eviction thread in this worker process."""
+    storage.ensure_running()
 
 # ✅ Serve React Frontend
 @app.route('/', defaults={'path': ''})
@@ -63,132 +165,1223 @@ def serve_frontend(path):
 # ✅ Serve Static Files
 @app.route('/static/<path:filename>')
 def serve_static(filename):
-    """Serve static files with error handling."""
-    file_path = os.path.join('static', filename)
-    if not os.path.exists(file_path):
+    """Stream static files, with byte-range support for resuming large result downloads."""
+    file_path = safe_join('static', filename)
+    if file_path is None or not os.path.isfile(file_path):
         abort(404)
-    return send_file(file_path)
+    storage.touch(file_path)
+    return stream_file(file_path)
 
 # ✅ Image Segmentation Function
-def segment_nuclei(image):
-    """Segment nuclei using a refined method similar to Fiji/ImageJ."""
-    try:
+def smooth_nuclei(image, sigma=2, engine='standard'):
+    """Normalize the DAPI projection and gaussian-smooth it (the expensive, sigma-only stage)."""
+    with stage('gaussian'):
+        if engine == 'fast':
+            return fast_segmentation.smooth(image, sigma)
+        from skimage.filters import gaussian
         image_norm = (image - image.min()) / (image.max() - image.min())
-        smoothed = gaussian(image_norm, sigma=2)
-        p90 = np.percentile(smoothed, 90)
-        binary = smoothed > (p90 * 0.5)
-        binary = binary_closing(binary, disk(3))
-        binary = binary_opening(binary, disk(2))
-        binary = ndi.binary_fill_holes(binary)
-        cleaned = remove_small_objects(binary, min_size=50)
-        return cleaned
+        return gaussian(image_norm, sigma=sigma)
+
+def clean_mask_local(binary, closing_radius=3, opening_radius=2, engine='standard'):
+    """Morphological closing then opening; only looks 2*(closing+opening) pixels away."""
+    if engine == 'fast':
+        return fast_segmentation.close_open(binary, closing_radius, opening_radius)
+    from skimage.morphology import binary_closing, binary_opening, disk
+    binary = binary_closing(binary, disk(closing_radius))
+    return binary_opening(binary, disk(opening_radius))
+
+def clean_mask_global(binary, min_size=50, engine='standard'):
+    """Fill holes and drop small objects; these depend on whole connected components."""
+    if engine == 'fast':
+        return fast_segmentation.fill_and_filter(binary, min_size)
+    from scipy import ndimage as ndi
+    from skimage.morphology import remove_small_objects
+    binary = ndi.binary_fill_holes(binary)
+    try:
+        # skimage >= 0.26 treats even `min_size` as inclusive; objects of exactly min_size pixels are kept
+        return remove_small_objects(binary, max_size=min_size - 1)
+    except TypeError:
+        return remove_small_objects(binary, min_size=min_size)
+
+def threshold_nuclei(smoothed, threshold_fraction=0.5, closing_radius=3, opening_radius=2, min_size=50,
+                     tile_size=None, engine='standard'):
+    """Threshold a smoothed image and clean the mask with morphology."""
+    with stage('threshold_morphology'):
+        if tile_size:
+            return threshold_nuclei_tiled(
+                smoothed, threshold_fraction, closing_radius, opening_radius, min_size, tile_size, engine)
+        if engine == 'fast':
+            p90 = fast_segmentation.percentile(smoothed, 90)
+        else:
+            p90 = np.percentile(smoothed, 90)
+        binary = smoothed > (p90 * threshold_fraction)
+        binary = clean_mask_local(binary, closing_radius, opening_radius, engine)
+        return clean_mask_global(binary, min_size, engine)
+
+def segment_nuclei(image, sigma=2, threshold_fraction=0.5, closing_radius=3, opening_radius=2, min_size=50,
+                   tile_size=None, engine='standard'):
+    """Segment nuclei using a refined method similar to Fiji/ImageJ.
+
+    `engine='fast'` runs the float32 engine in fast_segmentation: separable
+    gaussian, decomposed disk morphology and label-based hole filling. Its
+    masks match the standard engine's up to float32 rounding at the threshold.
+    """
+    try:
+        if tile_size:
+            with tempfile.TemporaryDirectory() as scratch:
+                smoothed = np.lib.format.open_memmap(
+                    os.path.join(scratch, 'smoothed.npy'), mode='w+', dtype=smoothed_dtype(engine), shape=image.shape)
+                smooth_nuclei_tiled(image, sigma, smoothed, tile_size, engine)
+                return threshold_nuclei(
+                    smoothed, threshold_fraction, closing_radius, opening_radius, min_size, tile_size, engine)
+        smoothed = smooth_nuclei(image, sigma, engine)
+        return threshold_nuclei(smoothed, threshold_fraction, closing_radius, opening_radius, min_size, engine=engine)
     except Exception as e:
         logging.error(f"Segmentation error: {str(e)}")
         raise
 
+# ✅ Tiled Segmentation
+def smoothed_dtype(engine):
+    """dtype of the smoothed DAPI image each engine produces."""
+    return np.float32 if engine == 'fast' else np.float64
+
+def segmentation_tile_size(image):
+    """Tile size to segment `image` with, or None when it is small enough to do whole."""
+    return SEGMENTATION_TILE_SIZE if image.size >= TILED_SEGMENTATION_MIN_PIXELS else None
+
+def smooth_nuclei_tiled(image, sigma, out, tile_size, engine='standard'):
+    """smooth_nuclei computed tile by tile into `out` (typically a memory-mapped .npy).
+
+    Normalization uses the global min/max, and each tile carries a halo as
+    wide as the gaussian kernel (truncate=4), so the result is identical to
+    the whole-image path while only a few tiles of float64 are live at once.
+    """
+    with stage('gaussian'):
+        lo, hi = image.min(), image.max()
+        halo = int(4 * sigma + 0.5) + 1
+        if engine == 'fast':
+            smooth_tile = lambda tile: fast_segmentation.smooth(tile, sigma, lo, hi)
+        else:
+            from skimage.filters import gaussian
+            smooth_tile = lambda tile: gaussian((tile - lo) / (hi - lo), sigma=sigma)
+        return run_tiled(smooth_tile, image, out, tile_size, halo, SEGMENTATION_THREADS)
+
+def threshold_nuclei_tiled(smoothed, threshold_fraction, closing_radius, opening_radius, min_size, tile_size,
+                           engine='standard'):
+    """threshold_nuclei on tiles: exact global p90, haloed local morphology, global cleanup.
+
+    The percentile is selected with a bounded-memory histogram pass, closing and
+    opening run per tile with a halo covering their reach, and the stitched
+    1-byte mask gets hole filling and small-object removal as a whole. The
+    final labeling of that mask merges nuclei cut by tile seams into one.
+
+    Tiling bounds the float working set of smoothing and thresholding only.
+    Hole filling, small-object removal, the int32 label image and the
+    measurements still cover the whole scan.
+    """
+    p90 = tiled_percentile(smoothed, 90, tile_size)
+    cutoff = p90 * threshold_fraction
+    binary = np.zeros(smoothed.shape, dtype=bool)
+    halo = 2 * (closing_radius + opening_radius) + 1
+    run_tiled(
+        lambda tile: clean_mask_local(tile > cutoff, closing_radius, opening_radius, engine),
+        smoothed, binary, tile_size, halo, SEGMENTATION_THREADS,
+    )
+    return clean_mask_global(binary, min_size, engine)
+
+def parse_seg_params(overrides, base=None):
+    """Merge user-supplied segmentation parameters over `base`, validating each value."""
+    params = {**SEGMENTATION_DEFAULTS, **(base or {})}
+    for name, value in (overrides or {}).items():
+        if name not in SEGMENTATION_DEFAULTS:
+            raise ValueError(f"Unknown segmentation parameter '{name}'")
+        if name == 'engine':
+            if value not in SEGMENTATION_ENGINES:
+                raise ValueError(f"Unknown segmentation engine '{value}', expected one of {list(SEGMENTATION_ENGINES)}")
+            params[name] = value
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Segmentation parameter '{name}' must be a number")
+        if name in ('closing_radius', 'opening_radius', 'min_size'):
+            if value != int(value) or value < 0:
+                raise ValueError(f"Segmentation parameter '{name}' must be a non-negative integer")
+            value = int(value)
+        elif value <= 0:
+            raise ValueError(f"Segmentation parameter '{name}' must be positive")
+        params[name] = value
+    return params
+
 # ✅ Particle Analysis
 def analyze_particles(binary_mask, min_size=50):
     """Analyze and label particles."""
     try:
-        labeled = label(binary_mask)
-        props = regionprops(labeled)
-        new_labeled = np.zeros_like(labeled)
-        for i, region in enumerate(props, 1):
-            if region.area >= min_size:
-                new_labeled[labeled == region.label] = i
-        return new_labeled
+        with stage('analyze_particles'):
+            from scipy import ndimage as ndi
+            # 8-connected like skimage's label, with the same ids, but always int32
+            labeled, _ = ndi.label(binary_mask, structure=np.ones((3, 3), dtype=bool), output=np.int32)
+            return filter_labels_by_size(labeled, min_size)
     except Exception as e:
         logging.error(f"Particle analysis error: {str(e)}")
         raise
 
 # ✅ ND2 Image Processing
-def analyze_channels(file_path):
+def ND2Reader(file_path):
+    """Open an ND2 file; nd2reader (and pims behind it) is only imported on first use.
+
+    Frames of uncompressed files are memory-mapped views (see nd2frames);
+    anything else is decoded by nd2reader.
+    """
+    from nd2reader import ND2Reader as Reader
+    images = Reader(file_path)
+    return map_frames(images, file_path) if MEMMAP_ND2 else images
+
+def nd2_channels(images):
+    """Channel names of an open ND2 file, with the nuclear channel named DAPI."""
+    channels = images.metadata.get('channels', [])
+
+    if not channels:
+        channels = [f'Channel_{i}' for i in range(images.sizes.get('c', 1))]
+
+    if 'DAPI' not in channels:
+        channels[0] = 'DAPI'
+
+    return channels
+
+def read_fields(file_path):
+    """Every (position, timepoint) pair in an ND2 file."""
+    with ND2Reader(file_path) as images:
+        return [
+            (v, t)
+            for v in range(images.sizes.get('v', 1))
+            for t in range(images.sizes.get('t', 1))
+        ]
+
+def read_channels(file_path, projection='max', v=0, t=0):
+    """Read one field of an ND2 file and z-project every channel.
+
+    Returns (channel names, projections, DAPI sum projection). The sum, which
+    DNA content is measured on whatever the display projection, is reduced
+    in the same pass over the file.
+    """
+    try:
+        with stage('nd2_open'):
+            images = ND2Reader(file_path)
+        with images:
+            channels = nd2_channels(images)
+            z_levels = images.sizes.get('z', 1)
+            annotate(width=images.sizes.get('x', 0), height=images.sizes.get('y', 0),
+                     z_levels=z_levels, channels=len(channels))
+            dapi_idx = channels.index('DAPI') if 'DAPI' in channels else None
+            extra = {dapi_idx: 'sum'} if dapi_idx is not None and projection != 'sum' else None
+            with stage('nd2_decode'):
+                projections = project_channels(images, len(channels), z_levels, method=projection, v=v, t=t,
+                                               extra=extra)
+        if extra:
+            return channels, projections[:-1], projections[-1]
+        return channels, projections, None if dapi_idx is None else projections[dapi_idx]
+    except Exception as e:
+        logging.error(f"ND2 read error: {str(e)}")
+        raise
+
+def build_channel_data(channels, projections, seg_params, smoothed=None, dapi_sum=None):
+    """Segment nuclei on the DAPI projection and collect what measure_nuclei needs per channel.
+
+    Passing the already smoothed DAPI image skips straight to thresholding.
+    `dapi_sum` is the DAPI sum projection DNA content is measured on; without
+    it the DAPI projection itself is used. Only DAPI is normalized, and only
+    its 2-98 percentile range is kept: measure_nuclei rescales the nuclear
+    pixels it gathers, so no normalized copy of any channel is made.
+    """
+    dapi_idx = channels.index('DAPI')
+    tile_size = segmentation_tile_size(projections[dapi_idx])
+    if smoothed is None:
+        nuclear_mask = segment_nuclei(projections[dapi_idx], **seg_params, tile_size=tile_size)
+    else:
+        nuclear_mask = threshold_nuclei(
+            smoothed,
+            seg_params['threshold_fraction'],
+            seg_params['closing_radius'],
+            seg_params['opening_radius'],
+            seg_params['min_size'],
+            tile_size,
+            seg_params['engine'],
+        )
+    nuclear_labeled = analyze_particles(nuclear_mask, min_size=seg_params['min_size'])
+
+    with stage('normalize'):
+        dapi = projections[dapi_idx]
+        if tile_size:
+            p2, p98 = (tiled_percentile(dapi, q, tile_size) for q in (2, 98))
+        else:
+            p2, p98 = np.percentile(dapi, (2, 98))
+
+    channel_data = {
+        channel: {'raw': projected, 'mask': nuclear_mask, 'labeled': nuclear_labeled}
+        for channel, projected in zip(channels, projections)
+    }
+    channel_data['DAPI']['display_range'] = (float(p2), float(p98))
+    channel_data['DAPI']['sum'] = dapi if dapi_sum is None else dapi_sum
+
+    return channel_data
+
+def analyze_channels(file_path, projection='max', seg_params=None):
     """Process ND2 image channels with nuclear segmentation."""
+    try:
+        channels, projections, dapi_sum = read_channels(file_path, projection)
+        return build_channel_data(channels, projections, seg_params or SEGMENTATION_DEFAULTS, dapi_sum=dapi_sum)
+    except Exception as e:
+        logging.error(f"Channel analysis error: {str(e)}")
+        raise
+
+# ✅ Measurements
+def nuclear_background(image, labeled, step=4):
+    """Median of the pixels outside every nucleus, from a strided sample of the image."""
+    values = image[::step, ::step][labeled[::step, ::step] == 0]
+    return float(np.median(values)) if values.size else 0.0
+
+def measure_nuclei(channel_data):
+    """Per-nucleus shape measurements plus intensities for every channel, as a DataFrame.
+
+    `Mean_Intensity` is measured on DAPI normalized to its 2-98 percentile
+    range (rescaled per gathered nuclear pixel, in float32); the
+    per-channel columns use the raw projections so integrated intensities
+    stay proportional to signal. `DNA_Content`, the input to phase
+    classification, is the integrated DAPI intensity above the background
+    on the DAPI sum projection: a max or best-focus projection keeps one
+    plane per pixel, which isn't proportional to the DNA in the nucleus.
+    """
+    with stage('measurements'):
+        labeled = channel_data['DAPI']['labeled']
+        columns = measure_regions(labeled, {channel: data['raw'] for channel, data in channel_data.items()})
+        dapi_norm = measure_regions(labeled, {'DAPI': channel_data['DAPI']['raw']}, shape=False,
+                                    value_ranges={'DAPI': channel_data['DAPI']['display_range']})
+
+        import pandas as pd
+        table = pd.DataFrame(columns)
+        table.insert(2, 'Mean_Intensity', dapi_norm['DAPI_Mean_Intensity'])
+        dapi_sum = channel_data['DAPI']['sum']
+        dna = measure_regions(labeled, {'DNA': dapi_sum}, shape=False)['DNA_Integrated_Intensity']
+        table['DNA_Content'] = dna - nuclear_background(dapi_sum, labeled) * table['Area']
+        return table
+
+# ✅ Cell-Cycle Phases
+def classify_table(table):
+    """Fit phase gates to one table's nuclei and add its Phase columns; returns the gates."""
+    with stage('phases'):
+        gates = fit_population([phase_features(table)])
+        classify(table, gates)
+    return gates
+
+def classify_staged(staging, features, gates=None):
+    """Add Phase columns to measurements already written to `staging`, field by field.
+
+    `features` are the phase_features() of every written table; gates are
+    fitted to all of them together unless given. Returns (gates, phase counts).
+    """
+    with stage('phases'):
+        gates = gates or fit_population(features)
+    counts = phase_counts([])
+    def add_phases(table):
+        classify(table, gates)
+        phase_counts(table['Phase'], counts)
+        return table
+    rewrite_measurements(staging, add_phases)
+    return gates, counts
+
+# ✅ Cache Keys
+def projection_key(sha256, projection):
+    """Cache key for the projected channels of a file."""
+    return ResultCache.key('projection', PROJECTION_VERSION, sha256, projection)
+
+def analysis_key(sha256, projection, seg_params):
+    """Cache key (and analysis id) for a full analysis of a file."""
+    return ResultCache.key('analysis', PIPELINE_VERSION, sha256, projection, seg_params)
+
+def overlay_key(analysis_id):
+    """Cache key for the Deep Zoom overlay pyramid of an analysis."""
+    return ResultCache.key('overlay', analysis_id, OVERLAY_TILE_FORMAT)
+
+def cached_result(sha256, projection, seg_params=None):
+    """Return a previous analysis result for this content and parameters, if still cached."""
+    entry = cache.get(analysis_key(sha256, projection, seg_params or SEGMENTATION_DEFAULTS))
+    if entry is None:
+        return None
+    if 'projection_key' in entry:
+        # Re-segmenting this analysis starts from those projections, so keep them as fresh
+        cache.get(entry['projection_key'])
+    logging.info(f"Cache hit for analysis {entry['key']}")
+    return {**entry['result'], "cached": True}
+
+def write_projection_archive(path, channels, projections):
+    """Write a single field's projected channels as the downloadable projections.npz."""
+    with ArrayArchive(path) as archive:
+        for channel, projected in zip(channels, projections):
+            archive.add(field_array_name(0, 0, channel), projected)
+
+def link_projection_archive(proj_key, staging, channels, projections):
+    """Hard-link the projection entry's projections.npz into an analysis' staging folder.
+
+    The two entries are evicted separately, so each analysis keeps its own
+    link to the archive it serves; no extra disk space is used. If the link
+    can't be made (the projection entry was just evicted), the archive is
+    written again from the projections in memory.
+    """
+    path = os.path.join(staging, 'projections.npz')
+    try:
+        os.link(cache.path(proj_key, 'projections.npz'), path)
+    except OSError:
+        write_projection_archive(path, channels, projections)
+
+def load_projections(sha256, file_path, projection):
+    """Load cached projections (memory-mapped) or read them from the ND2 and cache them.
+
+    Returns (key, channel names, projections, DAPI sum projection). The
+    entry also holds projections.npz, written once per file and projection
+    and hard-linked into every analysis (and re-segmentation) of it, and the DAPI
+    sum unless the projection already is one. With no file_path the
+    projections must already be cached; a FileNotFoundError is raised if
+    they have been evicted.
+    """
+    key = projection_key(sha256, projection)
+    entry = cache.get(key)
+    if entry is not None:
+        channels = entry['channels']
+        projections = [cache.load_array(key, f'channel_{i}') for i in range(len(channels))]
+        dapi_sum = cache.load_array(key, 'dapi_sum') if entry['dapi_sum'] else None
+        return key, channels, projections, dapi_sum
+
+    if file_path is None:
+        raise FileNotFoundError("Projections are no longer cached; upload the file again")
+
+    channels, projections, dapi_sum = read_channels(file_path, projection)
+    separate_sum = dapi_sum is not None and projection != 'sum'
+    staging = cache.staging_dir()
+    with stage('cache_write'):
+        for i, projected in enumerate(projections):
+            np.save(os.path.join(staging, f'channel_{i}.npy'), projected)
+        if separate_sum:
+            np.save(os.path.join(staging, 'dapi_sum.npy'), dapi_sum)
+    write_projection_archive(os.path.join(staging, 'projections.npz'), channels, projections)
+    cache.commit(key, staging, {'sha256': sha256, 'projection': projection, 'channels': channels,
+                                'dapi_sum': separate_sum})
+    return key, channels, projections, dapi_sum
+
+def load_smoothed(proj_key, dapi_projection, sigma, engine='standard'):
+    """Load the smoothed DAPI image for this sigma and engine from the cache, computing it on a miss."""
+    key = ResultCache.key('smoothed', proj_key, sigma, engine)
+    if cache.get(key) is not None:
+        return cache.load_array(key, 'smoothed')
+
+    staging = cache.staging_dir()
+    path = os.path.join(staging, 'smoothed.npy')
+    tile_size = segmentation_tile_size(dapi_projection)
+    if tile_size:
+        # Large scans are smoothed straight into the cache file, never fully in memory
+        smoothed = np.lib.format.open_memmap(
+            path, mode='w+', dtype=smoothed_dtype(engine), shape=dapi_projection.shape)
+        smooth_nuclei_tiled(dapi_projection, sigma, smoothed, tile_size, engine)
+        smoothed.flush()
+    else:
+        smoothed = smooth_nuclei(dapi_projection, sigma, engine)
+        with stage('cache_write'):
+            np.save(path, smoothed)
+    cache.commit(key, staging, {'projection_key': proj_key, 'sigma': sigma, 'engine': engine})
+    return smoothed
+
+def cache_url(key, name):
+    """URL of a file in a cache entry's (sharded) folder."""
+    return f"/static/results/cache/{shard(key)}/{key}/{name}"
+
+def export_urls(key, writer):
+    """Download URLs of an analysis' measurement tables and label/projection archives."""
+    urls = {
+        "measurements_url": cache_url(key, 'measurements.csv'),
+        "labels_url": cache_url(key, 'labels.npz'),
+        "projections_url": cache_url(key, 'projections.npz'),
+    }
+    if writer.parquet_path is not None:
+        urls["measurements_parquet_url"] = cache_url(key, 'measurements.parquet')
+    return urls
+
+# ✅ Full Analysis Pipeline
+def run_analysis(sha256, projection, seg_params, file_path=None):
+    """Run the pipeline, reusing every cached stage upstream of what changed.
+
+    Stages are keyed separately: projections on (content, projection), the
+    smoothed DAPI image additionally on sigma, and the mask, labels and
+    measurements on the full parameter set. Changing only the threshold or
+    morphology therefore skips reading the ND2 and the gaussian entirely.
+    """
+    result = cached_result(sha256, projection, seg_params)
+    if result is not None:
+        return result
+
+    proj_key, channels, projections, dapi_sum = load_projections(sha256, file_path, projection)
+    smoothed = load_smoothed(proj_key, projections[channels.index('DAPI')], seg_params['sigma'], seg_params['engine'])
+    channel_data = build_channel_data(channels, projections, seg_params, smoothed=smoothed, dapi_sum=dapi_sum)
+    measurements = measure_nuclei(channel_data)
+    gates = classify_table(measurements)
+
+    measurements.insert(0, 'Time', 0)
+    measurements.insert(0, 'Position', 0)
+
+    key = analysis_key(sha256, projection, seg_params)
+    staging = cache.staging_dir()
+    with MeasurementWriter(staging) as writer:
+        writer.write(measurements)
+    with ArrayArchive(os.path.join(staging, 'labels.npz')) as labels:
+        labels.add(field_array_name(0, 0), channel_data['DAPI']['labeled'])
+    link_projection_archive(proj_key, staging, channels, projections)
+    annotate(nuclei_count=len(measurements))
+
+    result = {
+        "status": "success",
+        "analysis_id": key,
+        **export_urls(key, writer),
+        "overlay_url": f"/analyses/{key}/overlay.dzi",
+        "nuclei_count": len(measurements),
+        "dna_content_projection": 'sum',
+        "phase_counts": phase_counts(measurements['Phase']) if gates else None,
+        "phase_gates": gates,
+        "params": seg_params,
+    }
+    cache.commit(key, staging, {
+        'sha256': sha256,
+        'projection': projection,
+        'projection_key': proj_key,
+        'params': seg_params,
+        'result': result,
+    })
+    logging.info(f"Results saved: {cache.path(key, 'measurements.csv')}")
+    return result
+
+# ✅ Multi-Position / Time-Lapse Analysis
+def analyze_field(file_path, projection, seg_params, field):
+    """Measure one (position, timepoint) of an ND2 file; runs in a field worker process.
+
+    Returns the measurement table and the field's stage profile, since the
+    worker's profiler can't be seen from the parent process.
+    """
+    v, t = field
+    with profiling(track_rss=True) as profiler:
+        channels, projections, dapi_sum = read_channels(file_path, projection, v, t)
+        channel_data = build_channel_data(channels, projections, seg_params, dapi_sum=dapi_sum)
+        measurements = measure_nuclei(channel_data)
+    measurements.insert(0, 'Time', t)
+    measurements.insert(0, 'Position', v)
+    arrays = {
+        'labels': channel_data['DAPI']['labeled'],
+        'projections': dict(zip(channels, projections)),
+    }
+    return measurements, arrays, profiler.to_dict()
+
+def run_multifield_analysis(sha256, projection, seg_params, file_path, fields):
+    """Analyze every field of a multipoint/time-lapse file in parallel into one table.
+
+    Each worker opens its own ND2Reader. Per-field tables, label images and
+    projections are appended to the combined outputs in field order. At most
+    FIELD_WORKERS fields are submitted ahead of the next one to be written,
+    so a field that finishes early waits in a window of that size and no
+    more than FIELD_WORKERS fields' results are ever held in memory.
+    """
+    result = cached_result(sha256, projection, seg_params)
+    if result is not None:
+        return result
+
+    key = analysis_key(sha256, projection, seg_params)
+    staging = cache.staging_dir()
+    features = []
+    with MeasurementWriter(staging) as writer, \
+            ArrayArchive(os.path.join(staging, 'labels.npz')) as labels, \
+            ArrayArchive(os.path.join(staging, 'projections.npz')) as archive:
+        def write_field(field, future):
+            v, t = field
+            table, arrays, profile = future.result()
+            merge_profile(profile)
+            writer.write(table)
+            features.append(phase_features(table))
+            labels.add(field_array_name(v, t), arrays['labels'])
+            for channel, projected in arrays['projections'].items():
+                archive.add(field_array_name(v, t, channel), projected)
+
+        workers = min(FIELD_WORKERS, len(fields))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            window = deque()
+            for field in fields:
+                if len(window) == workers:
+                    write_field(*window.popleft())
+                window.append((field, pool.submit(analyze_field, file_path, projection, seg_params, field)))
+            while window:
+                write_field(*window.popleft())
+    nuclei_count = writer.rows
+    annotate(nuclei_count=nuclei_count)
+    gates, counts = classify_staged(staging, features)
+
+    result = {
+        "status": "success",
+        "analysis_id": key,
+        **export_urls(key, writer),
+        "nuclei_count": nuclei_count,
+        "dna_content_projection": 'sum',
+        "phase_counts": counts if gates else None,
+        "phase_gates": gates,
+        "positions": len({v for v, _ in fields}),
+        "timepoints": len({t for _, t in fields}),
+        "params": seg_params,
+    }
+    cache.commit(key, staging, {
+        'sha256': sha256,
+        'projection': projection,
+        'params': seg_params,
+        'result': result,
+    })
+    logging.info(f"Results saved for {len(fields)} fields: {cache.path(key, 'measurements.csv')}")
+    return result
+
+def process_upload(file_path, sha256, projection='max', seg_params=None):
+    """Run segmentation and measurements for a saved upload, caching every artifact.
+
+    The result carries a `profile` with wall time, CPU time and peak RSS for
+    every stage; it is returned with the job result but not cached.
+    """
+    seg_params = seg_params or SEGMENTATION_DEFAULTS
+    with profiling(track_rss=True) as profiler:
+        annotate(input_bytes=os.path.getsize(file_path))
+        with stage('analysis'):
+            fields = read_fields(file_path)
+            if len(fields) > 1:
+                result = run_multifield_analysis(sha256, projection, seg_params, file_path, fields)
+            else:
+                result = run_analysis(sha256, projection, seg_params, file_path)
+    if not KEEP_UPLOADS:
+        # Everything later (re-segmentation, downloads) works from the cached results
+        discard_upload(file_path)
+    return {**result, "profile": profiler.to_dict()}
+
+def engine_params(engine):
+    """Default segmentation parameters with the requested engine; ValueError if it is unknown."""
+    return parse_seg_params({'engine': engine} if engine else None)
+
+# ✅ Fast Preview
+def preview_factor(width, height):
+    """Binning factor that brings the longer image side down to PREVIEW_MAX_SIZE."""
+    return max(1, math.ceil(max(width, height) / PREVIEW_MAX_SIZE))
+
+def preview_params(seg_params, factor):
+    """Segmentation parameters rescaled to an image binned by `factor`, on the fast engine."""
+    return {
+        **seg_params,
+        'engine': 'fast',
+        'sigma': seg_params['sigma'] / factor,
+        'closing_radius': int(seg_params['closing_radius'] / factor + 0.5),
+        'opening_radius': int(seg_params['opening_radius'] / factor + 0.5),
+        'min_size': max(1, int(seg_params['min_size'] / factor ** 2 + 0.5)),
+    }
+
+def preview_channels(file_path, projection='max', seg_params=None):
+    """Segment a binned, z-subsampled DAPI projection; returns (dapi, labeled, factor, z_step).
+
+    Only the DAPI channel and at most PREVIEW_Z_PLANES evenly spaced planes
+    are read, and each frame is binned as soon as it is decoded.
+    """
     try:
         with ND2Reader(file_path) as images:
-            metadata = images.metadata
-            channels = metadata.get('channels', [])
+            channels = nd2_channels(images)
             z_levels = images.sizes.get('z', 1)
+            factor = preview_factor(images.sizes.get('x', 1), images.sizes.get('y', 1))
+            z_step = math.ceil(z_levels / PREVIEW_Z_PLANES)
+            dapi, = project_channels(
+                images, len(channels), z_levels, method=projection,
+                z_step=z_step, bin_factor=factor, channel_indices=[channels.index('DAPI')],
+            )
+        params = preview_params(seg_params or SEGMENTATION_DEFAULTS, factor)
+        labeled = analyze_particles(segment_nuclei(dapi, **params), min_size=params['min_size'])
+        return dapi, labeled, factor, z_step
+    except Exception as e:
+        logging.error(f"Preview error: {str(e)}")
+        raise
+
+def save_thumbnail(image, labeled, path):
+    """Write the DAPI image as an RGB PNG with the found nuclei outlined."""
+    rgb = render_overlay([image], [display_range(image)], channel_colors(['DAPI']), labeled)
+    from PIL import Image
+    Image.fromarray(rgb).save(path)
 
-            if not channels:
-                channels = [f'Channel_{i}' for i in range(images.sizes.get('c', 1))]
+def run_preview(sha256, file_path, projection, seg_params):
+    """Approximate nuclei count and a thumbnail from the binned preview, cached per file."""
+    key = ResultCache.key('preview', PIPELINE_VERSION, sha256, projection, seg_params)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry['preview']
 
-            if 'DAPI' not in channels:
-                channels[0] = 'DAPI'
+    started = datetime.now()
+    dapi, labeled, factor, z_step = preview_channels(file_path, projection, seg_params)
+    staging = cache.staging_dir()
+    save_thumbnail(dapi, labeled, os.path.join(staging, 'preview.png'))
+    preview = {
+        "nuclei_count_estimate": int(labeled.max()),
+        "bin_factor": factor,
+        "z_step": z_step,
+        "thumbnail_url": cache_url(key, 'preview.png'),
+        "elapsed_seconds": (datetime.now() - started).total_seconds(),
+    }
+    cache.commit(key, staging, {'sha256': sha256, 'projection': projection, 'preview': preview})
+    logging.info(f"Preview: ~{preview['nuclei_count_estimate']} nuclei in {preview['elapsed_seconds']:.2f}s")
+    return preview
 
-            dapi_idx = channels.index('DAPI')
-            dapi_stack = [images.get_frame_2D(z=z, c=dapi_idx) for z in range(z_levels)]
-            dapi_projected = np.max(np.array(dapi_stack), axis=0)
-            nuclear_mask = segment_nuclei(dapi_projected)
-            nuclear_labeled = analyze_particles(nuclear_mask)
+def preview_response(sha256, file_path, projection, seg_params):
+    """Preview for an upload response; a failed preview never fails the upload."""
+    try:
+        return run_preview(sha256, file_path, projection, seg_params)
+    except Exception as e:
+        return {"error": str(e)}
+
+def wants_preview(value):
+    """True for the usual spellings of a true form/JSON flag."""
+    return value is True or str(value).lower() in ('1', 'true', 'yes')
 
-            channel_data = {}
-            for ch_idx, channel in enumerate(channels):
-                z_stack = [images.get_frame_2D(z=z, c=ch_idx) for z in range(z_levels)]
-                projected = np.max(np.array(z_stack), axis=0)
-                p2, p98 = np.percentile(projected, (2, 98))
-                projected_norm = np.clip((projected - p2) / (p98 - p2), 0, 1)
+# ✅ Upload Storage
+def allowed_file(filename):
+    """True if the filename has one of the accepted extensions."""
+    return bool(filename) and any(filename.lower().endswith(ext) for ext in ALLOWED_EXTENSIONS)
 
-                channel_data[channel] = {
-                    'original': projected_norm,
-                    'mask': nuclear_mask,
-                    'labeled': nuclear_labeled
-                }
+def stored_upload_name(filename):
+    """Unique on-disk name for an upload, relative to UPLOAD_FOLDER and sharded on its random part."""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    token = uuid.uuid4().hex
+    return shard_path('', secure_filename(f"{timestamp}_{token[:8]}_{filename}"), token)
+
+def save_upload(stream, filename):
+    """Stream an uploaded file into UPLOAD_FOLDER, hashing it on the way; returns (path, sha256)."""
+    file_path = os.path.join(UPLOAD_FOLDER, stored_upload_name(filename))
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    hasher = hashlib.sha256()
+    try:
+        with stage('upload_save'), open(file_path, 'wb') as f:
+            copy_stream(stream, f, hasher, MAX_FILE_SIZE)
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    logging.info(f"File saved: {file_path}")
+    return file_path, hasher.hexdigest()
 
-        return channel_data
+def discard_upload(file_path):
+    """Delete a raw upload whose analysis is cached; a file already gone is fine."""
+    try:
+        os.remove(file_path)
+        logging.info(f"Removed analyzed upload {file_path}")
+    except FileNotFoundError:
+        pass
+
+def hold_upload(job_id, file_path):
+    """Keep an upload from eviction until its analysis job finishes, then sweep."""
+    storage.pin(file_path)
+
+    def release(_):
+        storage.unpin(file_path)
+        storage.request_sweep()
+    jobs.watch(job_id, release)
+
+def estimate_images(images):
+    """Peak memory of analyzing the file behind an open reader, from its header alone."""
+    sizes = dict(images.sizes)
+    fields = sizes.get('v', 1) * sizes.get('t', 1)
+    return estimate_working_set(sizes, frame_itemsize(images), min(FIELD_WORKERS, fields))
+
+def estimate_upload(file_path):
+    """Peak memory of analyzing an ND2 file; no frames are decoded."""
+    try:
+        with ND2Reader(file_path) as images:
+            return estimate_images(images)
     except Exception as e:
-        logging.error(f"Channel analysis error: {str(e)}")
+        logging.error(f"ND2 header error: {str(e)}")
+        raise UploadError("Could not read the ND2 file header", 400)
+
+def submit_admitted(reservation, fn, *args):
+    """Queue a job that holds an admission reservation until it finishes."""
+    try:
+        job_id = jobs.submit(fn, *args)
+    except Exception:
+        admission.release(reservation)
         raise
+    jobs.watch(job_id, lambda _: admission.release(reservation))
+    return job_id
+
+def over_capacity_response(e, body=None):
+    """503 with Retry-After while the server is full; 413 for an analysis that can never fit."""
+    pipeline_metrics.record_outcome('rejected')
+    headers = {'Retry-After': str(e.retry_after)} if e.retry_after is not None else {}
+    return jsonify({**(body or {}), "error": str(e), "retry_after": e.retry_after}), e.status_code, headers
 
 # ✅ File Upload Route
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Handle file uploads and analysis."""
+    """Save the upload and queue its analysis as a background job."""
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
 
         file = request.files['file']
-        if not file.filename or not any(file.filename.lower().endswith(ext) for ext in ALLOWED_EXTENSIONS):
+        if not allowed_file(file.filename):
             return jsonify({"error": "Invalid file type"}), 400
 
         if request.content_length > MAX_FILE_SIZE:
             return jsonify({"error": "File too large"}), 413
 
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = secure_filename(f"{timestamp}_{file.filename}")
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-
-        logging.info(f"File saved: {file_path}")
-
-        channel_data = analyze_channels(file_path)
-        measurements = [
-            {
-                'ROI': region.label,
-                'Area': region.area,
-                'Mean_Intensity': region.mean_intensity,
-                'Perimeter': region.perimeter,
-                'Eccentricity': region.eccentricity,
-                'Circularity': (4 * np.pi * region.area / (region.perimeter ** 2)) if region.perimeter > 0 else 0
-            }
-            for region in regionprops(channel_data['DAPI']['labeled'], intensity_image=channel_data['DAPI']['original'])
-        ]
+        projection = request.form.get('projection', 'max')
+        if projection not in PROJECTIONS:
+            return jsonify({"error": f"Unknown projection '{projection}'"}), 400
+        try:
+            seg_params = engine_params(request.form.get('engine'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        with profiling() as profiler:
+            file_path, sha256 = save_upload(file.stream, file.filename)
+        upload_profile = profiler.to_dict()
+        pipeline_metrics.record_stages(upload_profile['stages'])
+
+        result = cached_result(sha256, projection, seg_params)
+        if result is not None:
+            os.remove(file_path)
+            pipeline_metrics.record_outcome('cached')
+            return jsonify({**result, "profile": upload_profile}), 200
 
-        results_file = os.path.join(RESULTS_FOLDER, f'measurements_{timestamp}.csv')
-        pd.DataFrame(measurements).to_csv(results_file, index=False)
+        try:
+            reservation = admission.admit(estimate_upload(file_path))
+        except (OverCapacity, UploadError):
+            os.remove(file_path)
+            raise
+        job_id = submit_admitted(reservation, process_upload, file_path, sha256, projection, seg_params)
+        hold_upload(job_id, file_path)
+        body = {**job_response(job_id), "profile": upload_profile}
+        # The full analysis is already running in the pool while the preview is computed here
+        if wants_preview(request.form.get('preview')):
+            body['preview'] = preview_response(sha256, file_path, projection, seg_params)
+        return jsonify(body), 202
+    except OverCapacity as e:
+        return over_capacity_response(e)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        logging.error(f"Upload error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def job_response(job_id):
+    """Body returned when an analysis job has been queued."""
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+    }
+
+# ✅ Chunked Upload Routes
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable upload; the size limit is checked before any bytes are sent."""
+    try:
+        body = request.get_json(silent=True) or {}
+        filename = body.get('filename', '')
+        projection = body.get('projection', 'max')
+        if projection not in PROJECTIONS:
+            return jsonify({"error": f"Unknown projection '{projection}'"}), 400
+        engine = body.get('engine', SEGMENTATION_DEFAULTS['engine'])
+        try:
+            engine_params(engine)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        metadata = {'projection': projection, 'engine': engine, 'preview': wants_preview(body.get('preview')),
+                    'analyze': body.get('analyze', True) is not False}
+        session = uploads.create(filename, body.get('size'), stored_upload_name(filename), metadata)
+        return jsonify({
+            "upload_id": session['upload_id'],
+            "offset": session['offset'],
+            "size": session['size'],
+            "upload_url": f"/uploads/{session['upload_id']}",
+        }), 201
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        logging.error(f"Upload session error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Report how many bytes have been received so the client can resume."""
+    try:
+        session = uploads.status(upload_id)
         return jsonify({
-            "status": "success",
-            "measurements_url": f"/static/results/measurements_{timestamp}.csv",
-            "nuclei_count": len(measurements),
+            "upload_id": upload_id,
+            "offset": session['offset'],
+            "size": session['size'],
+            "complete": session['complete'],
+            "sha256": session['sha256'],
         }), 200
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Stream one chunk to disk at the Upload-Offset header; queue analysis after the last one.
+
+    An empty PUT at the final offset of a complete upload asks again for its
+    analysis, which is how a client retries after a 503; it never queues the
+    same upload twice. Uploads created with `"analyze": false` are only
+    stored, for a later POST /batches.
+    """
+    body = None
+    try:
+        offset = request.headers.get('Upload-Offset', type=int)
+        if offset is None:
+            return jsonify({"error": "Missing Upload-Offset header"}), 400
+
+        session = uploads.status(upload_id)
+        if not (session['complete'] and offset == session['size']):
+            with profiling() as profiler, stage('upload_chunk'):
+                session = uploads.write_chunk(upload_id, offset, request.stream, request.content_length)
+            pipeline_metrics.record_stages(profiler.stages)
+        body = {
+            "upload_id": upload_id,
+            "offset": session['offset'],
+            "size": session['size'],
+            "complete": session['complete'],
+        }
+        if not session['complete']:
+            return jsonify(body), 200
+
+        body['sha256'] = session['sha256']
+        if not session['metadata'].get('analyze', True) or session['metadata'].get('owner'):
+            return jsonify(body), 200
+        if session['metadata'].get('job_id'):
+            return jsonify({**body, **job_response(session['metadata']['job_id'])}), 202
+
+        projection = session['metadata']['projection']
+        seg_params = engine_params(session['metadata'].get('engine'))
+        result = cached_result(session['sha256'], projection, seg_params)
+        if result is not None:
+            if os.path.exists(session['file_path']):
+                os.remove(session['file_path'])
+            pipeline_metrics.record_outcome('cached')
+            return jsonify({**body, **result}), 200
+
+        reservation = admission.admit(estimate_upload(session['file_path']))
+        job_id = submit_admitted(reservation, process_upload, session['file_path'], session['sha256'], projection, seg_params)
+        hold_upload(job_id, session['file_path'])
+        uploads.update_metadata(upload_id, job_id=job_id)
+        body = {**body, **job_response(job_id)}
+        if session['metadata'].get('preview'):
+            body['preview'] = preview_response(session['sha256'], session['file_path'], projection, seg_params)
+        return jsonify(body), 202
+    except OverCapacity as e:
+        # The file is kept; the client retries with an empty PUT at the final offset
+        return over_capacity_response(e, body)
+    except UploadError as e:
+        return jsonify({"error": str(e), "offset": e.offset}), e.status_code
     except Exception as e:
-        logging.error(f"Upload error: {str(e)}")
+        logging.error(f"Chunk upload error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# ✅ Batch Routes
+def batch_item(session, projection, seg_params):
+    """Batch entry for a completed upload, resolved immediately on a cache hit or an unreadable file."""
+    item = {'filename': session['filename'], 'upload_id': session['upload_id']}
+    file_path, sha256 = session['file_path'], session['sha256']
+    result = cached_result(sha256, projection, seg_params)
+    if result is not None:
+        discard_upload(file_path)
+        return {**item, 'result': result}
+    if not os.path.exists(file_path):
+        return {**item, 'error': "Upload is no longer available"}
+    try:
+        estimate = estimate_upload(file_path)
+    except UploadError as e:
+        discard_upload(file_path)
+        return {**item, 'error': str(e)}
+    return {**item, 'args': (file_path, sha256, projection, seg_params), 'estimate': estimate}
+
+def admit_batch(files, concurrency):
+    """Admit a batch for its peak: the `concurrency` largest files running at once.
+
+    Concurrency is lowered until that peak fits the memory budget, so a batch
+    of big files runs slower rather than being refused. Returns
+    (reservation or None, concurrency).
+    """
+    estimates = sorted((f['estimate'] for f in files if 'args' in f), reverse=True)
+    concurrency = max(1, min(concurrency, MAX_CONCURRENT_ANALYSES))
+    while concurrency > 1 and sum(estimates[:concurrency]) > admission.budget_bytes:
+        concurrency -= 1
+    if not estimates:
+        return None, concurrency
+    return admission.admit(sum(estimates[:concurrency]), slots=min(concurrency, len(estimates))), concurrency
+
+@app.route('/batches', methods=['POST'])
+def create_batch():
+    """Analyze many completed chunked uploads (see POST /uploads) as one batch.
+
+    The JSON body lists their `upload_ids`, with optional `projection`,
+    `engine` and `concurrency`. Files are already on disk, so this request
+    only checks headers and the cache; nothing is uploaded or copied. On a
+    503 the uploads are kept and the same request can be retried.
+    """
+    try:
+        body = request.get_json(silent=True) or {}
+        upload_ids = body.get('upload_ids')
+        if not upload_ids or not isinstance(upload_ids, list) or not all(isinstance(i, str) for i in upload_ids):
+            return jsonify({"error": "upload_ids must be a non-empty list of upload ids"}), 400
+
+        projection = body.get('projection', 'max')
+        if projection not in PROJECTIONS:
+            return jsonify({"error": f"Unknown projection '{projection}'"}), 400
+        concurrency = body.get('concurrency', BATCH_CONCURRENCY)
+        if isinstance(concurrency, bool) or not isinstance(concurrency, int):
+            return jsonify({"error": "concurrency must be an integer"}), 400
+        concurrency = min(concurrency, BATCH_CONCURRENCY)
+        try:
+            seg_params = engine_params(body.get('engine'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        files = []
+        claimed = []
+        for upload_id in list(dict.fromkeys(upload_ids))[:MAX_BATCH_FILES]:
+            try:
+                session = uploads.claim(upload_id, 'batch')
+            except UploadError as e:
+                files.append({'filename': None, 'upload_id': upload_id, 'error': str(e)})
+                continue
+            claimed.append(upload_id)
+            files.append(batch_item(session, projection, seg_params))
+
+        try:
+            reservation, concurrency = admit_batch(files, concurrency)
+        except OverCapacity:
+            for upload_id in claimed:
+                uploads.update_metadata(upload_id, owner=None)
+            raise
+        held = [f['args'][0] for f in files if 'args' in f]
+        for file_path in held:
+            storage.pin(file_path)
+
+        def finish_batch(_):
+            if reservation:
+                admission.release(reservation)
+            for file_path in held:
+                storage.unpin(file_path)
+            storage.request_sweep()
+        batch_id = batches.create(files, process_upload, concurrency, on_finish=finish_batch)
+        for upload_id in claimed:
+            uploads.update_metadata(upload_id, batch_id=batch_id)
+        return jsonify({
+            "status": "queued",
+            "batch_id": batch_id,
+            "total": len(files),
+            "status_url": f"/batches/{batch_id}",
+        }), 202
+    except OverCapacity as e:
+        return over_capacity_response(e)
+    except Exception as e:
+        logging.error(f"Batch creation error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/batches/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """Per-file progress of a batch and the merged table once every file has finished."""
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Unknown batch"}), 404
+    return jsonify(batch), 200
+
+# ✅ Re-Segmentation Routes
+@app.route('/analyses/<analysis_id>', methods=['GET'])
+def get_analysis(analysis_id):
+    """Return the parameters and result of a cached analysis."""
+    entry = cache.get(analysis_id)
+    if entry is None or 'result' not in entry:
+        return jsonify({"error": "Unknown analysis"}), 404
+    return jsonify(entry['result']), 200
+
+def estimate_resegment(entry):
+    """Peak memory of re-segmenting a cached analysis, from its cached projections' shape."""
+    proj_entry = cache.get(entry['projection_key'])
+    if proj_entry is None:
+        raise FileNotFoundError("Projections are no longer cached; upload the file again")
+    dapi = cache.load_array(entry['projection_key'], 'channel_0')
+    height, width = dapi.shape
+    return estimate_working_set({'x': width, 'y': height, 'c': len(proj_entry['channels'])}, dapi.dtype.itemsize)
+
+@app.route('/analyses/<analysis_id>/resegment', methods=['POST'])
+def resegment(analysis_id):
+    """Re-run segmentation of a previous analysis with new parameters, without re-reading the ND2."""
+    try:
+        entry = cache.get(analysis_id)
+        if entry is None or 'result' not in entry:
+            return jsonify({"error": "Unknown analysis"}), 404
+        if 'projection_key' not in entry:
+            return jsonify({"error": "Re-segmentation is only available for single-field files"}), 400
+
+        body = request.get_json(silent=True) or {}
+        try:
+            seg_params = parse_seg_params(body.get('params', body), entry['params'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        reservation = admission.admit(estimate_resegment(entry))
+        started = datetime.now()
+        try:
+            with profiling() as profiler, stage('analysis'):
+                result = run_analysis(entry['sha256'], entry['projection'], seg_params)
+        finally:
+            admission.release(reservation)
+        elapsed = (datetime.now() - started).total_seconds()
+        profile = profiler.to_dict()
+        pipeline_metrics.record_profile(profile, status='cached' if result.get('cached') else 'resegmented')
+        logging.info(f"Re-segmented {analysis_id} -> {result['analysis_id']} in {elapsed:.2f}s")
+        return jsonify({
+            **result,
+            "source_analysis_id": analysis_id,
+            "elapsed_seconds": elapsed,
+            "profile": profile,
+        }), 200
+    except OverCapacity as e:
+        return over_capacity_response(e)
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 410
+    except Exception as e:
+        logging.error(f"Re-segmentation error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# ✅ Overlay Routes
+overlay_locks = {}
+
+def load_overlay(analysis_id):
+    """Cache key of a single-field analysis' overlay pyramid, rendering it on first use.
+
+    Rendering takes about a second per 2048 px image, so run_analysis leaves
+    it out and a re-segmentation only pays for it if its overlay is viewed.
+    Returns None for unknown and multi-field analyses; raises
+    FileNotFoundError if the projections have been evicted.
+    """
+    entry = cache.get(analysis_id)
+    if entry is None or 'projection_key' not in entry:
+        return None
+    key = overlay_key(analysis_id)
+    if cache.get(key) is not None:
+        return key
+    # One render per overlay; concurrent viewers wait for it instead of rendering it again
+    with overlay_locks.setdefault(key, threading.Lock()):
+        try:
+            if cache.get(key) is None:
+                started = time.perf_counter()
+                _, channels, projections, _ = load_projections(entry['sha256'], None, entry['projection'])
+                with np.load(cache.path(analysis_id, 'labels.npz')) as labels:
+                    labeled = labels[field_array_name(0, 0)]
+                staging = cache.staging_dir()
+                write_pyramid(staging, 'overlay', projections, channels, labeled,
+                              tile_format=OVERLAY_TILE_FORMAT, workers=SEGMENTATION_THREADS)
+                cache.commit(key, staging, {'analysis_id': analysis_id, 'tile_format': OVERLAY_TILE_FORMAT})
+                logging.info(f"Rendered overlay of {analysis_id} in {time.perf_counter() - started:.2f}s")
+        finally:
+            overlay_locks.pop(key, None)
+    return key
+
+@app.route('/analyses/<analysis_id>/overlay.dzi', methods=['GET'])
+def get_overlay(analysis_id):
+    """Deep Zoom descriptor of an analysis' overlay; the first request renders the pyramid."""
+    try:
+        key = load_overlay(analysis_id)
+        if key is None:
+            return jsonify({"error": "Unknown analysis"}), 404
+        return stream_file(cache.path(key, 'overlay.dzi'))
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 410
+    except Exception as e:
+        logging.error(f"Overlay rendering error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/analyses/<analysis_id>/overlay_files/<path:tile>', methods=['GET'])
+def get_overlay_tile(analysis_id, tile):
+    """One tile of a rendered overlay pyramid, next to its descriptor's URL as Deep Zoom viewers expect."""
+    file_path = safe_join(cache.entry_dir(overlay_key(analysis_id)), 'overlay_files', tile)
+    if file_path is None or not os.path.isfile(file_path):
+        abort(404)
+    storage.touch(file_path)
+    return stream_file(file_path)
+
+# ✅ Job Status Routes
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report queued/running/done/failed state and timing for a job."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Return the analysis result once the job is done."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job['status'] == FAILED:
+        return jsonify({"error": job['error'], "job": job}), 500
+    if job['status'] != DONE:
+        return jsonify({"error": "Job not finished", "job": job}), 409
+    return jsonify({**jobs.result(job_id), "job": job}), 200
+
+# ✅ Metrics Route
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage timings, memory and throughput histograms in Prometheus text format.
+
+    The counts are per process, so they cover every analysis only because
+    the app is served by a single web worker.
+    """
+    return Response(pipeline_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# ✅ Startup Warm-Up
+startup = {'import_seconds': time.perf_counter() - _import_started, 'warm_up_seconds': 0.0}
+pipeline_metrics.add_gauge('startup_import_seconds', 'Time to import the app module',
+                           lambda: startup['import_seconds'])
+pipeline_metrics.add_gauge('startup_warm_up_seconds', 'Time spent warming up the pipeline before serving',
+                           lambda: startup['warm_up_seconds'])
+
+def warm_up(size=128):
+    """Run every pipeline stage once on a tiny synthetic stack, before the first request.
+
+    This pulls in the lazily imported libraries (nd2reader, skimage, scipy,
+    pandas, PIL, pyarrow) and their first-call setup, so the first user
+    doesn't pay for them. Under gunicorn with preload_app it runs in the
+    master and the forked worker inherits the warm modules.
+    """
+    started = time.perf_counter()
+    try:
+        from nd2reader import ND2Reader as _  # noqa: F401 (pims makes this the slowest single import)
+        stack = synthetic_stack(size=size, nuclei=8, radius=6, z_levels=2)
+        with tempfile.TemporaryDirectory() as folder:
+            with SyntheticND2Reader(stack.save(os.path.join(folder, 'warm_up.npz'))) as images:
+                projections = project_channels(images, len(stack.channels), images.sizes['z'])
+            for engine in SEGMENTATION_ENGINES:
+                channel_data = build_channel_data(stack.channels, projections, {**SEGMENTATION_DEFAULTS, 'engine': engine})
+                measurements = measure_nuclei(channel_data)
+            labeled = channel_data['DAPI']['labeled']
+            with MeasurementWriter(folder) as writer:
+                writer.write(measurements)
+            with ArrayArchive(os.path.join(folder, 'labels.npz')) as labels:
+                labels.add(field_array_name(0, 0), labeled)
+            write_pyramid(folder, 'overlay', projections, stack.channels, labeled, tile_format=OVERLAY_TILE_FORMAT)
+            save_thumbnail(projections[0], labeled, os.path.join(folder, 'thumbnail.png'))
+    except Exception as e:
+        logging.error(f"Warm-up error: {str(e)}")
+        raise
+    startup['warm_up_seconds'] = time.perf_counter() - started
+    logging.info(f"Warm-up done in {startup['warm_up_seconds']:.2f}s (import took {startup['import_seconds']:.2f}s)")
+    return startup['warm_up_seconds']
+
 # ✅ Start Flask Server
 if __name__ == '__main__':
-    setup_folders()
+    if os.environ.get('WARM_UP', '1') != '0':
+        warm_up()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from jobs import QUEUED, RUNNING, DONE, FAILED
+from phases import feature_columns, phase_features, fit_population, classify, phase_counts
+from storage import shard, shard_path
+
+MERGE_CHUNK_ROWS = 100000
+
+
+# ✅ Batch Manager
+class BatchManager:
+    """Run many analyses as one batch with a per-batch concurrency limit.
+
+    Files are fed to the shared JobManager no more than `concurrency` at a
+    time; each finished job pulls in the next pending file. Once every file
+    has finished, the per-file measurement tables are streamed into one
+    merged CSV with a leading `File` column. Cell-cycle phases in the merged
+    table come from gates fitted once to every nucleus of the batch, so all
+    files are gated alike; the gates are saved next to it as
+    `phase_gates.json`.
+
+    Like job records, batches live in this process's memory, so the app
+    runs a single threaded gunicorn worker (see gunicorn.conf.py).
+    """
+
+    def __init__(self, jobs, output_folder, output_url, measurements_path):
+        self.jobs = jobs
+        self.output_folder = output_folder
+        self.output_url = output_url
+        self.measurements_path = measurements_path
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def create(self, files, task, concurrency, on_finish=None):
+        """Start a batch.
+
+        `files` is a list of dicts with a `filename` (and optionally the
+        `upload_id` it came from) and either the `args` to call `task` with,
+        an already available `result` (e.g. a cache hit) or an `error`.
+        `on_finish(batch_id)` is called once every file has finished.
+        """
+        batch_id = uuid.uuid4().hex
+        batch = {
+            'id': batch_id,
+            'created_at': time.time(),
+            'finished_at': None,
+            'concurrency': max(1, concurrency),
+            'task': task,
+            'on_finish': on_finish,
+            'files': [
+                {
+                    'filename': f['filename'],
+                    'upload_id': f.get('upload_id'),
+                    'args': f.get('args'),
+                    'status': DONE if f.get('result') else (FAILED if f.get('error') else QUEUED),
+                    'job_id': None,
+                    'result': f.get('result'),
+                    'error': f.get('error'),
+                }
+                for f in files
+            ],
+            'merged_url': None,
+        }
+        with self._lock:
+            self._batches[batch_id] = batch
+        logging.info(f"Batch {batch_id} created with {len(files)} files")
+        self._pump(batch_id)
+        return batch_id
+
+    def _pump(self, batch_id):
+        """Submit pending files until the batch's concurrency limit is reached."""
+        to_watch = []
+        with self._lock:
+            batch = self._batches[batch_id]
+            in_flight = sum(1 for f in batch['files'] if f['job_id'] and f['status'] == QUEUED)
+            for index, f in enumerate(batch['files']):
+                if in_flight >= batch['concurrency']:
+                    break
+                if f['status'] == QUEUED and f['job_id'] is None:
+                    f['job_id'] = self.jobs.submit(batch['task'], *f['args'])
+                    to_watch.append((index, f['job_id']))
+                    in_flight += 1
+            finished = all(f['status'] in (DONE, FAILED) for f in batch['files'])
+
+        for index, job_id in to_watch:
+            self.jobs.watch(job_id, lambda _, index=index: self._file_done(batch_id, index))
+        if finished and not to_watch:
+            self._finish(batch_id)
+
+    def _file_done(self, batch_id, index):
+        job_id = self._batches[batch_id]['files'][index]['job_id']
+        job = self.jobs.get(job_id)
+        with self._lock:
+            f = self._batches[batch_id]['files'][index]
+            f['status'] = job['status']
+            f['error'] = job['error']
+            f['result'] = self.jobs.result(job_id)
+        self._pump(batch_id)
+
+    def _finish(self, batch_id):
+        """Merge the finished per-file tables in the background."""
+        with self._lock:
+            batch = self._batches[batch_id]
+            if batch['finished_at'] is not None:
+                return
+            batch['finished_at'] = time.time()
+        if batch['on_finish'] is not None:
+            try:
+                batch['on_finish'](batch_id)
+            except Exception as e:
+                logging.error(f"Batch {batch_id} callback failed: {str(e)}")
+        threading.Thread(target=self._merge, args=(batch_id,), daemon=True).start()
+
+    def _merge(self, batch_id):
+        import pandas as pd
+        batch = self._batches[batch_id]
+        try:
+            folder = shard_path(self.output_folder, batch_id)
+            os.makedirs(folder, exist_ok=True)
+            merged_path = os.path.join(folder, 'measurements.csv')
+            done = [f for f in batch['files'] if f['status'] == DONE]
+
+            # First pass reads only the phase feature columns, to fit one set of gates
+            features = []
+            for f in done:
+                path = self.measurements_path(f['result'])
+                columns = feature_columns(pd.read_csv(path, nrows=0).columns)
+                features.append(phase_features(pd.read_csv(path, usecols=columns)))
+            gates = fit_population(features)
+            with open(os.path.join(folder, 'phase_gates.json'), 'w') as out:
+                json.dump(gates, out, indent=1)
+
+            header = True
+            counts = phase_counts([])
+            with open(merged_path, 'w', newline='') as out:
+                for f in done:
+                    for chunk in pd.read_csv(self.measurements_path(f['result']), chunksize=MERGE_CHUNK_ROWS):
+                        classify(chunk, gates)
+                        phase_counts(chunk['Phase'], counts)
+                        chunk.insert(0, 'File', f['filename'])
+                        chunk.to_csv(out, header=header, index=False)
+                        header = False
+            with self._lock:
+                batch['phase_gates'] = gates
+                batch['phase_counts'] = counts
+                batch['merged_url'] = f"{self.output_url}/{shard(batch_id)}/{batch_id}/measurements.csv"
+            logging.info(f"Batch {batch_id} merged into {merged_path}")
+        except Exception as e:
+            logging.error(f"Batch {batch_id} merge failed: {str(e)}")
+            with self._lock:
+                batch['merge_error'] = str(e)
+
+    def get(self, batch_id):
+        """JSON-serializable progress of a batch, per file, or None if unknown."""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            files = [
+                {
+                    'filename': f['filename'],
+                    'upload_id': f['upload_id'],
+                    'status': f['status'],
+                    'job_id': f['job_id'],
+                    'error': f['error'],
+                    'measurements_url': f['result']['measurements_url'] if f['result'] else None,
+                    'nuclei_count': f['result']['nuclei_count'] if f['result'] else None,
+                }
+                for f in batch['files']
+            ]
+            merged_url = batch['merged_url']
+            merge_error = batch.get('merge_error')
+            phase_gates = batch.get('phase_gates')
+            phases = batch.get('phase_counts')
+            finished_at = batch['finished_at']
+
+        for f in files:
+            if f['status'] == QUEUED and f['job_id']:
+                job = self.jobs.get(f['job_id'])
+                if job is not None and job['status'] == RUNNING:
+                    f['status'] = RUNNING
+
+        counts = {state: sum(1 for f in files if f['status'] == state) for state in (QUEUED, RUNNING, DONE, FAILED)}
+        complete = finished_at is not None and (merged_url is not None or merge_error is not None)
+        return {
+            'batch_id': batch_id,
+            'status': 'done' if complete else 'running',
+            'total': len(files),
+            'counts': counts,
+            'progress': (counts[DONE] + counts[FAILED]) / len(files) if files else 1.0,
+            'merged_url': merged_url,
+            'merge_error': merge_error,
+            'phase_gates': phase_gates,
+            'phase_counts': phases,
+            'files': files,
+        }
@@ -0,0 +1,379 @@
+"""Benchmark every pipeline stage on synthetic ND2-like stacks.
+
+    python benchmark.py --sizes 512,1024,2048 --densities 600,900 --output bench.json
+    python benchmark.py --baseline bench.json   # compare timings and segmentation
+
+Runs inside a scratch directory so the app's uploads, cache and log never
+touch the real static folder. Needs the fork start method (Linux) so the
+analysis worker pool inherits the synthetic reader. Each case also writes
+its stack as a real ND2 file and checks memory-mapped frames against
+nd2reader's decode.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from synthetic import synthetic_stack, SyntheticND2Reader
+
+DEFAULT_SIZES = (512, 1024, 2048)
+DEFAULT_DENSITIES = (600, 900)  # nuclei per megapixel; the p90 threshold needs ~15%+ coverage
+JOB_POLL_SECONDS = 0.02
+MIN_COMPARABLE_SECONDS = 0.01  # faster stages are too noisy to flag as regressions
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app
+imported = time.perf_counter() - started
+first = app.warm_up()
+second = app.warm_up()
+print(json.dumps({'import_seconds': imported, 'warm_up_seconds': first, 'warm_run_seconds': second}))
+"""
+
+
+# ✅ Timing
+def time_stage(fn, repeat):
+    """Run fn() `repeat` times; returns (timings, last return value)."""
+    runs = []
+    value = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn()
+        runs.append(time.perf_counter() - started)
+    return {
+        'min_seconds': min(runs),
+        'median_seconds': statistics.median(runs),
+        'runs': runs,
+    }, value
+
+
+def mask_digest(mask):
+    """Stable fingerprint of a mask or label image, to spot changed segmentation between runs."""
+    return hashlib.sha256(np.ascontiguousarray(mask).tobytes()).hexdigest()
+
+
+# ✅ Ground Truth
+def score_segmentation(labeled, stack):
+    """Compare found nuclei with the generated ones.
+
+    A true nucleus is recalled when its center lands inside a found object;
+    objects hit by more than one center are merges, and found objects hit
+    by no center are false positives.
+    """
+    ys = np.clip(np.round(stack.centers[:, 0]).astype(int), 0, labeled.shape[0] - 1)
+    xs = np.clip(np.round(stack.centers[:, 1]).astype(int), 0, labeled.shape[1] - 1)
+    hit = labeled[ys, xs]
+    found = int(labeled.max())
+    hit_ids, hit_counts = np.unique(hit[hit > 0], return_counts=True)
+    return {
+        'nuclei_true': int(len(stack.centers)),
+        'nuclei_found': found,
+        'recall': float((hit > 0).mean()) if len(hit) else 1.0,
+        'merged': int((hit_counts > 1).sum()),
+        'false_positives': found - len(hit_ids),
+    }
+
+
+def engine_parity(reference, candidate):
+    """How far another engine's mask is from the standard one."""
+    differing = int(np.count_nonzero(reference != candidate))
+    union = int(np.count_nonzero(reference | candidate))
+    return {
+        'identical': differing == 0,
+        'differing_pixels': differing,
+        'iou': (union - differing) / union if union else 1.0,
+    }
+
+
+# ✅ ND2 Frame Access
+def nd2_frame_access(path, stack, repeat):
+    """Project a real ND2 file decoded by nd2reader and memory-mapped, and check the frames agree.
+
+    Every plane read through the memory map must equal both nd2reader's
+    decode and the generated stack. Returns (stage timings, parity).
+    """
+    from nd2reader import ND2Reader
+    from nd2frames import map_frames, MappedND2Reader
+    from projection import project_channels
+    z_levels, n_channels = stack.frames.shape[:2]
+    with ND2Reader(path) as decoded, map_frames(ND2Reader(path), path) as mapped:
+        differing = [
+            (z, c) for z in range(z_levels) for c in range(n_channels)
+            if not np.array_equal(mapped.get_frame_2D(c=c, z=z), decoded.get_frame_2D(c=c, z=z))
+            or not np.array_equal(mapped.get_frame_2D(c=c, z=z), stack.frames[z, c])
+        ]
+        stages = {
+            'nd2_decode': time_stage(lambda: project_channels(decoded, n_channels, z_levels), repeat)[0],
+            'nd2_memmap': time_stage(lambda: project_channels(mapped, n_channels, z_levels), repeat)[0],
+        }
+        parity = {
+            'mapped': isinstance(mapped, MappedND2Reader),
+            'identical': not differing,
+            'differing_planes': len(differing),
+        }
+    return stages, parity
+
+
+# ✅ Benchmark Cases
+def run_case(app, size, density, args):
+    """Time each stage for one image size and nuclei density."""
+    nuclei = int(density * size * size / 1e6)
+    stages = {}
+    stages['generate'], stack = time_stage(
+        lambda: synthetic_stack(size, nuclei, args.radius, args.z_levels, noise=args.noise, seed=args.seed), 1)
+    path = stack.save(os.path.join(app.UPLOAD_FOLDER, f'synthetic_{size}_{density}.nd2'))
+    seg_params = {**app.SEGMENTATION_DEFAULTS, 'engine': 'standard'}
+    fast_params = {**seg_params, 'engine': 'fast'}
+
+    stages['read_channels'], (channels, projections, _) = time_stage(lambda: app.read_channels(path), args.repeat)
+    dapi = projections[channels.index('DAPI')]
+    stages['segment_nuclei'], mask = time_stage(lambda: app.segment_nuclei(dapi, **seg_params), args.repeat)
+    stages['segment_nuclei_tiled'], tiled_mask = time_stage(
+        lambda: app.segment_nuclei(dapi, **seg_params, tile_size=args.tile_size), args.repeat)
+    stages['segment_nuclei_fast'], fast_mask = time_stage(lambda: app.segment_nuclei(dapi, **fast_params), args.repeat)
+    fast_tiled_mask = app.segment_nuclei(dapi, **fast_params, tile_size=args.tile_size)
+    stages['analyze_particles'], labeled = time_stage(
+        lambda: app.analyze_particles(mask, seg_params['min_size']), args.repeat)
+    stages['analyze_channels'], channel_data = time_stage(lambda: app.analyze_channels(path), args.repeat)
+    stages['measure_nuclei'], table = time_stage(lambda: app.measure_nuclei(channel_data), args.repeat)
+    nd2_path = stack.save_nd2(os.path.join(app.UPLOAD_FOLDER, f'synthetic_{size}_{density}_real.nd2'))
+    nd2_stages, nd2_parity = nd2_frame_access(nd2_path, stack, args.repeat)
+    stages.update(nd2_stages)
+    if not args.skip_http:
+        stages['http_upload'], http_result = time_stage(lambda: http_upload(app, path, fresh=True), args.repeat)
+        stages['http_upload_cached'], _ = time_stage(lambda: http_upload(app, path, fresh=False), args.repeat)
+    else:
+        http_result = None
+
+    case = {
+        'size': size,
+        'density': density,
+        'z_levels': args.z_levels,
+        'channels': len(channels),
+        'stages': stages,
+        'segmentation': {
+            **score_segmentation(labeled, stack),
+            'mask_sha256': mask_digest(mask),
+            'labels_sha256': mask_digest(labeled),
+            'tiled_matches_whole': bool(np.array_equal(mask, tiled_mask)),
+            'measured_rows': len(table),
+        },
+        'nd2_frames': nd2_parity,
+        'fast_engine': {
+            **engine_parity(mask, fast_mask),
+            'nuclei_found': int(app.analyze_particles(fast_mask, seg_params['min_size']).max()),
+            'tiled_matches_whole': bool(np.array_equal(fast_mask, fast_tiled_mask)),
+        },
+    }
+    if http_result is not None:
+        case['segmentation']['http_nuclei_count'] = http_result['nuclei_count']
+        case['server_profile'] = http_result.get('profile')
+    os.remove(path)
+    os.remove(nd2_path)
+    return case
+
+
+def http_upload(app, path, fresh):
+    """POST the file to /upload and wait for its result, like the frontend does.
+
+    A `fresh` upload empties the result cache first so the whole pipeline
+    runs; otherwise the upload is answered from the cache.
+    """
+    if fresh:
+        shutil.rmtree(app.CACHE_FOLDER, ignore_errors=True)
+    client = app.app.test_client()
+    with open(path, 'rb') as f:
+        response = client.post('/upload', data={'file': (f, os.path.basename(path))},
+                               content_type='multipart/form-data')
+    body = response.get_json()
+    if response.status_code == 200:
+        return body
+    if response.status_code != 202:
+        raise RuntimeError(f"Upload failed ({response.status_code}): {body}")
+    while True:
+        status = client.get(body['status_url']).get_json()
+        if status['status'] in ('done', 'failed'):
+            break
+        time.sleep(JOB_POLL_SECONDS)
+    result = client.get(body['result_url']).get_json()
+    if status['status'] == 'failed':
+        raise RuntimeError(f"Analysis failed: {result.get('error')}")
+    return result
+
+
+# ✅ Startup
+def measure_startup(backend_dir, repeat):
+    """Import the app and warm it up in fresh interpreters, as a web worker starts.
+
+    `warm_up_seconds` is the first pass over the tiny warm-up stack, which
+    pays for lazy imports and first-call setup; `warm_run_seconds` is the
+    same work once warm, so their difference is what warm-up saves the first
+    request.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, backend_dir],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {
+        name: {'min_seconds': min(r[name] for r in runs), 'median_seconds': statistics.median(r[name] for r in runs)}
+        for name in runs[0]
+    }
+
+
+# ✅ Baseline Comparison
+def compare(results, baseline, max_slowdown):
+    """Stage-by-stage speed ratios against an earlier run, plus any changed segmentation.
+
+    Returns (report lines, regressions).
+    """
+    lines, regressions = [], []
+    previous = {(c['size'], c['density']): c for c in baseline['cases']}
+    for case in results['cases']:
+        old = previous.get((case['size'], case['density']))
+        if old is None:
+            continue
+        label = f"{case['size']}px @ {case['density']}/MP"
+        for name, timing in case['stages'].items():
+            if name not in old['stages'] or name == 'generate':
+                continue
+            ratio = timing['min_seconds'] / max(old['stages'][name]['min_seconds'], 1e-9)
+            lines.append(f"{label:>18} {name:<22} {old['stages'][name]['min_seconds']:9.4f}s -> "
+                         f"{timing['min_seconds']:9.4f}s  x{ratio:.2f}")
+            if ratio > max_slowdown and timing['min_seconds'] >= MIN_COMPARABLE_SECONDS:
+                regressions.append(f"{label} {name} is {ratio:.2f}x slower")
+        for field in ('mask_sha256', 'labels_sha256', 'nuclei_found'):
+            if case['segmentation'][field] != old['segmentation'][field]:
+                regressions.append(f"{label} segmentation changed ({field})")
+    for name, timing in results.get('startup', {}).items():
+        old = baseline.get('startup', {}).get(name)
+        if old is None:
+            continue
+        ratio = timing['min_seconds'] / max(old['min_seconds'], 1e-9)
+        lines.append(f"{'startup':>18} {name:<22} {old['min_seconds']:9.4f}s -> {timing['min_seconds']:9.4f}s  x{ratio:.2f}")
+        if ratio > max_slowdown and timing['min_seconds'] >= MIN_COMPARABLE_SECONDS:
+            regressions.append(f"startup {name} is {ratio:.2f}x slower")
+    return lines, regressions
+
+
+# ✅ Command Line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ints = lambda text: tuple(int(v) for v in text.split(','))
+    parser.add_argument('--sizes', type=ints, default=DEFAULT_SIZES, help="image edge lengths, comma separated")
+    parser.add_argument('--densities', type=ints, default=DEFAULT_DENSITIES, help="nuclei per megapixel, comma separated")
+    parser.add_argument('--radius', type=float, default=10, help="nucleus radius in pixels")
+    parser.add_argument('--z-levels', type=int, default=5)
+    parser.add_argument('--noise', type=float, default=0.02, help="noise sigma as a fraction of peak intensity")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage (min and median reported)")
+    parser.add_argument('--tile-size', type=int, default=256, help="tile size for the tiled-segmentation stage")
+    parser.add_argument('--skip-http', action='store_true', help="don't time the /upload path")
+    parser.add_argument('--skip-startup', action='store_true', help="don't time app import and warm-up")
+    parser.add_argument('--min-fast-iou', type=float, default=0.999,
+                        help="fail when the fast engine's mask overlaps the standard one less than this")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="earlier results to compare against")
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help="with --baseline, fail when a stage gets this much slower")
+    return parser.parse_args(argv)
+
+
+def environment():
+    import scipy
+    import skimage
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'scikit_image': skimage.__version__,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        for folder in ('static/uploads', 'static/results'):
+            os.makedirs(folder)
+        results = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'environment': environment(),
+            'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+            'cases': [],
+        }
+        if not args.skip_startup:
+            # Before importing the app here, so nothing is cached in this process either
+            results['startup'] = measure_startup(backend_dir, args.repeat)
+            print('startup: ' + ', '.join(f"{name} {timing['min_seconds']:.3f}s"
+                                          for name, timing in results['startup'].items()))
+
+        sys.path.insert(0, backend_dir)
+        import app
+        app.ND2Reader = SyntheticND2Reader
+
+        try:
+            for size in args.sizes:
+                for density in args.densities:
+                    case = run_case(app, size, density, args)
+                    seg = case['segmentation']
+                    print(f"{size}px @ {density}/MP: {seg['nuclei_found']}/{seg['nuclei_true']} nuclei, "
+                          f"recall {seg['recall']:.3f}, tiled parity {seg['tiled_matches_whole']}, "
+                          f"segment {case['stages']['segment_nuclei']['min_seconds']:.3f}s, "
+                          f"fast {case['stages']['segment_nuclei_fast']['min_seconds']:.3f}s "
+                          f"(IoU {case['fast_engine']['iou']:.5f}), "
+                          f"nd2 decode {case['stages']['nd2_decode']['min_seconds']:.3f}s, "
+                          f"memmap {case['stages']['nd2_memmap']['min_seconds']:.3f}s")
+                    results['cases'].append(case)
+        finally:
+            app.jobs.shutdown()
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    failures = [
+        f"{c['size']}px @ {c['density']}/MP tiled segmentation differs from whole-image"
+        for c in results['cases'] if not c['segmentation']['tiled_matches_whole']
+    ] + [
+        f"{c['size']}px @ {c['density']}/MP fast engine mask differs in {c['fast_engine']['differing_pixels']} pixels"
+        for c in results['cases'] if c['fast_engine']['iou'] < args.min_fast_iou
+    ] + [
+        f"{c['size']}px @ {c['density']}/MP memory-mapped ND2 frames differ in {c['nd2_frames']['differing_planes']} planes"
+        for c in results['cases'] if not c['nd2_frames']['identical']
+    ] + [
+        f"{c['size']}px @ {c['density']}/MP ND2 file wasn't memory-mapped"
+        for c in results['cases'] if not c['nd2_frames']['mapped']
+    ]
+    if baseline is not None:
+        lines, regressions = compare(results, baseline, args.max_slowdown)
+        print('\n'.join(lines))
+        failures.extend(regressions)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import numpy as np
+from storage import shard_path, scan_items, item_path
+
+ENTRY_FILE = 'entry.json'
+
+
+# ✅ Content-Addressed Result Cache
+class ResultCache:
+    """On-disk cache of analysis artifacts keyed on file content and parameters.
+
+    Each entry is a directory holding `.npy` arrays (loadable memory-mapped),
+    any other files the pipeline writes (e.g. the measurements CSV) and an
+    `entry.json` with metadata. The mtime of `entry.json` is bumped on every
+    hit and used as the last-access time for LRU eviction once the cache
+    grows past `max_bytes`. Entries are staged in a temporary directory and
+    renamed into place, so readers never see a half-written entry. Entry
+    folders are sharded on the first hex digits of their key.
+
+    It is also a storage area for StorageManager (entries(), touch(),
+    remove()), which evicts entries against the budget for all stored data.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts):
+        """Stable key for any JSON-serializable combination of inputs."""
+        blob = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def entry_dir(self, key):
+        return shard_path(self.folder, key)
+
+    def path(self, key, name):
+        return os.path.join(self.entry_dir(key), name)
+
+    def get(self, key):
+        """Return the entry metadata and mark it as recently used, or None on a miss."""
+        # Keys are hex digests; anything else never names an entry
+        if not key or not all(ch in '0123456789abcdef' for ch in key):
+            return None
+        entry_file = self.path(key, ENTRY_FILE)
+        try:
+            with open(entry_file) as f:
+                entry = json.load(f)
+            os.utime(entry_file)
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable cache entry {key}: {e}")
+            return None
+
+    def load_array(self, key, name, mmap=True):
+        """Load a cached array, memory-mapped read-only by default."""
+        return np.load(self.path(key, f"{name}.npy"), mmap_mode='r' if mmap else None)
+
+    def staging_dir(self):
+        """Create a scratch directory to write a new entry's files into."""
+        path = os.path.join(self.folder, f".staging-{uuid.uuid4().hex}")
+        os.makedirs(path)
+        return path
+
+    def commit(self, key, staging, meta):
+        """Move a staged entry into place and evict old entries if over budget.
+
+        If another worker committed the same key first, the staged copy is
+        discarded and the existing entry wins.
+        """
+        size_bytes = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(staging) for name in files
+        )
+        entry = {**meta, 'key': key, 'size_bytes': size_bytes, 'created_at': time.time()}
+        with open(os.path.join(staging, ENTRY_FILE), 'w') as f:
+            json.dump(entry, f)
+
+        try:
+            os.makedirs(os.path.dirname(self.entry_dir(key)), exist_ok=True)
+            os.rename(staging, self.entry_dir(key))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            return self.get(key)
+
+        logging.info(f"Cached {key} ({size_bytes / 1e6:.1f} MB)")
+        self.evict(keep=key)
+        return entry
+
+    def entries(self):
+        """List (last_access, size_bytes, entry folder) for every committed entry."""
+        listing = []
+        for item in scan_items(self.folder):
+            entry_file = os.path.join(item.path, ENTRY_FILE)
+            try:
+                with open(entry_file) as f:
+                    size_bytes = json.load(f)['size_bytes']
+                listing.append((os.path.getmtime(entry_file), size_bytes, item.path))
+            except Exception:
+                continue
+        return listing
+
+    def touch(self, path):
+        """Mark the entry a file belongs to as used, e.g. when one of its files is downloaded."""
+        os.utime(os.path.join(item_path(self.folder, path), ENTRY_FILE))
+
+    def remove(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    def evict(self, keep=None):
+        """Delete least-recently-used entries until the cache fits in max_bytes."""
+        keep_dir = self.entry_dir(keep) if keep else None
+        with self._lock:
+            listing = sorted(self.entries())
+            total = sum(size for _, size, _ in listing)
+            for _, size, path in listing:
+                if total <= self.max_bytes:
+                    break
+                if path == keep_dir:
+                    continue
+                self.remove(path)
+                total -= size
+                logging.info(f"Evicted cache entry {os.path.basename(path)} ({size / 1e6:.1f} MB)")
@@ -0,0 +1,377 @@
+"""Analyze directories of ND2 files in place, without going through the web app.
+
+    python cli.py /data/plate1 /data/plate2 --output /data/results
+    python cli.py /microscope/export --output /data/results --watch
+
+Every file is read where it lies and its measurements (CSV, plus Parquet
+when pyarrow is installed), label images and the cell-cycle phase gates
+fitted to it are written to `<output>/<directory name>/<relative path>/`.
+Pass one of those `phase_gates.json` files with --phase-gates to gate a
+whole plate alike instead. Fields (positions and timepoints) are analyzed
+in parallel across files, so even a single multipoint plate keeps every
+--workers process busy. A manifest in the output
+folder records each file's size, mtime and analysis parameters, so a
+re-run only processes new or changed files. With --watch the directories
+are rescanned until interrupted, and a file is picked up once its size and
+mtime have stopped changing for --settle seconds, i.e. the microscope has
+finished writing it.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack
+
+# Set up logging before importing the app, whose own setup (an app.log file
+# in the current directory) only applies when nothing is configured yet
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+from app import (
+    ALLOWED_EXTENSIONS, PIPELINE_VERSION, PROJECTIONS, SEGMENTATION_DEFAULTS,
+    analyze_field, classify_staged, parse_seg_params, read_fields,
+)
+from phases import phase_features
+from exports import MeasurementWriter, ArrayArchive, field_array_name
+
+MANIFEST_FILE = 'manifest.json'
+DONE = 'done'
+FAILED = 'failed'
+
+
+# ✅ Manifest
+class Manifest:
+    """Record of processed files, keyed by absolute path, saved atomically after every change."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)['files']
+
+    def needs_processing(self, path, stat, params, retry_failed=False):
+        """True for files that are new, changed since they were processed, or had other parameters."""
+        entry = self.entries.get(path)
+        if entry is None or entry['params'] != params:
+            return True
+        if entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            return True
+        return entry['status'] == FAILED and retry_failed
+
+    def record(self, path, stat, params, **outcome):
+        self.entries[path] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'params': params,
+            'processed_at': time.time(),
+            **outcome,
+        }
+        self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'files': self.entries}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+# ✅ File Discovery
+def find_nd2_files(roots, recursive=True):
+    """Yield (root, path) for every ND2 file under the given directories, skipping hidden folders."""
+    for root in roots:
+        for folder, dirs, files in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.')) if recursive else []
+            for name in sorted(files):
+                if any(name.lower().endswith(ext) for ext in ALLOWED_EXTENSIONS) and not name.startswith('.'):
+                    yield root, os.path.join(folder, name)
+
+
+def output_dir_for(output, root, path):
+    """Where a file's results go: `<output>/<root name>/<path relative to root, without extension>`."""
+    relative = os.path.splitext(os.path.relpath(path, root))[0]
+    return os.path.join(output, os.path.basename(os.path.normpath(root)), relative)
+
+
+# ✅ Analysis
+class FileRun:
+    """One ND2 file whose fields are analyzed in parallel and merged in field order.
+
+    Field results may finish out of order; each is written once every
+    earlier field has been. Results waiting here count against the Runner's
+    window, so with the fields in flight at most --workers are held at once.
+    Outputs are written to a sibling `.partial` folder and swapped in at the
+    end, so an interrupted run never leaves half a result behind.
+    """
+
+    def __init__(self, path, stat, out_dir, fields, save_projections=False):
+        self.path = path
+        self.stat = stat
+        self.out_dir = out_dir
+        self.fields = fields
+        self.staging = out_dir + '.partial'
+        self.started = time.perf_counter()
+        self.features = []
+        self.failed = False
+        self._finished = {}
+        self._next = 0
+        shutil.rmtree(self.staging, ignore_errors=True)
+        os.makedirs(self.staging)
+        self._outputs = ExitStack()
+        self.writer = self._outputs.enter_context(MeasurementWriter(self.staging))
+        self.labels = self._outputs.enter_context(ArrayArchive(os.path.join(self.staging, 'labels.npz')))
+        self.archive = (self._outputs.enter_context(ArrayArchive(os.path.join(self.staging, 'projections.npz')))
+                        if save_projections else None)
+
+    @property
+    def buffered(self):
+        """Finished fields waiting for an earlier one before they can be written."""
+        return len(self._finished)
+
+    def add(self, index, result):
+        """Take the result of field `index`; returns True once every field has been written."""
+        self._finished[index] = result
+        while self._next in self._finished:
+            table, arrays, _ = self._finished.pop(self._next)
+            v, t = self.fields[self._next]
+            self.writer.write(table)
+            self.features.append(phase_features(table))
+            self.labels.add(field_array_name(v, t), arrays['labels'])
+            if self.archive is not None:
+                for channel, projected in arrays['projections'].items():
+                    self.archive.add(field_array_name(v, t, channel), projected)
+            self._next += 1
+        if self._next < len(self.fields):
+            return False
+        self._outputs.close()
+        return True
+
+    def abort(self):
+        self.failed = True
+        self._finished.clear()
+        self._outputs.close()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+    def outcome(self, counts):
+        return {
+            'output': self.out_dir,
+            'fields': len(self.fields),
+            'nuclei_count': self.writer.rows,
+            'phase_counts': counts,
+            'seconds': time.perf_counter() - self.started,
+        }
+
+
+def finish_file(staging, out_dir, features, phase_gates=None):
+    """Gate a file's merged measurements and swap its outputs into place; runs in a pool worker."""
+    try:
+        gates, counts = classify_staged(staging, features, phase_gates)
+        with open(os.path.join(staging, 'phase_gates.json'), 'w') as f:
+            json.dump(gates, f, indent=1)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(staging, out_dir)
+    return counts
+
+
+class Runner:
+    """Feed the fields of changed files to a process pool and record each file's outcome in the manifest.
+
+    Every (file, field) pair is its own task, so a single multipoint or
+    time-lapse file keeps every worker busy; a file's last task gates its
+    merged measurements. Fields are queued in file and field order and
+    submitted only while fewer than --workers fields are running or
+    finished but waiting to be written, which bounds the results in memory.
+    """
+
+    def __init__(self, pool, manifest, args, params):
+        self.pool = pool
+        self.manifest = manifest
+        self.args = args
+        self.params = params
+        self.in_flight = {}  # future -> (FileRun, field index, or None for the finishing task)
+        self.pending = deque()  # (FileRun, field index) not yet submitted
+        self.failures = 0
+
+    def submit(self, root, path, stat):
+        try:
+            fields = read_fields(path)
+            run = FileRun(path, stat, output_dir_for(self.args.output, root, path), fields, self.args.save_projections)
+        except Exception as e:
+            self.fail(path, stat, e)
+            return
+        self.pending.extend((run, index) for index in range(len(fields)))
+        self.fill()
+
+    def window_used(self):
+        """Fields running plus finished fields held until an earlier one is written."""
+        running = [run for run, index in self.in_flight.values() if index is not None]
+        return len(running) + sum(run.buffered for run in set(running))
+
+    def fill(self):
+        """Submit queued fields while the window of --workers fields has room."""
+        while self.pending and self.window_used() < max(1, self.args.workers):
+            run, index = self.pending.popleft()
+            if run.failed:
+                continue
+            future = self.pool.submit(analyze_field, run.path, self.args.projection, self.params['seg_params'],
+                                      run.fields[index])
+            self.in_flight[future] = (run, index)
+
+    def busy(self, path):
+        return any(run.path == path for run, _ in [*self.in_flight.values(), *self.pending])
+
+    def fail(self, path, stat, error):
+        self.failures += 1
+        self.manifest.record(path, stat, self.params, status=FAILED, error=str(error))
+        print(f"{path}: FAILED: {error}", file=sys.stderr)
+
+    def collect(self, futures):
+        for future in futures:
+            run, index = self.in_flight.pop(future)
+            if run.failed:
+                continue
+            try:
+                if index is None:
+                    self.succeed(run, future.result())
+                elif run.add(index, future.result()):
+                    finish = self.pool.submit(finish_file, run.staging, run.out_dir, run.features,
+                                              self.params.get('phase_gates'))
+                    self.in_flight[finish] = (run, None)
+            except Exception as e:
+                for other, (pending, _) in self.in_flight.items():
+                    if pending is run:
+                        other.cancel()
+                run.abort()
+                self.fail(run.path, run.stat, e)
+        self.fill()
+
+    def succeed(self, run, counts):
+        outcome = run.outcome(counts)
+        self.manifest.record(run.path, run.stat, self.params, status=DONE, error=None, **outcome)
+        phases = ', '.join(f"{phase} {n}" for phase, n in outcome['phase_counts'].items())
+        print(f"{run.path}: {outcome['nuclei_count']} nuclei in {outcome['fields']} field(s) ({phases}), "
+              f"{outcome['seconds']:.1f}s")
+
+    def collect_finished(self, timeout=None):
+        """Wait up to `timeout` seconds (default: as long as it takes) for tasks to finish, and collect them."""
+        done, _ = wait(list(self.in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+        self.collect(done)
+
+    def changed_files(self):
+        """(root, path, stat) of every file the manifest says needs processing."""
+        for root, path in find_nd2_files(self.args.directories, self.args.recursive):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if self.manifest.needs_processing(path, stat, self.params, self.args.retry_failed):
+                yield root, path, stat
+
+    def run_once(self):
+        """Process every new or changed file and wait for all of them."""
+        changed = list(self.changed_files())
+        print(f"{len(changed)} file(s) to process with {self.args.workers} worker(s)")
+        for root, path, stat in changed:
+            self.submit(root, path, stat)
+        while self.in_flight:
+            self.collect_finished()
+        return len(changed)
+
+    def watch(self):
+        """Rescan until interrupted, submitting files once they have settled."""
+        settling = {}
+        print(f"Watching {', '.join(self.args.directories)} (Ctrl-C to stop)")
+        while True:
+            now = time.time()
+            for root, path, stat in self.changed_files():
+                if self.busy(path):
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                seen = settling.get(path)
+                if seen is None or seen[0] != signature:
+                    settling[path] = (signature, now)
+                elif now - seen[1] >= self.args.settle:
+                    del settling[path]
+                    self.submit(root, path, stat)
+            if self.in_flight:
+                self.collect_finished(self.args.interval)
+            else:
+                time.sleep(self.args.interval)
+
+
+# ✅ Command Line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directories', nargs='+', help="directories of ND2 files, analyzed in place")
+    parser.add_argument('--output', required=True, help="folder for results and the manifest")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="fields analyzed in parallel")
+    parser.add_argument('--projection', default='max', choices=sorted(PROJECTIONS))
+    parser.add_argument('--engine', default=SEGMENTATION_DEFAULTS['engine'], help="segmentation engine")
+    parser.add_argument('--params', default='{}', help="segmentation parameters as JSON, e.g. '{\"sigma\": 3}'")
+    parser.add_argument('--no-recursive', dest='recursive', action='store_false', help="don't descend into subfolders")
+    parser.add_argument('--save-projections', action='store_true', help="also write projections.npz per file")
+    parser.add_argument('--phase-gates', help="phase_gates.json to apply to every file instead of fitting each one")
+    parser.add_argument('--retry-failed', action='store_true', help="re-run files that failed last time")
+    parser.add_argument('--watch', action='store_true', help="keep watching for new files")
+    parser.add_argument('--interval', type=float, default=5, help="seconds between rescans in watch mode")
+    parser.add_argument('--settle', type=float, default=30,
+                        help="seconds a file's size and mtime must stay unchanged before it is analyzed")
+    parser.add_argument('--verbose', action='store_true', help="log every pipeline step")
+    args = parser.parse_args(argv)
+    try:
+        args.seg_params = parse_seg_params({**json.loads(args.params), 'engine': args.engine})
+    except ValueError as e:  # also covers malformed JSON
+        parser.error(str(e))
+    if args.phase_gates:
+        try:
+            with open(args.phase_gates) as f:
+                args.phase_gates = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"Can't read phase gates: {e}")
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            parser.error(f"Not a directory: {directory}")
+    args.directories = [os.path.abspath(d) for d in args.directories]
+    args.output = os.path.abspath(args.output)
+    return args
+
+
+def stop(signum, frame):
+    """Treat SIGTERM (e.g. from a service manager) like Ctrl-C."""
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    os.makedirs(args.output, exist_ok=True)
+    manifest = Manifest(os.path.join(args.output, MANIFEST_FILE))
+    params = {'pipeline_version': PIPELINE_VERSION, 'projection': args.projection, 'seg_params': args.seg_params}
+    if args.phase_gates:
+        params['phase_gates'] = args.phase_gates
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        runner = Runner(pool, manifest, args, params)
+        if not args.watch:
+            runner.run_once()
+            return 1 if runner.failures else 0
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            runner.watch()
+        except KeyboardInterrupt:
+            # Interrupted files aren't in the manifest, so the next run picks them up again
+            print(f"Stopped; {len(runner.in_flight)} file(s) in progress will be redone next time")
+            pool.shutdown(wait=False, cancel_futures=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import mimetypes
+import os
+from flask import Response, request
+
+STREAM_CHUNK_BYTES = 256 * 1024
+
+mimetypes.add_type('application/vnd.apache.parquet', '.parquet')
+mimetypes.add_type('application/xml', '.dzi')
+
+
+# ✅ Streamed Downloads
+def read_chunks(f, start, length, chunk_bytes=STREAM_CHUNK_BYTES):
+    """Yield `length` bytes of an open file from `start`, one chunk at a time."""
+    f.seek(start)
+    while length > 0:
+        chunk = f.read(min(chunk_bytes, length))
+        if not chunk:
+            break
+        length -= len(chunk)
+        yield chunk
+
+
+def range_applies(etag, last_modified):
+    """False when an If-Range validator says the client's partial copy is stale."""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return int(if_range.date.timestamp()) == int(last_modified)
+    return True
+
+
+def stream_file(path):
+    """Stream a file in chunks, answering single byte-range and conditional requests.
+
+    Only the requested range is ever read, so resuming a large download or
+    seeking into a Parquet/npz file costs what it transfers. Multi-range
+    requests get the whole file, which RFC 9110 allows.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f"{stat.st_mtime_ns:x}-{size:x}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    start, stop, status = 0, size, 200
+    byte_range = request.range
+    if byte_range is not None and len(byte_range.ranges) == 1 and range_applies(etag, stat.st_mtime):
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            return Response(status=416, headers={'Content-Range': f"bytes */{size}"})
+        start, stop = bounds
+        status = 206
+
+    f = open(path, 'rb')
+    response = Response(
+        read_chunks(f, start, stop - start),
+        status=status,
+        mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        direct_passthrough=True,
+    )
+    response.call_on_close(f.close)
+    response.content_length = stop - start
+    response.accept_ranges = 'bytes'
+    if status == 206:
+        response.content_range = f"bytes {start}-{stop - 1}/{size}"
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    return response
@@ -0,0 +1,137 @@
+import logging
+import os
+import zipfile
+import numpy as np
+from metrics import stage
+
+PARQUET_COMPRESSION = os.environ.get('PARQUET_COMPRESSION', 'zstd')
+# zlib level 1 is several times faster than numpy's default of 6 and
+# compresses label images almost as well
+ARRAY_COMPRESSLEVEL = int(os.environ.get('ARRAY_COMPRESSLEVEL', 1))
+
+
+def field_array_name(v, t, channel=None):
+    """Array name for one field (and channel) in the exported .npz files."""
+    name = f"P{v}_T{t}"
+    return f"{name}_{channel}" if channel else name
+
+
+def parquet_modules():
+    """(pyarrow, pyarrow.parquet), imported on first use, or None when pyarrow isn't installed."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:  # Parquet output is skipped; CSV is always written
+        return None
+    return pa, pq
+
+
+# ✅ Measurement Tables
+class MeasurementWriter:
+    """Append measurement tables to a CSV and, when pyarrow is installed, a Parquet file.
+
+    Tables are written as they arrive, so a multi-field analysis never holds
+    every field in memory; each table becomes one Parquet row group.
+    """
+
+    def __init__(self, folder, name='measurements', compression=PARQUET_COMPRESSION):
+        self.csv_path = os.path.join(folder, f"{name}.csv")
+        self._arrow = parquet_modules()
+        self.parquet_path = os.path.join(folder, f"{name}.parquet") if self._arrow is not None else None
+        self.compression = compression
+        self.rows = 0
+        self.tables = 0
+        self._csv = open(self.csv_path, 'w', newline='')
+        self._parquet = None
+
+    def write(self, table):
+        with stage('csv_write'):
+            table.to_csv(self._csv, header=(self.tables == 0), index=False)
+        if self.parquet_path is not None:
+            with stage('parquet_write'):
+                pa, pq = self._arrow
+                batch = pa.Table.from_pandas(table, preserve_index=False)
+                if self._parquet is None:
+                    self._parquet = pq.ParquetWriter(self.parquet_path, batch.schema, compression=self.compression)
+                else:
+                    # An empty field can infer different column types; keep the first schema
+                    batch = batch.cast(self._parquet.schema)
+                self._parquet.write_table(batch)
+        self.rows += len(table)
+        self.tables += 1
+
+    def close(self):
+        self._csv.close()
+        if self._parquet is not None:
+            self._parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_measurements(folder, name='measurements', chunk_rows=100000):
+    """Yield a written measurement table back in pieces: one per Parquet row group, else CSV chunks."""
+    import pandas as pd
+    parquet_path = os.path.join(folder, f"{name}.parquet")
+    arrow = parquet_modules()
+    if arrow is not None and os.path.exists(parquet_path):
+        source = arrow[1].ParquetFile(parquet_path)
+        for i in range(source.num_row_groups):
+            yield source.read_row_group(i).to_pandas()
+        return
+    yield from pd.read_csv(os.path.join(folder, f"{name}.csv"), chunksize=chunk_rows)
+
+
+def rewrite_measurements(folder, transform, name='measurements'):
+    """Pass a written measurement table through transform(table) piece by piece and replace it.
+
+    For columns that depend on every row, e.g. phase gates fitted to all
+    fields of a file, without holding all rows in memory at once.
+    """
+    with stage('measurements_rewrite'):
+        with MeasurementWriter(folder, f"{name}.rewrite") as writer:
+            for table in read_measurements(folder, name):
+                writer.write(transform(table))
+        if writer.tables == 0:  # nothing was read back (an empty CSV); keep the original
+            for path in (writer.csv_path, writer.parquet_path):
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+            return writer
+        os.replace(writer.csv_path, os.path.join(folder, f"{name}.csv"))
+        if writer.parquet_path is not None:
+            os.replace(writer.parquet_path, os.path.join(folder, f"{name}.parquet"))
+    return writer
+
+
+# ✅ Compressed Arrays
+class ArrayArchive:
+    """A compressed .npz written one array at a time.
+
+    np.load reads it exactly like np.savez_compressed output, but arrays can
+    be added as each field finishes instead of all at once at the end.
+    """
+
+    def __init__(self, path, compresslevel=ARRAY_COMPRESSLEVEL):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel, allowZip64=True)
+
+    def add(self, name, array):
+        try:
+            with stage('array_write'):
+                with self._zip.open(f"{name}.npy", 'w', force_zip64=True) as f:
+                    np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+        except Exception as e:
+            logging.error(f"Array export error ({name}): {str(e)}")
+            raise
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
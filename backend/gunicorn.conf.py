@@ -0,0 +1,42 @@
+"""Gunicorn settings: one threaded worker, warmed up before taking traffic.
+
+    gunicorn --config backend/gunicorn.conf.py app:app
+
+Job records, batches and /metrics counters live in the memory of the web
+process, so there is exactly one worker (WEB_CONCURRENCY is ignored); a
+status poll landing on another worker would answer "Unknown job". Requests
+are served concurrently by WEB_THREADS threads, and the analyses themselves
+run in that worker's process pool (ANALYSIS_WORKERS), so one web process
+still uses every core.
+
+With preload_app the master imports app.py and runs warm_up() once, then
+forks the worker, which starts with every library already imported. Set
+PRELOAD_APP=0 to import and warm up in the worker instead (e.g. to pick up
+code changes with a HUP reload), and WARM_UP=0 to skip the warm-up.
+"""
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+workers = 1
+threads = int(os.environ.get('WEB_THREADS', 8))
+timeout = 90
+preload_app = os.environ.get('PRELOAD_APP', '1') != '0'
+warm_up = os.environ.get('WARM_UP', '1') != '0'
+
+
+def _warm_up(log):
+    import app
+    if warm_up:
+        app.warm_up()
+    log.info(f"App ready: import {app.startup['import_seconds']:.2f}s, "
+             f"warm-up {app.startup['warm_up_seconds']:.2f}s")
+
+
+def when_ready(server):
+    if preload_app:
+        _warm_up(server.log)
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        _warm_up(worker.log)
@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# ✅ Job States
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _run_job(fn, args, kwargs):
+    """Run a job inside a pool worker and report when it actually started."""
+    started_at = time.time()
+    return started_at, fn(*args, **kwargs)
+
+
+# ✅ Job Manager
+class JobManager:
+    """Run analyses on a bounded local process pool and track their status.
+
+    Job records live in this process's memory, so every status poll must
+    reach the web process that submitted the job: the app runs a single
+    threaded gunicorn worker (see gunicorn.conf.py).
+    """
+
+    def __init__(self, max_workers=2, retention_seconds=86400, on_finish=None):
+        self.max_workers = max_workers
+        self.retention_seconds = retention_seconds
+        self.on_finish = on_finish
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """Create the pool lazily so a worker forked from a preloaded master doesn't inherit it."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _reset_executor(self, broken):
+        """Drop a pool whose worker died (e.g. OOM-killed) so the next job gets a fresh one.
+
+        Every job queued on a broken pool fails, one callback after another,
+        and a new pool may already be running jobs by the time the later ones
+        arrive; only the pool that actually broke is shut down. Call with the
+        lock held.
+        """
+        if broken is not None and self._executor is broken:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _prune(self):
+        """Forget finished jobs older than the retention window."""
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] is not None and job['finished_at'] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) on the worker pool and return its job id."""
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'status': QUEUED,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+            'future': None,
+            'executor': None,
+            'callbacks': [],
+        }
+        with self._lock:
+            self._prune()
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_run_job, fn, args, kwargs)
+            except BrokenProcessPool:
+                logging.warning("Worker pool was broken, starting a new one")
+                self._reset_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(_run_job, fn, args, kwargs)
+            job['future'] = future
+            job['executor'] = executor
+            self._jobs[job_id] = job
+
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        logging.info(f"Job {job_id} queued")
+        return job_id
+
+    def _finish(self, job_id, future):
+        """Record the outcome of a job once its future resolves."""
+        finished_at = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finished_at'] = finished_at
+            job['future'] = None
+            executor, job['executor'] = job['executor'], None
+            callbacks, job['callbacks'] = job['callbacks'], []
+            if self.on_finish is not None:
+                callbacks.insert(0, self.on_finish)
+            try:
+                job['started_at'], job['result'] = future.result()
+                job['status'] = DONE
+                logging.info(f"Job {job_id} done in {finished_at - job['started_at']:.2f}s")
+            except BrokenProcessPool as e:
+                job['status'] = FAILED
+                job['error'] = "Analysis worker crashed (possibly out of memory)"
+                logging.error(f"Job {job_id} failed: {str(e)}")
+                self._reset_executor(executor)
+            except Exception as e:
+                job['status'] = FAILED
+                job['error'] = str(e)
+                logging.error(f"Job {job_id} failed: {str(e)}")
+
+        self._run_callbacks(job_id, callbacks)
+
+    def _run_callbacks(self, job_id, callbacks):
+        for callback in callbacks:
+            try:
+                callback(job_id)
+            except Exception as e:
+                logging.error(f"Job {job_id} callback failed: {str(e)}")
+
+    def watch(self, job_id, callback):
+        """Call callback(job_id) once the job has finished (immediately if it already has)."""
+        with self._lock:
+            job = self._jobs[job_id]
+            if job['finished_at'] is None:
+                job['callbacks'].append(callback)
+                return
+        self._run_callbacks(job_id, [callback])
+
+    def get(self, job_id):
+        """Return a JSON-serializable status snapshot of a job, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+
+            status = job['status']
+            if status == QUEUED and job['future'] is not None and job['future'].running():
+                status = RUNNING
+
+            now = time.time()
+            started_at = job['started_at']
+            finished_at = job['finished_at']
+            return {
+                'job_id': job_id,
+                'status': status,
+                'submitted_at': job['submitted_at'],
+                'started_at': started_at,
+                'finished_at': finished_at,
+                'queue_seconds': (started_at - job['submitted_at']) if started_at else None,
+                'run_seconds': (finished_at - started_at) if started_at and finished_at else None,
+                'elapsed_seconds': (finished_at or now) - job['submitted_at'],
+                'error': job['error'],
+            }
+
+    def result(self, job_id):
+        """Return the result of a finished job, or None if it isn't done."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != DONE:
+                return None
+            return job['result']
+
+    def shutdown(self):
+        """Stop the worker pool, waiting for running jobs to finish."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,262 @@
+import bisect
+import contextvars
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+_current_profiler = contextvars.ContextVar('current_profiler', default=None)
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(2 ** p for p in range(20, 36))  # 1MB .. 32GB
+COUNT_BUCKETS = (0, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+PIXEL_BUCKETS = tuple(4 ** p for p in range(8, 15))  # 256^2 .. 16384^2 pixels
+
+
+# ✅ Peak RSS
+def _read_peak_rss():
+    """Peak resident set size of this process in bytes (VmHWM, or ru_maxrss elsewhere)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _reset_peak_rss():
+    """Reset the kernel's peak-RSS counter so the next reading covers one stage only.
+
+    Only possible on Linux (writing 5 to clear_refs); elsewhere peaks are
+    process-lifetime high-water marks.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+# ✅ Stage Profiler
+class StageProfiler:
+    """Collect wall time, CPU time and peak RSS for each pipeline stage of one analysis.
+
+    The peak-RSS counter belongs to the whole process, and resetting it for
+    one stage wipes the peak of any other stage running alongside. So peak
+    RSS is only tracked (`track_rss`) where one analysis has the process to
+    itself, in the job and field worker processes; stages run on web
+    request threads leave `peak_rss_bytes` out.
+    """
+
+    def __init__(self, track_rss=False):
+        self.track_rss = track_rss
+        self.stages = []
+        self.info = {}
+        self._open = []
+
+    @contextmanager
+    def stage(self, name):
+        if self.track_rss:
+            peak_before = _read_peak_rss()
+            for frame in self._open:
+                frame['peak'] = max(frame['peak'], peak_before)
+            _reset_peak_rss()
+
+        frame = {'peak': 0}
+        self._open.append(frame)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._open.pop()
+            record = {'stage': name, 'wall_seconds': wall, 'cpu_seconds': cpu}
+            if self.track_rss:
+                frame['peak'] = max(frame['peak'], _read_peak_rss())
+                for outer in self._open:
+                    outer['peak'] = max(outer['peak'], frame['peak'])
+                record['peak_rss_bytes'] = frame['peak']
+            self.stages.append(record)
+
+    def annotate(self, **info):
+        """Attach facts about the input (image size, nuclei count, ...) to the profile."""
+        self.info.update(info)
+
+    def extend(self, profile):
+        """Fold in stages profiled elsewhere, e.g. by a field worker process."""
+        self.stages.extend(profile['stages'])
+        for name, value in profile['info'].items():
+            self.info.setdefault(name, value)
+
+    def to_dict(self):
+        return {'stages': list(self.stages), 'info': dict(self.info)}
+
+
+@contextmanager
+def profiling(profiler=None, track_rss=False):
+    """Make `profiler` (or a new one) the active one for stage()/annotate() calls in this context."""
+    profiler = profiler or StageProfiler(track_rss)
+    token = _current_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _current_profiler.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage on the active profiler; a no-op when none is active."""
+    profiler = _current_profiler.get()
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+def annotate(**info):
+    """Record input facts on the active profiler, if any."""
+    profiler = _current_profiler.get()
+    if profiler is not None:
+        profiler.annotate(**info)
+
+
+def merge_profile(profile):
+    """Fold a profile collected in another process into the active profiler, if any."""
+    profiler = _current_profiler.get()
+    if profiler is not None:
+        profiler.extend(profile)
+
+
+# ✅ Prometheus Metrics
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format."""
+
+    def __init__(self, name, help_text, buckets, label_name=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_name = label_name
+        self._series = {}
+
+    def observe(self, value, label=None):
+        counts, totals = self._series.setdefault(label, ([0] * (len(self.buckets) + 1), [0.0, 0]))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label, (counts, (total, count)) in sorted(self._series.items(), key=lambda item: str(item[0])):
+            prefix = f'{self.label_name}="{label}",' if self.label_name else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f'{{{prefix.rstrip(",")}}}' if prefix else ''
+            lines.append(f"{self.name}_sum{suffix} {total:g}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter, optionally split by one label."""
+
+    def __init__(self, name, help_text, label_name=None):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self._values = {}
+
+    def inc(self, amount=1, label=None):
+        self._values[label] = self._values.get(label, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+            suffix = f'{{{self.label_name}="{label}"}}' if self.label_name else ''
+            lines.append(f"{self.name}{suffix} {value:g}")
+        return lines
+
+
+class Gauge:
+    """Point-in-time value read from a callback whenever metrics are rendered."""
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {self.read():.15g}"]
+
+
+class PipelineMetrics:
+    """Aggregate per-analysis profiles into histograms served from /metrics.
+
+    Everything is kept in this process's memory. Analyses running in the
+    job pool report back through their results, so the web process sees
+    them all, but a second web worker would keep its own counts and a
+    scrape would only see one of them: the app runs a single threaded
+    gunicorn worker (see gunicorn.conf.py).
+    """
+
+    def __init__(self, prefix='cellphase'):
+        self._lock = threading.Lock()
+        self.stage_wall = Histogram(f'{prefix}_stage_wall_seconds', 'Wall time per pipeline stage', TIME_BUCKETS, 'stage')
+        self.stage_cpu = Histogram(f'{prefix}_stage_cpu_seconds', 'CPU time per pipeline stage', TIME_BUCKETS, 'stage')
+        self.stage_rss = Histogram(f'{prefix}_stage_peak_rss_bytes', 'Peak RSS per pipeline stage', BYTES_BUCKETS, 'stage')
+        self.image_pixels = Histogram(f'{prefix}_image_pixels', 'Pixels per projected image plane', PIXEL_BUCKETS)
+        self.nuclei = Histogram(f'{prefix}_nuclei_per_analysis', 'Nuclei found per analysis', COUNT_BUCKETS)
+        self.input_bytes = Histogram(f'{prefix}_input_bytes', 'Size of analyzed files', BYTES_BUCKETS)
+        self.bytes_processed = Counter(f'{prefix}_bytes_processed_total', 'Bytes of ND2 data analyzed')
+        self.analyses = Counter(f'{prefix}_analyses_total', 'Finished analyses by outcome', 'status')
+        self.prefix = prefix
+        self.gauges = []
+
+    def add_gauge(self, name, help_text, read):
+        """Expose read() as `<prefix>_<name>` on every scrape."""
+        self.gauges.append(Gauge(f'{self.prefix}_{name}', help_text, read))
+
+    def record_stages(self, stages):
+        with self._lock:
+            for s in stages:
+                self.stage_wall.observe(s['wall_seconds'], s['stage'])
+                self.stage_cpu.observe(s['cpu_seconds'], s['stage'])
+                if 'peak_rss_bytes' in s:
+                    self.stage_rss.observe(s['peak_rss_bytes'], s['stage'])
+
+    def record_profile(self, profile, status='done'):
+        """Record one analysis' profile (as produced by StageProfiler.to_dict)."""
+        self.record_stages(profile.get('stages', []))
+        info = profile.get('info', {})
+        with self._lock:
+            self.analyses.inc(label=status)
+            if 'width' in info and 'height' in info:
+                self.image_pixels.observe(info['width'] * info['height'])
+            if 'nuclei_count' in info:
+                self.nuclei.observe(info['nuclei_count'])
+            if 'input_bytes' in info:
+                self.input_bytes.observe(info['input_bytes'])
+                self.bytes_processed.inc(info['input_bytes'])
+
+    def record_outcome(self, status):
+        """Count an analysis that produced no profile (failed, or answered from cache)."""
+        with self._lock:
+            self.analyses.inc(label=status)
+
+    def render(self):
+        """All metrics in Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for metric in (self.stage_wall, self.stage_cpu, self.stage_rss, self.image_pixels,
+                           self.nuclei, self.input_bytes, self.bytes_processed, self.analyses):
+                lines.extend(metric.render())
+            for gauge in self.gauges:
+                lines.extend(gauge.render())
+            return '\n'.join(lines) + '\n'
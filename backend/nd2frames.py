@@ -0,0 +1,141 @@
+import logging
+import os
+import re
+import struct
+import numpy as np
+
+CHUNK_MAGIC = 0xabeceda
+CHUNK_HEADER = struct.Struct('<IIQ')  # magic, bytes from the header's end to the data, data length
+TIMESTAMP_BYTES = 8  # every image chunk starts with its acquisition time as a double
+PIXEL_DTYPE = np.dtype('<u2')  # nd2reader reads every image as 16-bit, so parity means 16-bit only
+IMAGE_LABEL = re.compile(rb'ImageDataSeq\|(\d+)!')
+
+
+# ✅ Chunk Index
+def index_image_chunks(path):
+    """Byte offset and length of every image group's pixel data, as {group: (offset, length)}.
+
+    The chunk map sits at the end of the file (its offset is the last 8
+    bytes) and points at one `ImageDataSeq|<n>!` chunk per (t, v, z) group;
+    each chunk's 16-byte header says where its data starts. Only the map and
+    the headers are read, never the pixels.
+    """
+    with open(path, 'rb') as f:
+        f.seek(-8, os.SEEK_END)
+        map_start, = struct.unpack('<Q', f.read(8))
+        f.seek(map_start)
+        chunk_map = f.read()
+        chunks = {}
+        for match in IMAGE_LABEL.finditer(chunk_map):
+            location, _ = struct.unpack_from('<QQ', chunk_map, match.end())
+            f.seek(location)
+            magic, relative_offset, length = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+            if magic != CHUNK_MAGIC:
+                raise ValueError(f"Image chunk {match.group(1).decode()} at byte {location} has no chunk header")
+            chunks[int(match.group(1))] = (location + CHUNK_HEADER.size + relative_offset, length)
+    return chunks
+
+
+def frame_itemsize(reader):
+    """Bytes per pixel of the frames a reader returns, from the ND2 header's bits per component.
+
+    nd2reader 3.3's `pixel_type` is float64 whatever the file holds, while
+    the frames it decodes are 16-bit; readers without an ND2 parser (the
+    mapped and the synthetic one) report their real frame dtype.
+    """
+    parser = getattr(reader, 'parser', None)
+    if parser is None:
+        return np.dtype(reader.pixel_type).itemsize
+    bits = parser._raw_metadata.image_attributes[b'SLxImageAttributes'][b'uiBpcInMemory']
+    return -(-bits // 8)
+
+
+def plain_layout(chunks, metadata, sizes):
+    """Components per pixel when every image chunk holds plain interleaved 16-bit pixels, else None.
+
+    Compressed chunks, other bit depths, padded (stitched) rows and missing
+    or extra groups all fail one of these checks.
+    """
+    groups = sizes.get('t', 1) * sizes.get('v', 1) * sizes.get('z', 1)
+    if len(chunks) != groups or set(chunks) != set(range(groups)):
+        return None
+    lengths = {length for _, length in chunks.values()}
+    plane_bytes = metadata['height'] * metadata['width'] * PIXEL_DTYPE.itemsize
+    if len(lengths) != 1 or plane_bytes == 0:
+        return None
+    components, remainder = divmod(lengths.pop() - TIMESTAMP_BYTES, plane_bytes)
+    if remainder or components < sizes.get('c', 1):
+        return None
+    return components
+
+
+# ✅ Mapped Reader
+class MappedND2Reader:
+    """An open ND2Reader whose frames are views into a memory map of the file.
+
+    Metadata (sizes, channel names) still comes from the reader. An image
+    group stores the channels of one (t, v, z) plane interleaved pixel by
+    pixel, so a frame is a strided (y, x) view into the group: nothing is
+    decoded or copied, all channels of a plane come from the same pages,
+    and the OS page cache shares those pages between every process reading
+    the file. Frames are read-only.
+
+    The first frame read is compared with the reader's own decode; if they
+    differ, every frame is read through the reader instead.
+    """
+
+    def __init__(self, reader, path, chunks, components):
+        self.reader = reader
+        self.sizes = reader.sizes
+        self.metadata = reader.metadata
+        self.pixel_type = PIXEL_DTYPE  # nd2reader's own pixel_type is always float64
+        self._chunks = chunks
+        self._shape = (self.metadata['height'], self.metadata['width'], components)
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+        self._verified = False
+
+    def group(self, t=0, v=0, z=0):
+        """Image group of a plane, in the order ND2 acquires them: t, then v, then z."""
+        return (t * self.sizes.get('v', 1) + v) * self.sizes.get('z', 1) + z
+
+    def mapped_frame(self, c=0, t=0, z=0, v=0):
+        offset, _ = self._chunks[self.group(t, v, z)]
+        pixels = np.ndarray(self._shape, dtype=PIXEL_DTYPE, buffer=self._data, offset=offset + TIMESTAMP_BYTES)
+        return pixels[:, :, c]
+
+    def get_frame_2D(self, c=0, t=0, z=0, x=0, y=0, v=0):
+        if self._data is None:
+            return self.reader.get_frame_2D(c=c, t=t, z=z, v=v)
+        frame = self.mapped_frame(c=c, t=t, z=z, v=v)
+        if not self._verified:
+            decoded = self.reader.get_frame_2D(c=c, t=t, z=z, v=v)
+            if not np.array_equal(frame, decoded):
+                logging.warning(f"Memory-mapped frames of {self.reader.filename} differ from nd2reader's; decoding instead")
+                self._data = None
+                return decoded
+            self._verified = True
+        return frame
+
+    def close(self):
+        self._data = None
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def map_frames(reader, path):
+    """A MappedND2Reader over an open ND2Reader, or the reader itself when the file can't be mapped."""
+    try:
+        chunks = index_image_chunks(path)
+        components = plain_layout(chunks, reader.metadata, reader.sizes)
+    except Exception as e:
+        logging.warning(f"ND2 chunk index error, decoding frames instead: {str(e)}")
+        return reader
+    if components is None:
+        logging.info(f"{os.path.basename(path)} isn't plain 16-bit image data; decoding frames with nd2reader")
+        return reader
+    return MappedND2Reader(reader, path, chunks, components)
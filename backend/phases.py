@@ -0,0 +1,182 @@
+import logging
+import os
+import numpy as np
+
+PHASES = ('G1', 'S', 'G2/M')
+PHASE_MARKER = os.environ.get('PHASE_MARKER', 'PCNA')  # channel whose texture marks S phase
+HISTOGRAM_BINS = 128
+HISTOGRAM_SMOOTHING = 2.0  # gaussian sigma, in bins
+MIN_NUCLEI_FOR_GATES = 50
+G2_SEARCH = (0.75, 1.25)  # log2 distance from the G1 peak searched for the G2/M peak (1.7x-2.4x DNA)
+GATE_SIGMAS = 2.0  # G1 and G2/M gates reach this many peak widths out from each peak
+MIN_MARKER_SEPARATION = 0.75  # Otsu between-class variance share needed to trust a marker gate
+
+
+# ✅ Phase Features
+def marker_channel(columns, marker=PHASE_MARKER):
+    """Name of the measured channel that matches the marker (e.g. 'mPCNAr' for PCNA), or None."""
+    if not marker:
+        return None
+    for column in columns:
+        if column.endswith('_Std_Intensity') and marker.lower() in column.lower():
+            return column[:-len('_Std_Intensity')]
+    return None
+
+
+def feature_columns(columns, marker=PHASE_MARKER):
+    """Measurement columns the phase features are computed from."""
+    channel = marker_channel(columns, marker)
+    extra = [f'{channel}_Mean_Intensity', f'{channel}_Std_Intensity'] if channel else []
+    return ['DNA_Content'] + extra
+
+
+def phase_features(table, marker=PHASE_MARKER):
+    """(DNA content, marker texture or None) for every nucleus in a measurement table.
+
+    DNA content is the background-corrected integrated DAPI intensity of the
+    DAPI sum projection. The marker texture is the log of the marker's
+    coefficient of variation inside the nucleus: PCNA gathers into
+    replication foci during S phase, so S nuclei have a much patchier signal
+    than G1 or G2 nuclei.
+    """
+    dna = table['DNA_Content'].to_numpy(dtype=np.float64)
+    channel = marker_channel(table.columns, marker)
+    if channel is None:
+        return dna, None
+    mean = table[f'{channel}_Mean_Intensity'].to_numpy(dtype=np.float64)
+    std = table[f'{channel}_Std_Intensity'].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        texture = np.log(std / mean)
+    return dna, texture
+
+
+# ✅ Gate Fitting
+def _smoothed_histogram(values, bins, lo, hi):
+    counts, edges = np.histogram(values, bins=bins, range=(lo, hi))
+    radius = int(4 * HISTOGRAM_SMOOTHING)
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / HISTOGRAM_SMOOTHING) ** 2)
+    smoothed = np.convolve(counts, kernel / kernel.sum(), mode='same')
+    return smoothed, (edges[:-1] + edges[1:]) / 2
+
+
+def otsu_threshold(values, bins=256):
+    """Otsu's threshold and its separation (between-class over total variance, 0-1)."""
+    counts, edges = np.histogram(values, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    weight_low = np.cumsum(counts)[:-1]
+    weight_high = len(values) - weight_low
+    sum_low = np.cumsum(counts * centers)[:-1]
+    mean_low = sum_low / np.maximum(weight_low, 1)
+    mean_high = (np.sum(counts * centers) - sum_low) / np.maximum(weight_high, 1)
+    between = weight_low * weight_high * (mean_low - mean_high) ** 2 / len(values) ** 2
+    best = int(np.argmax(between))
+    total = np.var(values)
+    return float(edges[best + 1]), float(between[best] / total) if total > 0 else 0.0
+
+
+def fit_gates(dna, texture=None, marker=None):
+    """Fit G1/S/G2-M gates to the DNA-content histogram of a population.
+
+    The tallest peak of the (log2) histogram is G1; G2/M is the highest
+    local maximum 1.7-2.4x further right, or exactly 2x when there is none.
+    Peak width comes from the left flank of the G1 peak, which S-phase
+    nuclei don't overlap, and each gate reaches GATE_SIGMAS widths out from
+    its peak; nuclei between the two gates are in S. With a marker texture,
+    an Otsu threshold on it is added when the texture is clearly bimodal.
+    The returned gates are plain numbers, so they can be saved as JSON and
+    applied to other files with assign_phases().
+    """
+    dna = np.asarray(dna, dtype=np.float64)
+    valid = np.isfinite(dna) & (dna > 0)
+    if valid.sum() < MIN_NUCLEI_FOR_GATES:
+        raise ValueError(f"Need at least {MIN_NUCLEI_FOR_GATES} nuclei to fit phase gates, got {int(valid.sum())}")
+
+    log_dna = np.log2(dna[valid])
+    lo, hi = np.percentile(log_dna, (0.5, 99.5))
+    smoothed, centers = _smoothed_histogram(log_dna, HISTOGRAM_BINS, lo, hi + 1e-9)
+    g1_index = int(np.argmax(smoothed))
+    g1 = centers[g1_index]
+
+    window = np.flatnonzero((centers >= g1 + G2_SEARCH[0]) & (centers <= g1 + G2_SEARCH[1]))
+    g2 = g1 + 1
+    if window.size:
+        candidate = window[np.argmax(smoothed[window])]
+        if 0 < candidate < len(smoothed) - 1 and smoothed[candidate] >= smoothed[[candidate - 1, candidate + 1]].max():
+            g2 = centers[candidate]
+
+    below_half = np.flatnonzero(smoothed[:g1_index] < smoothed[g1_index] / 2)
+    half_width = g1 - centers[below_half[-1]] if below_half.size else (g2 - g1) / 4
+    sigma = half_width / np.sqrt(2 * np.log(2))
+    midpoint = (g1 + g2) / 2
+    gates = {
+        'g1_peak': float(2 ** g1),
+        'g2_peak': float(2 ** g2),
+        'g1_max': float(2 ** min(g1 + GATE_SIGMAS * sigma, midpoint)),
+        'g2m_min': float(2 ** max(g2 - GATE_SIGMAS * sigma, midpoint)),
+        'marker': None,
+        'marker_threshold': None,
+        'nuclei': int(valid.sum()),
+    }
+
+    if texture is not None:
+        texture = np.asarray(texture, dtype=np.float64)[valid]
+        texture = texture[np.isfinite(texture)]
+        if texture.size >= MIN_NUCLEI_FOR_GATES:
+            threshold, separation = otsu_threshold(texture)
+            if separation >= MIN_MARKER_SEPARATION:
+                gates['marker'] = marker
+                gates['marker_threshold'] = threshold
+            else:
+                logging.info(f"Marker {marker} isn't bimodal (separation {separation:.2f}); gating on DNA content only")
+    return gates
+
+
+def fit_population(features, marker=PHASE_MARKER):
+    """Gates fitted to the phase_features() of several tables at once, or None if there are too few nuclei.
+
+    Fitting a whole file (every field) or a whole batch (every file) once
+    gives every nucleus the same gates.
+    """
+    dna = np.concatenate([d for d, _ in features]) if features else np.zeros(0)
+    textures = [t for _, t in features]
+    texture = np.concatenate(textures) if textures and all(t is not None for t in textures) else None
+    try:
+        return fit_gates(dna, texture, marker)
+    except ValueError as e:
+        logging.warning(f"Phase gates not fitted: {str(e)}")
+        return None
+
+
+# ✅ Phase Assignment
+def assign_phases(dna, gates, texture=None):
+    """Phase of every nucleus as an index into PHASES, in one vectorized pass."""
+    index = np.searchsorted([gates['g1_max'], gates['g2m_min']], np.asarray(dna, dtype=np.float64), side='right')
+    if texture is not None and gates.get('marker_threshold') is not None:
+        index[np.asarray(texture) > gates['marker_threshold']] = 1
+    return index
+
+
+def classify(table, gates):
+    """Add `DNA_Content_N` (DNA content in chromosome sets, G1 = 2N) and `Phase` columns to a table.
+
+    Without gates (too few nuclei to fit them) both columns are left empty,
+    so every measurement table has the same columns.
+    """
+    if gates is None:
+        table['DNA_Content_N'] = np.nan
+        table['Phase'] = ''
+        return table
+    dna, texture = phase_features(table, gates.get('marker'))
+    table['DNA_Content_N'] = 2 * dna / gates['g1_peak']
+    table['Phase'] = np.asarray(PHASES)[assign_phases(dna, gates, texture)]
+    return table
+
+
+def phase_counts(phases, counts=None):
+    """Number of nuclei per phase, added onto `counts` when tallying a table chunk by chunk."""
+    counts = counts if counts is not None else dict.fromkeys(PHASES, 0)
+    values, found = np.unique(np.asarray(phases, dtype=str), return_counts=True)
+    for phase, n in zip(values.tolist(), found.tolist()):
+        if phase in counts:
+            counts[phase] += n
+    return counts
@@ -0,0 +1,125 @@
+import logging
+import numpy as np
+
+
+# ✅ Projection Reducers
+class MaxProjection:
+    """Maximum intensity projection, reduced in place in the frame's native dtype."""
+
+    def __init__(self, frame):
+        self.acc = np.array(frame, copy=True)
+
+    def add(self, frame, z):
+        np.maximum(self.acc, frame, out=self.acc)
+
+    def result(self):
+        return self.acc
+
+
+class SumProjection:
+    """Sum of all z-planes in float32: half the size of float64, and exact for up to 256 uint16 planes."""
+
+    def __init__(self, frame):
+        self.acc = np.array(frame, dtype=np.float32, copy=True)
+        self.count = 1
+
+    def add(self, frame, z):
+        np.add(self.acc, frame, out=self.acc)
+        self.count += 1
+
+    def result(self):
+        return self.acc
+
+
+class MeanProjection(SumProjection):
+    """Average over z-planes."""
+
+    def result(self):
+        return self.acc / self.count
+
+
+class BestFocusProjection:
+    """Keep the single sharpest z-plane, scored by variance of the Laplacian."""
+
+    def __init__(self, frame):
+        self.acc = np.array(frame, copy=True)
+        self.score = self._focus_score(frame)
+        self.best_z = 0
+
+    @staticmethod
+    def _focus_score(frame):
+        from scipy import ndimage as ndi
+        return float(ndi.laplace(np.asarray(frame, dtype=np.float32)).var())
+
+    def add(self, frame, z):
+        score = self._focus_score(frame)
+        if score > self.score:
+            np.copyto(self.acc, frame)
+            self.score = score
+            self.best_z = z
+
+    def result(self):
+        return self.acc
+
+
+PROJECTIONS = {
+    'max': MaxProjection,
+    'mean': MeanProjection,
+    'sum': SumProjection,
+    'best_focus': BestFocusProjection,
+}
+
+
+# ✅ Binning
+def bin_frame(frame, factor):
+    """Downsample a frame by averaging factor x factor blocks; a ragged edge is dropped."""
+    if factor <= 1:
+        return frame
+    height, width = frame.shape[0] // factor, frame.shape[1] // factor
+    blocks = np.asarray(frame[:height * factor, :width * factor], dtype=np.float32)
+    return blocks.reshape(height, factor, width, factor).mean(axis=(1, 3), dtype=np.float32)
+
+
+# ✅ Single-Pass Projection
+def project_channels(images, n_channels, z_levels, method='max', v=0, t=0,
+                     z_step=1, bin_factor=1, channel_indices=None, extra=None):
+    """Project every channel of an ND2 z-stack in one pass over the file.
+
+    Planes are visited z-major, channel-minor, which is how ND2 stores them
+    (all channels of a plane share one image chunk), and each frame is folded
+    into a preallocated per-channel accumulator as soon as it is read. Only
+    c accumulators of (y, x) are ever held, never the whole (z, y, x) stack.
+    `v` and `t` pick the field of view and timepoint. Returns a list with one
+    2D projection per channel index.
+
+    For previews, `z_step` reads only every n-th plane, `bin_factor` bins
+    each frame before it is reduced, and `channel_indices` limits (and
+    orders) the channels that are read.
+
+    `extra` maps channel indices to further projection methods computed in
+    the same pass from the same frames, e.g. {dapi: 'sum'} next to a max
+    projection; their results follow the channel projections in the list.
+    """
+    plan = [(c, method) for c in (range(n_channels) if channel_indices is None else channel_indices)]
+    plan += list((extra or {}).items())
+    for _, name in plan:
+        if name not in PROJECTIONS:
+            raise ValueError(f"Unknown projection '{name}', expected one of {sorted(PROJECTIONS)}")
+
+    read_order = list(dict.fromkeys(c for c, _ in plan))
+    reducers = [None] * len(plan)
+    try:
+        for z in range(0, z_levels, max(1, z_step)):
+            for c in read_order:
+                frame = bin_frame(images.get_frame_2D(z=z, c=c, v=v, t=t), bin_factor)
+                for i, (channel, name) in enumerate(plan):
+                    if channel != c:
+                        continue
+                    if reducers[i] is None:
+                        reducers[i] = PROJECTIONS[name](frame)
+                    else:
+                        reducers[i].add(frame, z)
+        return [r.result() for r in reducers]
+    except Exception as e:
+        logging.error(f"Projection error: {str(e)}")
+        raise
@@ -0,0 +1,182 @@
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+TILE_SIZE = 256
+DISPLAY_SAMPLE_PIXELS = 1024 * 1024  # pixels sampled to pick each channel's display range
+OVERVIEW_PIXELS = 2048 * 2048  # levels up to this size are rendered from one in-memory downsampled copy
+STRIP_ROWS = 1024
+OUTLINE_COLOR = (255, 255, 0)
+CHANNEL_COLORS = {
+    'DAPI': (0, 110, 255),
+}
+FALLBACK_COLORS = [(0, 255, 0), (255, 0, 0), (255, 0, 255), (0, 255, 255), (255, 160, 0)]
+TILE_FORMATS = {'jpeg': ('jpeg', {'quality': 85}), 'png': ('png', {})}
+
+
+# ✅ Display Scaling
+def display_range(image):
+    """2nd/98th percentile of an image, from a strided sample so huge scans stay cheap."""
+    step = max(1, int(math.sqrt(image.size / DISPLAY_SAMPLE_PIXELS)))
+    sample = np.asarray(image[::step, ::step])
+    lo, hi = np.percentile(sample, (2, 98))
+    return float(lo), float(max(hi, lo + 1e-12))
+
+
+def channel_colors(names):
+    """RGB color per channel: DAPI blue, the others from a fixed palette."""
+    palette = iter(FALLBACK_COLORS * (len(names) // len(FALLBACK_COLORS) + 1))
+    return [CHANNEL_COLORS.get(name) or next(palette) for name in names]
+
+
+def downsample(image, factor):
+    """Block-mean downsample to ceil(h/factor) x ceil(w/factor); ragged edge blocks average what they have."""
+    image = np.asarray(image, dtype=np.float32)
+    if factor <= 1:
+        return image
+    rows = np.arange(0, image.shape[0], factor)
+    cols = np.arange(0, image.shape[1], factor)
+    sums = np.add.reduceat(np.add.reduceat(image, rows, axis=0), cols, axis=1)
+    row_counts = np.diff(np.append(rows, image.shape[0]))
+    col_counts = np.diff(np.append(cols, image.shape[1]))
+    return sums / np.outer(row_counts, col_counts).astype(np.float32)
+
+
+def downsample_strips(image, factor):
+    """downsample() of a possibly memory-mapped image, a strip of rows at a time."""
+    strip = factor * max(1, STRIP_ROWS // factor)
+    return np.concatenate([downsample(image[y:y + strip], factor) for y in range(0, image.shape[0], strip)])
+
+
+# ✅ Overlay Rendering
+def label_outlines(labeled):
+    """Pixels of each nucleus that touch background or another nucleus (4-connected)."""
+    edge = np.zeros(labeled.shape, dtype=bool)
+    vertical = labeled[1:] != labeled[:-1]
+    edge[1:] |= vertical
+    edge[:-1] |= vertical
+    horizontal = labeled[:, 1:] != labeled[:, :-1]
+    edge[:, 1:] |= horizontal
+    edge[:, :-1] |= horizontal
+    return edge & (labeled > 0)
+
+
+def composite(channels, ranges, colors):
+    """Additive uint8 RGB composite of intensity images, each stretched to its display range."""
+    rgb = np.zeros(channels[0].shape + (3,), dtype=np.float32)
+    for image, (lo, hi), color in zip(channels, ranges, colors):
+        scaled = np.clip((np.asarray(image, dtype=np.float32) - lo) / (hi - lo), 0, 1)
+        rgb += scaled[..., None] * np.asarray(color, dtype=np.float32)
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+def render_overlay(channels, ranges, colors, labeled=None):
+    """Channel composite with nucleus outlines drawn over it."""
+    rgb = composite(channels, ranges, colors)
+    if labeled is not None:
+        rgb[label_outlines(labeled)] = OUTLINE_COLOR
+    return rgb
+
+
+# ✅ Tile Pyramid
+def pyramid_levels(width, height):
+    """Deep Zoom levels: level L is the image scaled by 2**(L - max_level), down to 1x1."""
+    max_level = math.ceil(math.log2(max(width, height, 1)))
+    return [
+        {
+            'level': level,
+            'scale': 2 ** (max_level - level),
+            'width': math.ceil(width / 2 ** (max_level - level)),
+            'height': math.ceil(height / 2 ** (max_level - level)),
+        }
+        for level in range(max_level + 1)
+    ]
+
+
+def render_tile(channels, ranges, colors, labeled, level, tx, ty, tile_size):
+    """Render one pyramid tile straight from the full-resolution arrays.
+
+    Intensities are block-averaged over the tile's source region; labels are
+    sampled every `scale` pixels with a one-sample halo so outlines that
+    cross tile seams are still drawn.
+    """
+    s = level['scale']
+    y0, x0 = ty * tile_size, tx * tile_size
+    y1, x1 = min(y0 + tile_size, level['height']), min(x0 + tile_size, level['width'])
+    region = (slice(y0 * s, y1 * s), slice(x0 * s, x1 * s))
+    rgb = composite([downsample(image[region], s) for image in channels], ranges, colors)
+
+    if labeled is not None:
+        hy0, hx0 = max(y0 - 1, 0), max(x0 - 1, 0)
+        hy1, hx1 = min(y1 + 1, level['height']), min(x1 + 1, level['width'])
+        sampled = np.asarray(labeled[hy0 * s:hy1 * s:s, hx0 * s:hx1 * s:s])
+        outlines = label_outlines(sampled)[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+        rgb[outlines] = OUTLINE_COLOR
+    return rgb
+
+
+def write_pyramid(folder, name, channels, names, labeled=None, tile_size=TILE_SIZE, tile_format='jpeg', workers=1):
+    """Write a Deep Zoom (DZI) tile pyramid of the outlined channel composite.
+
+    Tiles go to `<name>_files/<level>/<col>_<row>.<ext>` with a `<name>.dzi`
+    descriptor, the layout OpenSeadragon and similar viewers load lazily.
+    Tiles of the detailed levels are rendered straight from the
+    full-resolution (possibly memory-mapped) arrays, so no full-size RGB
+    image is ever held in memory; the coarser levels all come from one
+    downsampled overview of at most OVERVIEW_PIXELS. Returns the
+    descriptor's path.
+    """
+    try:
+        height, width = channels[0].shape
+        ranges = [display_range(image) for image in channels]
+        colors = channel_colors(names)
+        pil_format, save_options = TILE_FORMATS[tile_format]
+        extension = 'jpg' if tile_format == 'jpeg' else tile_format
+
+        levels = pyramid_levels(width, height)
+        overview = max((level for level in levels if level['width'] * level['height'] <= OVERVIEW_PIXELS),
+                       key=lambda level: level['level'])
+        overview_channels = [downsample_strips(image, overview['scale']) for image in channels]
+        overview_labels = None if labeled is None else labeled[::overview['scale'], ::overview['scale']]
+
+        tiles = []
+        for level in levels:
+            level_dir = os.path.join(folder, f'{name}_files', str(level['level']))
+            os.makedirs(level_dir)
+            for ty in range(math.ceil(level['height'] / tile_size)):
+                for tx in range(math.ceil(level['width'] / tile_size)):
+                    tiles.append((level, tx, ty, os.path.join(level_dir, f'{tx}_{ty}.{extension}')))
+
+        from PIL import Image
+
+        def write(tile):
+            level, tx, ty, path = tile
+            if level['scale'] >= overview['scale']:
+                level = {**level, 'scale': level['scale'] // overview['scale']}
+                rgb = render_tile(overview_channels, ranges, colors, overview_labels, level, tx, ty, tile_size)
+            else:
+                rgb = render_tile(channels, ranges, colors, labeled, level, tx, ty, tile_size)
+            Image.fromarray(rgb).save(path, pil_format, **save_options)
+
+        if workers <= 1:
+            for tile in tiles:
+                write(tile)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(write, tiles))
+
+        descriptor = os.path.join(folder, f'{name}.dzi')
+        with open(descriptor, 'w') as f:
+            f.write(
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{extension}" '
+                f'Overlap="0" TileSize="{tile_size}">\n'
+                f'  <Size Width="{width}" Height="{height}"/>\n'
+                '</Image>\n'
+            )
+        return descriptor
+    except Exception as e:
+        logging.error(f"Pyramid rendering error: {str(e)}")
+        raise
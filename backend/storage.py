@@ -0,0 +1,262 @@
+import fcntl
+import logging
+import os
+import shutil
+import threading
+import time
+
+SHARD_WIDTH = 2  # leading hex digits of an item's id: 256 subfolders per area
+TOUCH_INTERVAL = 60  # seconds; repeat accesses to one item within this don't touch the disk again
+
+
+# ✅ Sharded Layout
+def shard(token):
+    """Subfolder name for an item whose id (a hex digest or uuid) is `token`."""
+    return token[:SHARD_WIDTH]
+
+
+def shard_path(folder, name, token=None):
+    """`folder/<shard>/name`, sharded on `token` (default: the name itself, when it is a hex id)."""
+    return os.path.join(folder, shard(token or name), name)
+
+
+def scan_items(folder):
+    """Yield a DirEntry for every item stored in a sharded folder.
+
+    Items directly in `folder` (from before sharding) are listed too, so
+    they age out like everything else. Hidden entries (upload sessions,
+    staging folders, the lock file) are never items.
+    """
+    try:
+        top = list(os.scandir(folder))
+    except FileNotFoundError:
+        return
+    for entry in top:
+        if entry.name.startswith('.'):
+            continue
+        if len(entry.name) == SHARD_WIDTH and entry.is_dir():
+            try:
+                yield from (item for item in os.scandir(entry.path) if not item.name.startswith('.'))
+            except FileNotFoundError:
+                continue
+        else:
+            yield entry
+
+
+def tree_size(path):
+    """Bytes used by the files in a folder (recursively)."""
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path) for name in files
+    )
+
+
+def item_path(folder, path):
+    """The item (file or folder) under a sharded `folder` that `path` belongs to, or None."""
+    relative = os.path.relpath(os.path.normpath(path), os.path.normpath(folder))
+    parts = relative.split(os.sep)
+    if parts[0] in ('.', '..'):
+        return None
+    depth = 2 if len(parts[0]) == SHARD_WIDTH and len(parts) > 1 else 1
+    return os.path.join(folder, *parts[:depth])
+
+
+# ✅ Storage Areas
+class FileArea:
+    """A sharded folder where every file is one item, e.g. raw uploads.
+
+    A file's mtime is its last access: writing to it or touch() bumps it.
+    `exclude()` returns paths to leave alone, such as half-finished uploads.
+    """
+
+    def __init__(self, folder, exclude=None):
+        self.folder = folder
+        self.exclude = exclude
+
+    def entries(self):
+        excluded = {os.path.normpath(p) for p in self.exclude()} if self.exclude else set()
+        listing = []
+        for item in scan_items(self.folder):
+            try:
+                if not item.is_file() or os.path.normpath(item.path) in excluded:
+                    continue
+                stat = item.stat()
+            except FileNotFoundError:
+                continue
+            listing.append((stat.st_mtime, stat.st_size, item.path))
+        return listing
+
+    def touch(self, path):
+        os.utime(path)
+
+    def remove(self, path):
+        os.remove(path)
+
+
+class DirectoryArea:
+    """A sharded folder where every subfolder is one item, e.g. a batch's merged outputs."""
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def entries(self):
+        listing = []
+        for item in scan_items(self.folder):
+            try:
+                if item.is_dir():
+                    listing.append((item.stat().st_mtime, tree_size(item.path), item.path))
+            except FileNotFoundError:
+                continue
+        return listing
+
+    def touch(self, path):
+        os.utime(path)
+
+    def remove(self, path):
+        shutil.rmtree(path)
+
+
+# ✅ Storage Manager
+class StorageManager:
+    """Keep uploads, cached results and derived artifacts within one disk budget.
+
+    Every area lists its items with their size and last access time. A
+    background thread sweeps them every `interval` seconds (or sooner when
+    asked) and deletes the least recently used items across all areas until
+    the total fits in `max_bytes`. Items used within the last `min_age`
+    seconds are never evicted, which protects uploads that are still queued
+    for analysis in other processes (e.g. the CLI); pin() protects an item
+    in this process for as long as it is held. Sweeps from different processes are
+    serialized through a lock file so they don't evict the same bytes twice.
+    """
+
+    def __init__(self, max_bytes, min_age=3600, interval=60, lock_path='.storage.lock'):
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.interval = interval
+        self.lock_path = lock_path
+        self.areas = {}
+        self.evicted_bytes = 0
+        self._usage = {}
+        self._pins = {}
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def add_area(self, name, area):
+        """Register an area: any object with `folder`, entries(), touch(path) and remove(path)."""
+        self.areas[name] = area
+        self._usage[name] = 0
+
+    # Access tracking
+    def touch(self, path):
+        """Mark the item that `path` belongs to as just used, at most once per TOUCH_INTERVAL."""
+        for area in self.areas.values():
+            item = item_path(area.folder, path)
+            if item is None:
+                continue
+            now = time.time()
+            with self._lock:
+                if now - self._touched.get(item, 0) < TOUCH_INTERVAL:
+                    return
+                self._touched[item] = now
+            try:
+                area.touch(item)
+            except FileNotFoundError:
+                pass
+            return
+
+    def pin(self, path):
+        """Keep `path` from being evicted by this process until unpin()."""
+        path = os.path.normpath(path)
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+
+    def unpin(self, path):
+        path = os.path.normpath(path)
+        with self._lock:
+            count = self._pins.get(path, 0) - 1
+            if count > 0:
+                self._pins[path] = count
+            else:
+                self._pins.pop(path, None)
+
+    # Eviction
+    def sweep(self):
+        """Measure every area and evict least-recently-used items until under budget; returns bytes freed."""
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            listing = []
+            usage = {}
+            for name, area in self.areas.items():
+                entries = area.entries()
+                usage[name] = sum(size for _, size, _ in entries)
+                listing.extend((last_access, size, path, name) for last_access, size, path in entries)
+
+            total = sum(usage.values())
+            freed = 0
+            cutoff = time.time() - self.min_age
+            with self._lock:
+                pinned = set(self._pins)
+            for last_access, size, path, name in sorted(listing):
+                if total <= self.max_bytes or last_access >= cutoff:
+                    break
+                if os.path.normpath(path) in pinned:
+                    continue
+                try:
+                    self.areas[name].remove(path)
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    logging.warning(f"Could not evict {path}: {e}")
+                    continue
+                total -= size
+                freed += size
+                usage[name] -= size
+                logging.info(f"Evicted {name} item {path} ({size / 1e6:.1f} MB, "
+                             f"idle {(time.time() - last_access) / 3600:.1f}h)")
+
+        with self._lock:
+            self._usage = usage
+            self.evicted_bytes += freed
+            self._touched = {item: at for item, at in self._touched.items() if time.time() - at < TOUCH_INTERVAL}
+        if total > self.max_bytes:
+            logging.warning(f"Storage over budget: {total / 1e6:.0f}/{self.max_bytes / 1e6:.0f} MB, "
+                            f"the rest was used within the last {self.min_age}s")
+        return freed
+
+    def usage(self):
+        """Bytes per area as of the last sweep."""
+        with self._lock:
+            return dict(self._usage)
+
+    # Background sweeper
+    def request_sweep(self):
+        """Sweep now instead of at the next interval, e.g. after writing a large result."""
+        self._wake.set()
+
+    def ensure_running(self):
+        """Start the sweeper thread in this process; cheap to call on every request.
+
+        Threads don't survive fork, so a gunicorn worker forked from a
+        preloaded master starts its own on its first request.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        for area in self.areas.values():
+            os.makedirs(area.folder, exist_ok=True)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Storage sweep error: {str(e)}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,197 @@
+import struct
+import zlib
+import numpy as np
+
+SYNTHETIC_BACKGROUND = 200
+SYNTHETIC_PEAK = 3000
+
+
+# ✅ Synthetic Stacks
+class SyntheticStack:
+    """A generated (z, c, y, x) stack with the nuclei that were drawn into it."""
+
+    def __init__(self, frames, channels, labels, centers):
+        self.frames = frames
+        self.channels = list(channels)
+        self.labels = labels
+        self.centers = centers
+
+    def save(self, path):
+        """Write the stack as an uncompressed .npz that SyntheticND2Reader can open."""
+        with open(path, 'wb') as f:
+            np.savez(f, frames=self.frames, channels=np.array(self.channels), labels=self.labels, centers=self.centers)
+        return path
+
+    def save_nd2(self, path):
+        """Write the stack as a real, uncompressed 16-bit ND2 file that nd2reader can open."""
+        write_nd2(path, self.frames, self.channels)
+        return path
+
+
+def place_nuclei(rng, size, count, radius):
+    """Random nucleus centers at least 2.6 radii apart (fewer than `count` if the image is full)."""
+    min_dist = 2.6 * radius
+    margin = radius + 1
+    centers = []
+    cell = min_dist / np.sqrt(2)
+    grid = {}
+    attempts = 0
+    while len(centers) < count and attempts < count * 50:
+        attempts += 1
+        y, x = rng.uniform(margin, size - margin, 2)
+        gy, gx = int(y // cell), int(x // cell)
+        near = (
+            grid.get((gy + dy, gx + dx))
+            for dy in (-2, -1, 0, 1, 2) for dx in (-2, -1, 0, 1, 2)
+        )
+        if any(c is not None and (c[0] - y) ** 2 + (c[1] - x) ** 2 < min_dist ** 2 for c in near):
+            continue
+        grid[(gy, gx)] = (y, x)
+        centers.append((y, x))
+    return np.array(centers, dtype=np.float64).reshape(-1, 2)
+
+
+def synthetic_stack(size=1024, nuclei=200, radius=10, z_levels=5, channels=('DAPI', 'PCNA'),
+                    noise=0.02, seed=0, dtype=np.uint16):
+    """Generate nuclei as Gaussian blobs across z and c, with their ground-truth labels.
+
+    Each nucleus is a blob with sigma = radius / 2 whose brightness peaks at a
+    random focal plane and falls off over the other z-levels. The first
+    channel is the nuclear stain; the others get a random per-nucleus
+    expression level (like PCNA). Gaussian noise of `noise` times the peak
+    intensity is added on top of a flat background. The truth labels are the
+    discs of `radius` around each center.
+    """
+    rng = np.random.default_rng(seed)
+    centers = place_nuclei(rng, size, nuclei, radius)
+    n = len(centers)
+    n_channels = len(channels)
+    sigma = radius / 2
+    half = int(np.ceil(3 * sigma))
+
+    focus = rng.uniform(0, max(z_levels - 1, 0), n)
+    brightness = rng.uniform(0.6, 1.0, n)
+    expression = np.ones((n, n_channels))
+    expression[:, 1:] = rng.uniform(0.05, 1.0, (n, n_channels - 1))
+
+    frames = np.zeros((z_levels, n_channels, size, size), dtype=np.float32)
+    labels = np.zeros((size, size), dtype=np.int32)
+    offsets = np.arange(-half, half + 1)
+    for i, (y, x) in enumerate(centers):
+        cy, cx = int(round(y)), int(round(x))
+        ys, xs = slice(max(cy - half, 0), min(cy + half + 1, size)), slice(max(cx - half, 0), min(cx + half + 1, size))
+        dy = (offsets + cy - y)[ys.start - (cy - half):ys.stop - (cy - half)]
+        dx = (offsets + cx - x)[xs.start - (cx - half):xs.stop - (cx - half)]
+        dist2 = dy[:, None] ** 2 + dx[None, :] ** 2
+        blob = np.exp(-dist2 / (2 * sigma ** 2)).astype(np.float32)
+        labels[ys, xs][dist2 <= radius ** 2] = i + 1
+        for z in range(z_levels):
+            z_weight = np.exp(-(z - focus[i]) ** 2 / 2)
+            for c in range(n_channels):
+                frames[z, c, ys, xs] += blob * (brightness[i] * expression[i, c] * z_weight)
+
+    frames *= SYNTHETIC_PEAK
+    frames += SYNTHETIC_BACKGROUND
+    frames += rng.normal(0, noise * SYNTHETIC_PEAK, frames.shape).astype(np.float32)
+    info = np.iinfo(dtype) if np.issubdtype(dtype, np.integer) else None
+    if info is not None:
+        np.clip(frames, info.min, info.max, out=frames)
+    return SyntheticStack(frames.astype(dtype), channels, labels, centers)
+
+
+# ✅ ND2 Writer
+ND2_CHUNK_ALIGNMENT = 4096
+ND2_MAX_CHANNELS = 5
+LV_TYPES = {int: 2, str: 8, dict: 11}
+
+
+def _lv_string(text):
+    return (text + '\0').encode('utf-16-le')
+
+
+def _lv_items(items):
+    """Encode a dict in the ND2 'LV' metadata format (only the value types nd2reader needs)."""
+    encoded = b''
+    for name, value in items.items():
+        header = struct.pack('BB', LV_TYPES[type(value)], len(name) + 1) + _lv_string(name)
+        if isinstance(value, dict):
+            children = _lv_items(value)
+            encoded += header + struct.pack('<IQ', len(value), len(header) + 12 + len(children)) + children
+            encoded += bytes(8 * len(value))
+        elif isinstance(value, str):
+            encoded += header + _lv_string(value)
+        else:
+            encoded += header + struct.pack('<I', value)
+    return encoded
+
+
+def write_nd2(path, frames, channels, row_padding=0, compress=False):
+    """Write a (z, c, y, x) uint16 stack as a minimal ND2 (v3.0) file.
+
+    Each z-plane is one image chunk with the channels interleaved per pixel,
+    after an 8-byte timestamp, the way NIS-Elements stores uncompressed
+    data; the chunk map at the end of the file points at every chunk.
+    `row_padding` appends that many zero pixels to every row, like stitched
+    files, and `compress` zlib-compresses the pixels, for testing readers
+    against layouts they can't map.
+    """
+    z_levels, n_channels, height, width = frames.shape
+    if n_channels > ND2_MAX_CHANNELS:
+        # Without a channel validity list nd2reader keeps one channel per sPicturePlanes entry
+        raise ValueError(f"Can write at most {ND2_MAX_CHANNELS} channels, got {n_channels}")
+    metadata = {
+        'ImageAttributesLV!': {'SLxImageAttributes': {
+            'uiWidth': width, 'uiWidthBytes': width * n_channels * 2, 'uiHeight': height, 'uiComp': n_channels,
+            'uiBpcInMemory': 16, 'uiBpcSignificant': 16, 'uiSequenceCount': z_levels, 'eCompression': 0 if compress else 2,
+        }},
+        'ImageTextInfoLV!': {'SLxImageTextInfo': {'TextInfoItem_5': f'Dimensions: Z({z_levels})'}},
+        'ImageMetadataSeqLV|0!': {'SLxPictureMetadata': {'sPicturePlanes': {
+            'uiCount': n_channels, 'uiCompCount': n_channels, 'uiSampleCount': 1,
+            'sSampleSetting': {f'a{i}': {'uiModeFQ': 0} for i in range(n_channels)},
+            'sPlaneNew': {f'a{i}': {'sDescription': name} for i, name in enumerate(channels)},
+        }}},
+    }
+    chunks = [(name, _lv_items(items)) for name, items in metadata.items()]
+    for z in range(z_levels):
+        rows = frames[z].astype('<u2').transpose(1, 2, 0).reshape(height, width * n_channels)
+        pixels = np.pad(rows, ((0, 0), (0, row_padding))).tobytes()
+        chunks.append((f'ImageDataSeq|{z}!', struct.pack('<d', 0.0) + (zlib.compress(pixels) if compress else pixels)))
+
+    with open(path, 'wb') as f:
+        f.write(bytes(16) + b'ND2 FILE SIGNATURE CHUNK NAME01!Ver3.0')
+        chunk_map = b''
+        for name, data in chunks:
+            f.write(bytes(-f.tell() % ND2_CHUNK_ALIGNMENT))
+            location = f.tell()
+            label = name.encode()
+            f.write(struct.pack('<IIQ', 0xabeceda, len(label), len(data)) + label + data)
+            chunk_map += label + struct.pack('<QQ', location, len(data))
+        map_start = f.tell()
+        f.write(chunk_map + struct.pack('<Q', map_start))
+    return path
+
+
+# ✅ ND2Reader Stand-In
+class SyntheticND2Reader:
+    """Read a saved SyntheticStack through the subset of the ND2Reader API the pipeline uses."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.frames = data['frames']
+            channels = [str(c) for c in data['channels']]
+        z_levels, n_channels, height, width = self.frames.shape
+        self.sizes = {'x': width, 'y': height, 'z': z_levels, 'c': n_channels, 't': 1, 'v': 1}
+        self.metadata = {'channels': channels}
+        self.pixel_type = self.frames.dtype
+
+    def get_frame_2D(self, c=0, t=0, z=0, x=0, y=0, v=0):
+        return self.frames[z, c]
+
+    def close(self):
+        self.frames = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,7 @@
+import logging
+import os
+import sys
+
+# Log to the console before app.py is imported, so its app.log file handler is never set up
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,16 @@
+from nd2reader import ND2Reader
+
+from app import estimate_images, estimate_upload
+from nd2frames import frame_itemsize
+from synthetic import SyntheticND2Reader, synthetic_stack
+
+
+def test_estimate_is_the_same_through_nd2reader_and_the_synthetic_reader(tmp_path):
+    stack = synthetic_stack(size=128, nuclei=12, radius=6, z_levels=3, channels=('DAPI', 'PCNA', 'EdU'), seed=2)
+    nd2_path = stack.save_nd2(str(tmp_path / 'stack.nd2'))
+    with ND2Reader(nd2_path) as images:
+        # nd2reader calls every file float64; the header and the frames say 16-bit
+        assert frame_itemsize(images) == images.get_frame_2D(c=0, z=0).dtype.itemsize == 2
+    with SyntheticND2Reader(stack.save(str(tmp_path / 'stack.npz'))) as images:
+        synthetic = estimate_images(images)
+    assert estimate_upload(nd2_path) == synthetic
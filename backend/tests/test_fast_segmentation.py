@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scipy import ndimage as ndi
+from skimage.filters import gaussian
+from skimage.morphology import binary_closing, binary_opening, disk
+
+import fast_segmentation
+from app import clean_mask_global, segment_nuclei
+from synthetic import synthetic_stack
+
+RADII = [0, 1, 2, 3, 5, 8]
+
+
+@pytest.fixture(scope='module')
+def binary():
+    """Noisy blobs with holes, specks and objects touching the border."""
+    rng = np.random.default_rng(3)
+    smooth = ndi.gaussian_filter(rng.normal(size=(181, 203)), 3)
+    return (smooth > 0.02) ^ (rng.random(smooth.shape) < 0.03)
+
+
+@pytest.fixture(scope='module')
+def dapi():
+    stack = synthetic_stack(size=320, nuclei=90, radius=8, z_levels=3, seed=11)
+    return stack.frames[:, 0].max(axis=0)
+
+
+@pytest.mark.parametrize('radius', RADII)
+def test_disk_morphology_matches_skimage(binary, radius):
+    np.testing.assert_array_equal(fast_segmentation.dilate_disk(binary, radius),
+                                  ndi.binary_dilation(binary, disk(radius)) if radius else binary)
+    np.testing.assert_array_equal(fast_segmentation.close_open(binary, radius, 0), binary_closing(binary, disk(radius)))
+    np.testing.assert_array_equal(fast_segmentation.close_open(binary, 0, radius), binary_opening(binary, disk(radius)))
+
+
+@pytest.mark.parametrize('closing_radius, opening_radius', [(3, 2), (1, 4), (5, 1)])
+def test_close_open_matches_skimage(binary, closing_radius, opening_radius):
+    expected = binary_opening(binary_closing(binary, disk(closing_radius)), disk(opening_radius))
+    np.testing.assert_array_equal(fast_segmentation.close_open(binary, closing_radius, opening_radius), expected)
+
+
+@pytest.mark.parametrize('min_size', [0, 1, 2, 3, 10, 50, 200])
+def test_fill_and_filter_matches_standard_engine(binary, min_size):
+    filled = ndi.binary_fill_holes(binary)
+    labeled, _ = ndi.label(filled)
+    sizes = np.bincount(labeled.ravel())
+    expected = filled & (sizes >= min_size)[labeled]  # objects smaller than min_size are dropped
+    np.testing.assert_array_equal(clean_mask_global(binary, min_size, engine='standard'), expected)
+    np.testing.assert_array_equal(fast_segmentation.fill_and_filter(binary, min_size), expected)
+
+
+@pytest.mark.parametrize('q', [0, 10, 90, 100])
+def test_percentile_matches_numpy(dapi, q):
+    assert fast_segmentation.percentile(dapi, q) == np.percentile(dapi, q)
+
+
+@pytest.mark.parametrize('sigma', [1, 2, 3.5])
+def test_smooth_matches_skimage_gaussian(dapi, sigma):
+    image = dapi.astype(np.float64)
+    expected = gaussian((image - image.min()) / (image.max() - image.min()), sigma=sigma)
+    np.testing.assert_allclose(fast_segmentation.smooth(dapi, sigma), expected, atol=1e-6)
+
+
+def test_fast_mask_matches_standard(dapi):
+    standard = segment_nuclei(dapi, engine='standard')
+    fast = segment_nuclei(dapi, engine='fast')
+    assert standard.any()
+    np.testing.assert_array_equal(fast, standard)
@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+
+from jobs import JobManager, DONE, FAILED
+
+
+def crash():
+    time.sleep(0.2)
+    os._exit(1)
+
+
+def nap(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def wait_for(jobs, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while jobs.get(job_id)['status'] not in (DONE, FAILED):
+        assert time.time() < deadline, f"job {job_id} didn't finish"
+        time.sleep(0.05)
+    return jobs.get(job_id)
+
+
+def test_stale_failures_of_a_broken_pool_leave_the_new_pool_alone():
+    resubmitted = []
+    pools = []
+    submitted = threading.Event()
+
+    def resubmit(_):
+        # The first failure of the broken pool resubmits at once, so a new pool
+        # has queued jobs while the rest of the old pool's queue is still failing
+        if not submitted.is_set():
+            submitted.set()
+            resubmitted.extend(jobs.submit(nap, 0.05) for _ in range(8))
+            pools.append(jobs._executor)
+
+    # Jobs already handed to the dead pool's workers fail with BrokenProcessPool
+    jobs = JobManager(max_workers=2, on_finish=resubmit)
+    doomed = [jobs.submit(crash)] + [jobs.submit(nap, 1) for _ in range(2)]
+    for job_id in doomed:
+        assert wait_for(jobs, job_id)['status'] == FAILED
+    assert submitted.wait(30) and len(resubmitted) == 8
+    assert jobs._executor is pools[0]
+
+    for job_id in resubmitted:
+        job = wait_for(jobs, job_id)
+        assert job['status'] == DONE, job['error']
+    jobs.shutdown()
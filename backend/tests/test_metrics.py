@@ -0,0 +1,28 @@
+from metrics import PipelineMetrics, profiling, stage
+
+
+def run_stages(**kwargs):
+    with profiling(**kwargs) as profiler:
+        with stage('analysis'):
+            with stage('measurements'):
+                bytearray(8 * 1024 * 1024)
+    return profiler.to_dict()
+
+
+def test_peak_rss_is_only_tracked_when_asked():
+    tracked = run_stages(track_rss=True)
+    peaks = {s['stage']: s['peak_rss_bytes'] for s in tracked['stages']}
+    assert peaks['analysis'] >= peaks['measurements'] > 0
+
+    untracked = run_stages()
+    assert [s['stage'] for s in untracked['stages']] == ['measurements', 'analysis']
+    assert all('peak_rss_bytes' not in s for s in untracked['stages'])
+
+
+def test_stages_without_peak_rss_skip_the_rss_histogram():
+    metrics = PipelineMetrics()
+    metrics.record_profile(run_stages())
+    metrics.record_profile(run_stages(track_rss=True))
+    rendered = metrics.render()
+    assert 'cellphase_stage_peak_rss_bytes_count{stage="analysis"} 1\n' in rendered
+    assert 'cellphase_stage_wall_seconds_count{stage="analysis"} 2\n' in rendered
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from nd2reader import ND2Reader
+
+from nd2frames import MappedND2Reader, index_image_chunks, map_frames, plain_layout
+from synthetic import synthetic_stack, write_nd2
+
+CHANNELS = ('DAPI', 'PCNA', 'EdU')
+
+
+@pytest.fixture(scope='module')
+def frames():
+    stack = synthetic_stack(size=128, nuclei=12, radius=6, z_levels=4, channels=CHANNELS, seed=3)
+    return stack.frames[:, :, :96, :]  # not square, so swapped axes can't pass
+
+
+def save(tmp_path, frames, **kwargs):
+    return str(write_nd2(tmp_path / 'plate.nd2', frames, CHANNELS, **kwargs))
+
+
+def test_mapped_frames_match_nd2reader(tmp_path, frames):
+    path = save(tmp_path, frames)
+    with ND2Reader(path) as reader:
+        expected = {(z, c): reader.get_frame_2D(c=c, z=z)
+                    for z in range(frames.shape[0]) for c in range(len(CHANNELS))}
+    with map_frames(ND2Reader(path), path) as mapped:
+        assert isinstance(mapped, MappedND2Reader)
+        assert mapped.sizes['z'] == frames.shape[0] and mapped.sizes['c'] == len(CHANNELS)
+        for (z, c), decoded in expected.items():
+            frame = mapped.get_frame_2D(c=c, z=z)
+            np.testing.assert_array_equal(frame, decoded)
+            np.testing.assert_array_equal(frame, frames[z, c])
+        assert mapped._data is not None
+
+
+def test_plain_layout_reports_components(tmp_path, frames):
+    path = save(tmp_path, frames)
+    chunks = index_image_chunks(path)
+    with ND2Reader(path) as reader:
+        assert sorted(chunks) == list(range(frames.shape[0]))
+        assert plain_layout(chunks, reader.metadata, reader.sizes) == len(CHANNELS)
+        assert plain_layout(dict(list(chunks.items())[1:]), reader.metadata, reader.sizes) is None
+
+
+@pytest.mark.parametrize('layout', [{'compress': True}, {'row_padding': 1}])
+def test_unmappable_layouts_fall_back_to_nd2reader(tmp_path, frames, layout):
+    path = save(tmp_path, frames, **layout)
+    reader = ND2Reader(path)
+    try:
+        assert map_frames(reader, path) is reader
+    finally:
+        reader.close()
+
+
+def test_first_frame_mismatch_decodes_every_frame(tmp_path, frames):
+    path = save(tmp_path, frames)
+    with ND2Reader(path) as reader:
+        chunks = {group: (offset + 2, length) for group, (offset, length) in index_image_chunks(path).items()}
+        mapped = MappedND2Reader(reader, path, chunks, len(CHANNELS))
+        np.testing.assert_array_equal(mapped.get_frame_2D(c=1, z=2), frames[2, 1])
+        assert mapped._data is None
+        np.testing.assert_array_equal(mapped.get_frame_2D(c=0, z=0), frames[0, 0])
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from app import segment_nuclei, SEGMENTATION_ENGINES
+from synthetic import synthetic_stack
+from tiling import tiled_percentile
+
+TILE_SIZE = 97  # deliberately not a divisor of the image, so edge tiles are ragged
+
+
+@pytest.fixture(scope='module')
+def dapi():
+    stack = synthetic_stack(size=300, nuclei=80, radius=8, z_levels=3, seed=7)
+    return stack.frames[:, 0].max(axis=0)
+
+
+@pytest.mark.parametrize('engine', SEGMENTATION_ENGINES)
+def test_tiled_segmentation_matches_whole_image(dapi, engine):
+    whole = segment_nuclei(dapi, engine=engine)
+    tiled = segment_nuclei(dapi, tile_size=TILE_SIZE, engine=engine)
+    assert whole.any()
+    np.testing.assert_array_equal(tiled, whole)
+
+
+@pytest.mark.parametrize('q', [0, 2, 50, 90, 98, 100])
+def test_tiled_percentile_matches_numpy(dapi, q):
+    assert tiled_percentile(dapi, q, TILE_SIZE) == np.percentile(dapi, q)
+
+
+def test_tiled_percentile_of_float_image(dapi):
+    image = dapi.astype(np.float64) / 7
+    assert tiled_percentile(image, 90, TILE_SIZE) == np.percentile(image, 90)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from app import SEGMENTATION_DEFAULTS, build_channel_data, measure_nuclei, nuclear_background
+from projection import project_channels
+from synthetic import SyntheticND2Reader, synthetic_stack
+
+
+@pytest.fixture(scope='module')
+def stack():
+    return synthetic_stack(size=256, nuclei=40, radius=8, z_levels=4, seed=5)
+
+
+@pytest.fixture
+def images(stack, tmp_path):
+    with SyntheticND2Reader(stack.save(str(tmp_path / 'stack.npz'))) as reader:
+        yield reader
+
+
+def test_extra_sum_is_reduced_in_the_same_pass(stack, images):
+    *projections, dapi_sum = project_channels(images, len(stack.channels), stack.frames.shape[0], extra={0: 'sum'})
+    assert len(projections) == len(stack.channels)
+    for c, projected in enumerate(projections):
+        np.testing.assert_array_equal(projected, stack.frames[:, c].max(axis=0))
+    assert dapi_sum.dtype == np.float32
+    np.testing.assert_array_equal(dapi_sum, stack.frames[:, 0].sum(axis=0, dtype=np.float64))
+
+
+def test_dna_content_is_measured_on_the_sum_projection(stack, images):
+    n_channels, z_levels = len(stack.channels), stack.frames.shape[0]
+    *projections, dapi_sum = project_channels(images, n_channels, z_levels, extra={0: 'sum'})
+    channel_data = build_channel_data(stack.channels, projections, SEGMENTATION_DEFAULTS, dapi_sum=dapi_sum)
+    with_sum = measure_nuclei(channel_data)
+    on_max = measure_nuclei(build_channel_data(stack.channels, projections, SEGMENTATION_DEFAULTS))
+
+    assert len(with_sum) == len(on_max) > 0
+    # Segmentation still follows the display (max) projection; only DNA content changes
+    np.testing.assert_array_equal(with_sum['Area'], on_max['Area'])
+    np.testing.assert_array_equal(with_sum['DAPI_Integrated_Intensity'], on_max['DAPI_Integrated_Intensity'])
+    labeled = channel_data['DAPI']['labeled']
+    integrated = [dapi_sum[labeled == roi].sum() for roi in with_sum['ROI']]
+    expected = integrated - nuclear_background(dapi_sum, labeled) * with_sum['Area']
+    np.testing.assert_allclose(with_sum['DNA_Content'], expected)
+    assert not np.allclose(with_sum['DNA_Content'], on_max['DNA_Content'])
@@ -0,0 +1,135 @@
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+PERCENTILE_BINS = 4096
+GATHER_LIMIT = 4 * 1024 * 1024  # values gathered in memory once a histogram bin is this small
+
+
+# ✅ Tile Layout
+def tile_slices(shape, tile_size, halo):
+    """Yield (read, write, core) slice pairs covering a 2D image.
+
+    `read` is the tile grown by `halo` on every side (clipped to the image),
+    `write` is the tile's own region in the full image and `core` is where
+    that region sits inside the haloed tile.
+    """
+    height, width = shape
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            y1, x1 = min(y0 + tile_size, height), min(x0 + tile_size, width)
+            ry0, rx0 = max(y0 - halo, 0), max(x0 - halo, 0)
+            ry1, rx1 = min(y1 + halo, height), min(x1 + halo, width)
+            read = (slice(ry0, ry1), slice(rx0, rx1))
+            write = (slice(y0, y1), slice(x0, x1))
+            core = (slice(y0 - ry0, y1 - ry0), slice(x0 - rx0, x1 - rx0))
+            yield read, write, core
+
+
+# ✅ Tiled Execution
+def run_tiled(fn, src, out, tile_size, halo, workers=1):
+    """Apply a local operation tile by tile, writing each tile's core into `out`.
+
+    `fn` must only look `halo` pixels around each output pixel, in which case
+    the result is identical to fn(src) on the whole image. Tiles run on a
+    thread pool; the numpy/scipy kernels doing the work release the GIL, and
+    threads share `src`/`out` (often memory-mapped) without copying them.
+    """
+    def process(slices):
+        read, write, core = slices
+        out[write] = fn(np.asarray(src[read]))[core]
+
+    try:
+        layout = list(tile_slices(src.shape, tile_size, halo))
+        if workers <= 1:
+            for slices in layout:
+                process(slices)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(process, layout))
+        return out
+    except Exception as e:
+        logging.error(f"Tiled execution error: {str(e)}")
+        raise
+
+
+def iter_tiles(image, tile_size):
+    """Yield non-overlapping tiles of an image as in-memory arrays."""
+    for _, write, _ in tile_slices(image.shape, tile_size, 0):
+        yield np.asarray(image[write])
+
+
+# ✅ Bounded-Memory Percentile
+def _kth_smallest(image, k, lo, hi, tile_size):
+    """Exact k-th smallest value (0-based) by repeatedly histogramming a shrinking range.
+
+    The candidate range is [lo, hi) (or [lo, hi] while hi_inclusive) and only
+    once a single bin holds few enough values are they gathered and sorted.
+    """
+    hi_inclusive = True
+    while True:
+        if lo == hi:
+            return lo
+
+        edges = np.linspace(lo, hi, PERCENTILE_BINS + 1)
+        counts = np.zeros(PERCENTILE_BINS, dtype=np.int64)
+        below_range = 0
+        for tile in iter_tiles(image, tile_size):
+            values = tile.ravel()
+            below_range += np.count_nonzero(values < lo)
+            in_range = values[(values >= lo) & ((values <= hi) if hi_inclusive else (values < hi))]
+            bins = np.clip(np.searchsorted(edges, in_range, side='right') - 1, 0, PERCENTILE_BINS - 1)
+            counts += np.bincount(bins, minlength=PERCENTILE_BINS)
+
+        cumulative = below_range + np.cumsum(counts)
+        b = int(np.searchsorted(cumulative, k, side='right'))
+        bin_lo = edges[b]
+        bin_hi, bin_hi_inclusive = (hi, hi_inclusive) if b == PERCENTILE_BINS - 1 else (edges[b + 1], False)
+        rank_in_bin = k - (cumulative[b] - counts[b])
+
+        if counts[b] <= GATHER_LIMIT or bin_lo == bin_hi:
+            gathered = []
+            for tile in iter_tiles(image, tile_size):
+                values = tile.ravel()
+                upper = (values <= bin_hi) if bin_hi_inclusive else (values < bin_hi)
+                gathered.append(values[(values >= bin_lo) & upper])
+            gathered = np.concatenate(gathered)
+            return np.partition(gathered, rank_in_bin)[rank_in_bin]
+
+        if bin_lo == lo and bin_hi == hi:
+            # The range can't be split any further in float precision, so only a
+            # handful of distinct values remain: count them instead
+            value_counts = {}
+            for tile in iter_tiles(image, tile_size):
+                values = tile.ravel()
+                upper = (values <= hi) if hi_inclusive else (values < hi)
+                for value, count in zip(*np.unique(values[(values >= lo) & upper], return_counts=True)):
+                    value_counts[value] = value_counts.get(value, 0) + count
+            rank = k - below_range
+            for value in sorted(value_counts):
+                rank -= value_counts[value]
+                if rank < 0:
+                    return value
+
+        lo, hi, hi_inclusive = bin_lo, bin_hi, bin_hi_inclusive
+
+
+def tiled_percentile(image, q, tile_size):
+    """np.percentile(image, q) (linear interpolation) without loading the whole image.
+
+    Memory use is one tile plus a small histogram, which lets the global
+    segmentation threshold be taken from a memory-mapped smoothed image.
+    """
+    lo = min(tile.min() for tile in iter_tiles(image, tile_size))
+    hi = max(tile.max() for tile in iter_tiles(image, tile_size))
+    position = q / 100 * (image.size - 1)
+    k = int(np.floor(position))
+    low_value = _kth_smallest(image, k, lo, hi, tile_size)
+    if position == k:
+        return low_value
+    high_value = _kth_smallest(image, k + 1, lo, hi, tile_size)
+    # Same interpolation formula as numpy so thresholds match bit for bit
+    t = position - k
+    if t >= 0.5:
+        return high_value - (high_value - low_value) * (1 - t)
+    return low_value + (high_value - low_value) * t
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+CHUNK_READ_SIZE = 1024 * 1024  # 1MB reads while streaming request bodies
+
+
+class UploadError(Exception):
+    """Upload request that can't be honoured; carries the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=400, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+# ✅ Streaming Helpers
+def copy_stream(src, dst, hasher=None, limit=None):
+    """Copy src into dst in fixed-size reads, updating hasher as bytes arrive.
+
+    Stops with an UploadError as soon as more than `limit` bytes have been seen,
+    so an oversized body is rejected without being written out in full.
+    """
+    written = 0
+    while True:
+        block = src.read(CHUNK_READ_SIZE)
+        if not block:
+            break
+        written += len(block)
+        if limit is not None and written > limit:
+            raise UploadError("File too large", 413)
+        if hasher is not None:
+            hasher.update(block)
+        dst.write(block)
+    return written
+
+
+def hash_file(path, algorithm='sha256'):
+    """Hash a file on disk, used to rebuild hash state when resuming after a restart."""
+    hasher = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(CHUNK_READ_SIZE)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher
+
+
+# ✅ Chunked Upload Sessions
+class UploadManager:
+    """Track resumable chunked uploads that are written straight to their final path.
+
+    Session metadata is kept next to the uploads in a `.sessions` folder so a
+    client can resume by offset even after the server process restarts.
+    """
+
+    def __init__(self, upload_folder, max_file_size, allowed_extensions, session_ttl=86400):
+        self.upload_folder = upload_folder
+        self.session_folder = os.path.join(upload_folder, '.sessions')
+        self.max_file_size = max_file_size
+        self.allowed_extensions = allowed_extensions
+        self.session_ttl = session_ttl
+        self._hashers = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _session_path(self, upload_id):
+        return os.path.join(self.session_folder, f"{upload_id}.json")
+
+    def _save(self, session):
+        os.makedirs(self.session_folder, exist_ok=True)
+        tmp_path = self._session_path(session['upload_id']) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp_path, self._session_path(session['upload_id']))
+
+    def _load(self, upload_id):
+        # Ids are generated by us as hex; reject anything else before touching the disk
+        if not upload_id or not all(ch in '0123456789abcdef' for ch in upload_id):
+            raise UploadError("Unknown upload", 404)
+        try:
+            with open(self._session_path(upload_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError("Unknown upload", 404)
+
+    def _session_lock(self, upload_id):
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, filename, size, stored_name, metadata=None):
+        """Start an upload session for a file of `size` bytes saved as `stored_name`.
+
+        `metadata` is stored with the session and handed back once it completes.
+        """
+        if not filename or not any(filename.lower().endswith(ext) for ext in self.allowed_extensions):
+            raise UploadError("Invalid file type", 400)
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("File size must be a positive integer", 400)
+        if size > self.max_file_size:
+            raise UploadError("File too large", 413)
+
+        upload_id = uuid.uuid4().hex
+        file_path = os.path.join(self.upload_folder, stored_name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        open(file_path, 'wb').close()
+
+        session = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'file_path': file_path,
+            'size': size,
+            'offset': 0,
+            'sha256': None,
+            'complete': False,
+            'metadata': metadata or {},
+            'created_at': time.time(),
+            'updated_at': time.time(),
+        }
+        with self._lock:
+            self._prune()
+            self._hashers[upload_id] = hashlib.sha256()
+        self._save(session)
+        logging.info(f"Upload session {upload_id} started for {filename} ({size} bytes)")
+        return session
+
+    def status(self, upload_id):
+        """Return the stored session so a client can resume from `offset`."""
+        return self._load(upload_id)
+
+    def update_metadata(self, upload_id, **values):
+        """Merge values into a session's stored metadata and return the session."""
+        with self._session_lock(upload_id):
+            session = self._load(upload_id)
+            session['metadata'].update(values)
+            self._save(session)
+            return session
+
+    def claim(self, upload_id, owner):
+        """Mark a complete upload as taken by `owner` (e.g. a batch) and return the session.
+
+        Raises UploadError if the upload isn't complete or is already taken,
+        including by its own analysis job, so no file is analyzed twice.
+        """
+        with self._session_lock(upload_id):
+            session = self._load(upload_id)
+            if not session['complete']:
+                raise UploadError("Upload is not complete", 409)
+            if session['metadata'].get('job_id') or session['metadata'].get('owner'):
+                raise UploadError("Upload is already being analyzed", 409)
+            session['metadata']['owner'] = owner
+            self._save(session)
+            return session
+
+    def write_chunk(self, upload_id, offset, stream, length):
+        """Append a chunk at `offset`, hashing it on the way to disk.
+
+        The offset must match what has already been received; otherwise an
+        UploadError with status 409 carries the offset to resume from.
+        """
+        with self._session_lock(upload_id):
+            session = self._load(upload_id)
+            if session['complete']:
+                raise UploadError("Upload already complete", 409, session['offset'])
+            if offset != session['offset']:
+                raise UploadError("Offset mismatch", 409, session['offset'])
+            if length is not None and offset + length > session['size']:
+                raise UploadError("Chunk exceeds declared file size", 413, session['offset'])
+
+            hasher = self._hashers.get(upload_id)
+            if hasher is None:
+                # Server restarted mid-upload: rebuild the hash from what is on disk
+                with open(session['file_path'], 'r+b') as f:
+                    f.truncate(offset)
+                hasher = hash_file(session['file_path'])
+                self._hashers[upload_id] = hasher
+
+            # Hash a copy so a failed chunk can be retried without corrupting the digest
+            chunk_hasher = hasher.copy()
+            with open(session['file_path'], 'r+b') as f:
+                f.seek(offset)
+                try:
+                    written = copy_stream(stream, f, chunk_hasher, session['size'] - offset)
+                except Exception:
+                    f.truncate(offset)
+                    raise
+
+            self._hashers[upload_id] = chunk_hasher
+            session['offset'] = offset + written
+            session['updated_at'] = time.time()
+            if session['offset'] == session['size']:
+                session['complete'] = True
+                session['sha256'] = chunk_hasher.hexdigest()
+                self._hashers.pop(upload_id, None)
+                logging.info(f"Upload {upload_id} complete: {session['file_path']} sha256={session['sha256']}")
+            self._save(session)
+            return session
+
+    def incomplete_paths(self):
+        """Files of uploads still in progress, which storage eviction must leave alone."""
+        paths = []
+        if not os.path.isdir(self.session_folder):
+            return paths
+        for name in os.listdir(self.session_folder):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.session_folder, name)) as f:
+                    session = json.load(f)
+            except Exception:
+                continue
+            if not session['complete']:
+                paths.append(session['file_path'])
+        return paths
+
+    def _prune(self):
+        """Drop sessions (and their partial files) that have been idle past the TTL."""
+        if not os.path.isdir(self.session_folder):
+            return
+        cutoff = time.time() - self.session_ttl
+        for name in os.listdir(self.session_folder):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.session_folder, name)
+            try:
+                with open(path) as f:
+                    session = json.load(f)
+                if session['updated_at'] >= cutoff:
+                    continue
+                if not session['complete'] and os.path.exists(session['file_path']):
+                    os.remove(session['file_path'])
+                os.remove(path)
+                self._hashers.pop(session['upload_id'], None)
+                self._locks.pop(session['upload_id'], None)
+            except Exception as e:
+                logging.warning(f"Could not prune upload session {path}: {e}")
@@ -1,6 +1,16 @@
 import React, { useContext, useState } from 'react';
 import { Download, Image as ImageIcon, Table, AlertCircle, Loader } from 'lucide-react';
 import { AnalysisContext } from './UploadSection';
+import TileViewer from '../ui/TileViewer';
+
+const EXPORT_LINK_CLASS = 'flex items-center justify-center py-2 px-4 border border-gray-300 rounded-md shadow-sm text-sm font-medium text-gray-700 hover:bg-gray-50 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-red-500';
+
+// Binary result files, downloaded straight from their (range-capable) URLs
+const BINARY_EXPORTS = [
+    { key: 'measurements_parquet_url', label: 'Export Measurements (Parquet)', filename: 'cell_measurements.parquet', icon: Table },
+    { key: 'labels_url', label: 'Download Label Images (NPZ)', filename: 'nuclei_labels.npz', icon: Download },
+    { key: 'projections_url', label: 'Download Projections (NPZ)', filename: 'channel_projections.npz', icon: Download },
+];
 
 const AnalysisResults = () => {
     const { analysisResults, analysisStatus } = useContext(AnalysisContext);
@@ -94,6 +104,19 @@ const AnalysisResults = () => {
                                     </div>
                                 </>
                             )}
+                            {analysisResults.phase_counts && Object.entries(analysisResults.phase_counts).map(([phase, count]) => (
+                                <div key={phase}>
+                                    <p className="text-sm text-gray-500">{phase}</p>
+                                    <p className="text-2xl font-semibold text-gray-900">
+                                        {count}
+                                        {analysisResults.nuclei_count > 0 && (
+                                            <span className="ml-2 text-sm font-normal text-gray-500">
+                                                {(100 * count / analysisResults.nuclei_count).toFixed(0)}%
+                                            </span>
+                                        )}
+                                    </p>
+                                </div>
+                            ))}
                         </div>
                     </div>
 
@@ -126,17 +149,22 @@ const AnalysisResults = () => {
                     {/* Visualization */}
                     <div className="lg:col-span-2 bg-white p-6 rounded-lg shadow">
                         <h3 className="text-lg font-medium text-gray-900 mb-4">Visualization</h3>
-                        <div className="rounded-lg overflow-hidden">
-                            <img
-                                src={analysisResults.visualization_url}
-                                alt="Analysis visualization"
-                                className="w-full h-auto"
-                                onError={(e) => {
-                                    e.target.onerror = null;
-                                    e.target.src = 'placeholder.png';
-                                }}
-                            />
-                        </div>
+                        {analysisResults.overlay_url ? (
+                            // Outlined channel composite as a tile pyramid: scroll to zoom, drag to pan
+                            <TileViewer url={analysisResults.overlay_url} className="h-[32rem]" />
+                        ) : (
+                            <div className="rounded-lg overflow-hidden">
+                                <img
+                                    src={analysisResults.visualization_url}
+                                    alt="Analysis visualization"
+                                    className="w-full h-auto"
+                                    onError={(e) => {
+                                        e.target.onerror = null;
+                                        e.target.src = 'placeholder.png';
+                                    }}
+                                />
+                            </div>
+                        )}
                     </div>
 
                     {/* Export Options */}
@@ -157,6 +185,7 @@ const AnalysisResults = () => {
                                 <Table className="h-4 w-4 mr-2" />
                                 Export Measurements (CSV)
                             </button>
+                            {analysisResults.visualization_url && (
                             <a
                                 href={analysisResults.visualization_url}
                                 download="analysis_visualization.png"
@@ -165,6 +194,13 @@ const AnalysisResults = () => {
                                 <ImageIcon className="h-4 w-4 mr-2" />
                                 Download Visualization
                             </a>
+                            )}
+                            {BINARY_EXPORTS.filter(({ key }) => analysisResults[key]).map(({ key, label, filename, icon: Icon }) => (
+                                <a key={key} href={analysisResults[key]} download={filename} className={EXPORT_LINK_CLASS}>
+                                    <Icon className="h-4 w-4 mr-2" />
+                                    {label}
+                                </a>
+                            ))}
                         </div>
                     </div>
                 </div>
@@ -25,9 +25,125 @@ export const AnalysisProvider = ({ children }) => {
     );
 };
 
+const API_BASE_URL = 'http://localhost:5000';
+const POLL_INTERVAL_MS = 2000;
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const MAX_CHUNK_RETRIES = 5;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Poll a queued analysis job until it finishes, then fetch its result
+const waitForJob = async (job) => {
+    while (true) {
+        const statusResponse = await fetch(`${API_BASE_URL}${job.status_url}`);
+        const status = await statusResponse.json();
+        if (!statusResponse.ok) {
+            throw new Error(status.error || `Status check failed: ${statusResponse.statusText}`);
+        }
+
+        if (status.status === 'failed') {
+            throw new Error(status.error || 'Analysis failed');
+        }
+
+        if (status.status === 'done') {
+            const resultResponse = await fetch(`${API_BASE_URL}${job.result_url}`);
+            const result = await resultResponse.json();
+            if (!resultResponse.ok) {
+                throw new Error(result.error || `Fetching results failed: ${resultResponse.statusText}`);
+            }
+            return result;
+        }
+
+        await sleep(POLL_INTERVAL_MS);
+    }
+};
+
+// Remember in-progress uploads so a page reload can resume instead of restarting
+const uploadKey = (file) => `upload:${file.name}:${file.size}:${file.lastModified}`;
+
+const startOrResumeUpload = async (file) => {
+    const savedId = localStorage.getItem(uploadKey(file));
+    if (savedId) {
+        const response = await fetch(`${API_BASE_URL}/uploads/${savedId}`);
+        if (response.ok) {
+            const session = await response.json();
+            if (!session.complete) {
+                return { upload_url: `/uploads/${savedId}`, offset: session.offset };
+            }
+        }
+    }
+
+    const response = await fetch(`${API_BASE_URL}/uploads`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        // Ask for a quick low-resolution preview alongside the full analysis
+        body: JSON.stringify({ filename: file.name, size: file.size, preview: true }),
+    });
+    const session = await response.json();
+    if (!response.ok) {
+        throw new Error(session.error || `Upload failed: ${response.statusText}`);
+    }
+    localStorage.setItem(uploadKey(file), session.upload_id);
+    return session;
+};
+
+// Send the file in chunks, resuming from the server's offset after a dropped connection
+const uploadInChunks = async (file, onProgress) => {
+    const session = await startOrResumeUpload(file);
+    let offset = session.offset;
+    let retries = 0;
+
+    while (true) {
+        const chunk = file.slice(offset, offset + CHUNK_SIZE);
+        let response;
+        try {
+            response = await fetch(`${API_BASE_URL}${session.upload_url}`, {
+                method: 'PUT',
+                headers: {
+                    'Content-Type': 'application/octet-stream',
+                    'Upload-Offset': String(offset),
+                },
+                body: chunk,
+            });
+        } catch (networkError) {
+            if (++retries > MAX_CHUNK_RETRIES) throw networkError;
+            await sleep(POLL_INTERVAL_MS * retries);
+            const statusResponse = await fetch(`${API_BASE_URL}${session.upload_url}`);
+            offset = (await statusResponse.json()).offset;
+            continue;
+        }
+
+        const data = await response.json();
+        if (response.status === 503 && data.complete) {
+            // Server is at capacity: the file is stored, so ask again for its analysis after Retry-After
+            onProgress(1);
+            await sleep((Number(response.headers.get('Retry-After')) || data.retry_after || 30) * 1000);
+            offset = data.offset;
+            continue;
+        }
+        if (response.status === 409 && data.offset !== null && data.offset !== undefined && data.offset < file.size) {
+            offset = data.offset;
+            continue;
+        }
+        if (!response.ok) {
+            throw new Error(data.error || `Upload failed: ${response.statusText}`);
+        }
+
+        retries = 0;
+        offset = data.offset;
+        onProgress(offset / file.size);
+        if (data.complete) {
+            localStorage.removeItem(uploadKey(file));
+            return data;
+        }
+    }
+};
+
 const UploadSection = () => {
     const [selectedFile, setSelectedFile] = useState(null);
     const [error, setError] = useState(null);
+    const [uploadProgress, setUploadProgress] = useState(0);
+    const [preview, setPreview] = useState(null);
     const { setAnalysisResults, setAnalysisStatus } = useContext(AnalysisContext);
 
     const handleFileChange = (event) => {
@@ -53,39 +169,34 @@ const UploadSection = () => {
 
         setAnalysisStatus('uploading');
         setError(null);
-
-        const formData = new FormData();
-        formData.append('file', selectedFile);
+        setUploadProgress(0);
+        setPreview(null);
 
         try {
-            const response = await fetch('http://localhost:5000/upload', {
-                method: 'POST',
-                body: formData,
-            });
-
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.error || `Upload failed: ${response.statusText}`);
+            const job = await uploadInChunks(selectedFile, setUploadProgress);
+            if (job.preview && !job.preview.error) {
+                setPreview(job.preview);
             }
-
-            const data = await response.json();
+            // Cached analyses come back immediately instead of as a queued job
+            const data = job.status_url ? await waitForJob(job) : job;
 
             // Update URLs to include the base API URL
-            const results = {
-                ...data,
-                visualization_url: `http://localhost:5000${data.visualization_url}`,
-                measurements_url: `http://localhost:5000${data.measurements_url}`
-            };
+            const results = Object.fromEntries(Object.entries(data).map(([key, value]) => [
+                key,
+                key.endsWith('_url') && value ? `${API_BASE_URL}${value}` : value,
+            ]));
 
             setAnalysisResults(results);
             setAnalysisStatus('complete');
             setSelectedFile(null);
+            setPreview(null);
 
         } catch (error) {
             console.error('Error:', error);
             setError(error.message);
             setAnalysisStatus('error');
             setAnalysisResults(null);
+            setPreview(null);
         }
     };
 
@@ -142,6 +253,26 @@ const UploadSection = () => {
                                     <div className="mt-1 text-xs text-gray-500">
                                         Size: {(selectedFile.size / (1024 * 1024)).toFixed(2)} MB
                                     </div>
+                                    {uploadProgress > 0 && (
+                                        <div className="mt-2 h-2 bg-gray-200 rounded">
+                                            <div
+                                                className="h-2 bg-red-700 rounded"
+                                                style={{ width: `${(uploadProgress * 100).toFixed(0)}%` }}
+                                            />
+                                        </div>
+                                    )}
+                                    {preview && (
+                                        <div className="mt-3">
+                                            <img
+                                                src={`${API_BASE_URL}${preview.thumbnail_url}`}
+                                                alt="Preview of the nuclear channel"
+                                                className="w-full h-auto rounded"
+                                            />
+                                            <p className="mt-1 text-xs text-gray-500">
+                                                Preview: ~{preview.nuclei_count_estimate} nuclei. Full analysis in progress...
+                                            </p>
+                                        </div>
+                                    )}
                                 </div>
                             )}
 
@@ -0,0 +1,193 @@
+// src/components/ui/TileViewer.jsx
+import React, { useState, useEffect, useRef, useCallback } from 'react';
+import { ZoomIn, ZoomOut, Maximize } from 'lucide-react';
+
+const ZOOM_STEP = 1.5;
+
+// Read the Deep Zoom (.dzi) descriptor written next to the tile folders
+const loadDescriptor = async (url) => {
+    const response = await fetch(url);
+    if (!response.ok) throw new Error(`Loading ${url} failed: ${response.statusText}`);
+    const xml = new DOMParser().parseFromString(await response.text(), 'application/xml');
+    const image = xml.getElementsByTagName('Image')[0];
+    const size = xml.getElementsByTagName('Size')[0];
+    const width = Number(size.getAttribute('Width'));
+    const height = Number(size.getAttribute('Height'));
+    return {
+        width,
+        height,
+        tileSize: Number(image.getAttribute('TileSize')),
+        format: image.getAttribute('Format'),
+        maxLevel: Math.ceil(Math.log2(Math.max(width, height, 1))),
+        tilesUrl: url.replace(/\.dzi$/, '_files'),
+    };
+};
+
+// Pan/zoom viewer that only requests the pyramid tiles covering the visible area
+const TileViewer = ({ url, className = 'h-96' }) => {
+    const containerRef = useRef(null);
+    const dragRef = useRef(null);
+    const [pyramid, setPyramid] = useState(null);
+    const [error, setError] = useState(null);
+    const [viewport, setViewport] = useState({ width: 0, height: 0 });
+    // zoom is screen pixels per image pixel; x/y is the image point at the top-left corner
+    const [view, setView] = useState(null);
+
+    useEffect(() => {
+        let cancelled = false;
+        setPyramid(null);
+        setView(null);
+        loadDescriptor(url)
+            .then((descriptor) => !cancelled && setPyramid(descriptor))
+            .catch((err) => !cancelled && setError(err.message));
+        return () => { cancelled = true; };
+    }, [url]);
+
+    useEffect(() => {
+        const element = containerRef.current;
+        if (!element) return undefined;
+        const observer = new ResizeObserver(([entry]) => {
+            setViewport({ width: entry.contentRect.width, height: entry.contentRect.height });
+        });
+        observer.observe(element);
+        return () => observer.disconnect();
+    }, []);
+
+    const fitView = useCallback(() => {
+        if (!pyramid || !viewport.width) return;
+        const zoom = Math.min(viewport.width / pyramid.width, viewport.height / pyramid.height);
+        setView({
+            zoom,
+            x: (pyramid.width - viewport.width / zoom) / 2,
+            y: (pyramid.height - viewport.height / zoom) / 2,
+        });
+    }, [pyramid, viewport]);
+
+    useEffect(() => {
+        if (!view) fitView();
+    }, [view, fitView]);
+
+    // Zoom by `factor` keeping the image point under (screenX, screenY) fixed
+    const zoomAt = useCallback((factor, screenX, screenY) => {
+        setView((current) => {
+            if (!current) return current;
+            const zoom = Math.min(current.zoom * factor, 8);
+            return {
+                zoom,
+                x: current.x + screenX / current.zoom - screenX / zoom,
+                y: current.y + screenY / current.zoom - screenY / zoom,
+            };
+        });
+    }, []);
+
+    useEffect(() => {
+        const element = containerRef.current;
+        if (!element) return undefined;
+        // Registered by hand: React's onWheel is passive and can't stop the page from scrolling
+        const onWheel = (event) => {
+            event.preventDefault();
+            const rect = element.getBoundingClientRect();
+            zoomAt(event.deltaY < 0 ? ZOOM_STEP : 1 / ZOOM_STEP, event.clientX - rect.left, event.clientY - rect.top);
+        };
+        element.addEventListener('wheel', onWheel, { passive: false });
+        return () => element.removeEventListener('wheel', onWheel);
+    }, [zoomAt]);
+
+    const onPointerDown = (event) => {
+        dragRef.current = { x: event.clientX, y: event.clientY };
+        event.currentTarget.setPointerCapture(event.pointerId);
+    };
+
+    const onPointerMove = (event) => {
+        if (!dragRef.current) return;
+        const dx = event.clientX - dragRef.current.x;
+        const dy = event.clientY - dragRef.current.y;
+        dragRef.current = { x: event.clientX, y: event.clientY };
+        setView((current) => current && { ...current, x: current.x - dx / current.zoom, y: current.y - dy / current.zoom });
+    };
+
+    const onPointerUp = () => {
+        dragRef.current = null;
+    };
+
+    const visibleTiles = () => {
+        if (!pyramid || !view) return [];
+        const { width, height, tileSize, maxLevel, tilesUrl, format } = pyramid;
+        // Coarsest level that still has at least one tile pixel per screen pixel
+        const level = Math.max(0, Math.min(maxLevel, Math.ceil(maxLevel + Math.log2(view.zoom))));
+        const scale = 2 ** (maxLevel - level);
+        const levelWidth = Math.ceil(width / scale);
+        const levelHeight = Math.ceil(height / scale);
+        const span = tileSize * scale;
+
+        const firstCol = Math.max(0, Math.floor(view.x / span));
+        const lastCol = Math.min(Math.ceil(levelWidth / tileSize) - 1, Math.floor((view.x + viewport.width / view.zoom) / span));
+        const firstRow = Math.max(0, Math.floor(view.y / span));
+        const lastRow = Math.min(Math.ceil(levelHeight / tileSize) - 1, Math.floor((view.y + viewport.height / view.zoom) / span));
+
+        const tiles = [];
+        for (let row = firstRow; row <= lastRow; row++) {
+            for (let col = firstCol; col <= lastCol; col++) {
+                tiles.push({
+                    key: `${level}/${col}_${row}`,
+                    src: `${tilesUrl}/${level}/${col}_${row}.${format}`,
+                    left: (col * span - view.x) * view.zoom,
+                    top: (row * span - view.y) * view.zoom,
+                    width: Math.min(tileSize, levelWidth - col * tileSize) * scale * view.zoom,
+                    height: Math.min(tileSize, levelHeight - row * tileSize) * scale * view.zoom,
+                });
+            }
+        }
+        return tiles;
+    };
+
+    if (error) {
+        return <p className="text-sm text-red-600">{error}</p>;
+    }
+
+    return (
+        <div className="relative">
+            <div
+                ref={containerRef}
+                className={`relative overflow-hidden rounded-lg bg-black cursor-grab touch-none ${className}`}
+                onPointerDown={onPointerDown}
+                onPointerMove={onPointerMove}
+                onPointerUp={onPointerUp}
+                onPointerCancel={onPointerUp}
+            >
+                {visibleTiles().map((tile) => (
+                    <img
+                        key={tile.key}
+                        src={tile.src}
+                        alt=""
+                        draggable={false}
+                        className="absolute max-w-none select-none"
+                        style={{ left: tile.left, top: tile.top, width: tile.width, height: tile.height }}
+                    />
+                ))}
+            </div>
+            <div className="absolute top-2 right-2 flex space-x-1">
+                <button
+                    onClick={() => zoomAt(ZOOM_STEP, viewport.width / 2, viewport.height / 2)}
+                    className="bg-black bg-opacity-50 text-white p-1 rounded hover:bg-opacity-75"
+                >
+                    <ZoomIn size={18} />
+                </button>
+                <button
+                    onClick={() => zoomAt(1 / ZOOM_STEP, viewport.width / 2, viewport.height / 2)}
+                    className="bg-black bg-opacity-50 text-white p-1 rounded hover:bg-opacity-75"
+                >
+                    <ZoomOut size={18} />
+                </button>
+                <button
+                    onClick={fitView}
+                    className="bg-black bg-opacity-50 text-white p-1 rounded hover:bg-opacity-75"
+                >
+                    <Maximize size={18} />
+                </button>
+            </div>
+        </div>
+    );
+};
+
+export default TileViewer;